@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Small databases built from the test samples, for benchmarking without
+the bundled databases or the network.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import sqlite3
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from ebsel.EMSL_dump import EMSL_dump
+
+pople_elements = "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn".split()
+dzvp_elements = pople_elements + "Ga Ge As Se Br Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe".split()
+
+#short format -> (BSE format, [(sample, name, description, elements)])
+samples = {"g94" : ("Gaussian94",
+                    [("gaussian94-6-31Gs.html", "6-31G*", "Pople", pople_elements),
+                     ("gaussian94-dzvp.html", "DZVP (DFT Orbital)", "DZVP", dzvp_elements)]),
+           "gamess-us" : ("GAMESS-US",
+                          [("gamess-us-6-31Gs.html", "6-31G*", "Pople", pople_elements)]),
+           "nwchem" : ("NWChem",
+                       [("nwchem-6-31Gs.html", "6-31G*", "Pople", pople_elements)])}
+
+def build_fixture(db_path, fmt="g94", indexes=True, names=None):
+    """Make a database for a format holding its sample basis sets.
+
+    @param db_path: database to create
+    @type db_path : str
+    @param fmt: short format name, one of samples
+    @type fmt : str
+    @param indexes: whether to create the indexes; without them the
+    database is like those shipped before optimize_db existed
+    @type indexes : bool
+    @param names: basis sets to keep of the format's samples, or None for
+    all of them
+    @type names : list
+    """
+
+    bse_format, entries = samples[fmt]
+    if names is not None:
+        entries = [e for e in entries if e[1] in names]
+    ed = EMSL_dump(db_path, format=bse_format, debug=False, verbose=False)
+
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    ed.create_tables(c)
+    for sample, name, description, elements in entries:
+        with open(os.path.join(root, "tests", "samples", sample)) as infile:
+            data = infile.read()
+        ed.insert_basis(c, *ed.extract(data, name, description, elements))
+    conn.commit()
+    if indexes:
+        ed.finish_build(conn)
+    conn.close()
+
+def gbs_blocks(text):
+    """Split a Gaussian 94 basis set file into [symbol, block] pairs like
+    those EMSL_dump stores, leaving out comments."""
+
+    pairs = []
+    for section in text.split("****"):
+        lines = [L for L in section.strip().split("\n")
+                 if L.strip() and not L.startswith("!")]
+        if len(lines) > 1:
+            pairs.append([lines[0].split()[0], "\n".join(lines)])
+    return pairs
+
+def build_gbs_fixture(db_path, compression=None, dedup=False):
+    """Make a Gaussian 94 database out of the basis set files of db/g94,
+    through the same inserts and finish_build as a download. At about
+    13 MB of text it is closer to the real databases than the samples.
+
+    @param db_path: database to create
+    @type db_path : str
+    @param compression: compression mode of EMSL_dump, or None
+    @type compression : str
+    @param dedup: dedup mode of EMSL_dump
+    @type dedup : bool
+    @return: names of the basis sets stored
+    @rtype : list
+    """
+
+    ed = EMSL_dump(db_path, format="Gaussian94", debug=False, verbose=False,
+                   compression=compression, dedup=dedup)
+    gbs_dir = os.path.join(root, "db", "g94")
+
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    ed.create_tables(c)
+    names = []
+    for file_name in sorted(os.listdir(gbs_dir)):
+        if not file_name.endswith(".gbs"):
+            continue
+        with open(os.path.join(gbs_dir, file_name)) as infile:
+            pairs = gbs_blocks(infile.read())
+        name = file_name[:-len(".gbs")]
+        if pairs and ed.insert_basis(c, name, name, pairs):
+            names.append(name)
+    conn.commit()
+    ed.finish_build(conn)
+    conn.close()
+    return names
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Timings of the EMSL_local and Converter read paths.
+
+Usage:
+  read_paths.py [--runs=<n>] [--db_dir=<db_dir>] [--save=<json_path>]
+                [--baseline=<json_path>] [--tolerance=<fraction>]
+  read_paths.py --optimize [--runs=<n>] [--db_dir=<db_dir>]
+                [--page_size=<bytes>]
+  read_paths.py (-h | --help)
+
+Options:
+  -h --help                Show this screen.
+  --runs=<n>               Timed runs of each benchmark [default: 5]
+  --db_dir=<db_dir>        Directory of Gamess-us.db, NWChem.db and
+                           Gaussian94.db to read; by default small
+                           databases are built from the test samples
+  --save=<json_path>       Save the results, with machine info, as JSON
+  --baseline=<json_path>   Compare against results saved earlier
+  --tolerance=<fraction>   Slowdown over the baseline median reported as a
+                           regression [default: 0.2]
+  --optimize               Time copies of the databases before and after
+                           optimize_db; the sample databases are built
+                           without indexes, like older shipped databases
+  --page_size=<bytes>      Page size for --optimize [default: 4096]
+
+Each benchmark runs once untimed, then --runs times. With --baseline the
+exit status is 1 if any benchmark regressed.
+"""
+
+from __future__ import print_function, absolute_import
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, here)
+
+from fixtures import build_fixture, pople_elements
+from ebsel.EMSL_dump import optimize_db
+from ebsel.EMSL_local import EMSL_local
+from ebsel.conversion import Converter
+from ebsel.docopt import docopt
+from ebsel.formats import db_map
+
+clock = getattr(time, "perf_counter", time.time)
+
+#element counts for get_available_basis_sets
+element_counts = [0, 1, 5, 20]
+
+#(source format, basis set file name) for convert_from_format
+conversion_sources = [("g94", "6-31G*"), ("nwchem", "g3mp2large")]
+destination_formats = ["g94", "gamess-us", "nwchem"]
+
+def machine_info():
+    return {"platform" : platform.platform(),
+            "machine" : platform.machine(),
+            "processor" : platform.processor(),
+            "cpu_count" : os.cpu_count() if hasattr(os, "cpu_count") else None,
+            "python" : platform.python_version(),
+            "implementation" : platform.python_implementation(),
+            "sqlite" : sqlite3.sqlite_version}
+
+def timed(fn, runs):
+    fn()
+    times = []
+    for i in range(runs):
+        start = clock()
+        fn()
+        times.append(clock() - start)
+    times.sort()
+    return {"runs" : runs,
+            "min" : times[0],
+            "median" : times[len(times) // 2],
+            "mean" : sum(times) / len(times)}
+
+def benchmarks(db_paths):
+    """Get the benchmarks to run.
+
+    @param db_paths: database by short format name
+    @type db_paths : dict
+    @return: (name, function) pairs
+    @rtype : list
+    """
+
+    g94 = EMSL_local(db_paths["g94"], fmt="g94", debug=False)
+    c = Converter()
+    found = []
+
+    for n in element_counts:
+        elements = pople_elements[:n]
+        found.append(("get_available_basis_sets[{0}]".format(n),
+                      lambda elements=elements: g94.get_available_basis_sets(elements)))
+
+    found.append(("get_available_elements",
+                  lambda: g94.get_available_elements("6-31G*")))
+    found.append(("search",
+                  lambda: g94.search("double zeta", ["H", "C"])))
+
+    for fmt in sorted(db_paths):
+        el = EMSL_local(db_paths[fmt], fmt=fmt, debug=False)
+        found.append(("get_basis[sqlite,{0}]".format(fmt),
+                      lambda el=el: el.get_basis("6-31G*", ["H", "C", "N", "O"])))
+
+    found.append(("get_basis[g94 files]",
+                  lambda: g94.get_basis("6-31G*", ["H", "C", "N", "O"], bypass_db=True)))
+
+    for source, basis_name in conversion_sources:
+        for destination in destination_formats:
+            el = EMSL_local(db_paths[destination], fmt=destination, debug=False)
+            found.append(("convert_from_format[{0}->{1}]".format(source, destination),
+                          lambda el=el, source=source, basis_name=basis_name, destination=destination:
+                          el.convert_from_format(source, basis_name, destination,
+                                                 elements=["H", "C", "O"], bypass_db=True)))
+
+    #the largest UGBS files
+    gbs_dir = os.path.join(root, "db", "g94")
+    ugbs = [f for f in os.listdir(gbs_dir) if f.startswith("UGBS") and f.endswith(".gbs")]
+    ugbs.sort(key=lambda f: -os.path.getsize(os.path.join(gbs_dir, f)))
+    for name in ugbs[:3]:
+        with open(os.path.join(gbs_dir, name)) as infile:
+            text = infile.read()
+        found.append(("parse_multi_g94[{0}]".format(name),
+                      lambda text=text: c.parse_multi_g94(text)))
+
+    return found
+
+def run(runs=5, db_dir=None):
+    """Time every benchmark.
+
+    @param runs: timed runs of each benchmark
+    @type runs : int
+    @param db_dir: directory of the databases to read, or None to build
+    them from the test samples
+    @type db_dir : str
+    @return: {"machine", "time", "runs", "databases", "results"}
+    @rtype : dict
+    """
+
+    tmpdir = None
+    if db_dir is None:
+        tmpdir = tempfile.mkdtemp()
+        db_paths = {}
+        for fmt in db_map:
+            db_paths[fmt] = os.path.join(tmpdir, os.path.basename(db_map[fmt]))
+            build_fixture(db_paths[fmt], fmt)
+    else:
+        db_paths = dict((fmt, os.path.join(db_dir, os.path.basename(path)))
+                        for fmt, path in db_map.items())
+
+    try:
+        results = {}
+        for name, fn in benchmarks(db_paths):
+            results[name] = timed(fn, runs)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    return {"machine" : machine_info(),
+            "time" : time.time(),
+            "runs" : runs,
+            "databases" : "samples" if db_dir is None else os.path.abspath(db_dir),
+            "results" : results}
+
+def run_optimize(runs=5, db_dir=None, page_size=4096):
+    """Time copies of the databases, optimize them and time them again.
+
+    @param runs: timed runs of each benchmark
+    @type runs : int
+    @param db_dir: directory of the databases to copy, or None to build
+    them from the test samples without indexes
+    @type db_dir : str
+    @param page_size: page size for optimize_db
+    @type page_size : int
+    @return: (report before, report after, optimize_db results by format)
+    @rtype : tuple
+    """
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_paths = {}
+        for fmt in db_map:
+            db_paths[fmt] = os.path.join(tmpdir, os.path.basename(db_map[fmt]))
+            if db_dir is None:
+                build_fixture(db_paths[fmt], fmt, indexes=False)
+            else:
+                shutil.copy(os.path.join(db_dir, os.path.basename(db_map[fmt])),
+                            db_paths[fmt])
+
+        before = run(runs, tmpdir)
+        optimized = dict((fmt, optimize_db(db_paths[fmt], fmt, page_size))
+                         for fmt in db_paths)
+        after = run(runs, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return before, after, optimized
+
+def compare(report, baseline, tolerance=0.2):
+    """Compare median times against a baseline.
+
+    @return: (name, baseline median, median, ratio, regressed) for each
+    benchmark in both
+    @rtype : list
+    """
+
+    rows = []
+    for name in sorted(report["results"]):
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median"]
+        after = report["results"][name]["median"]
+        ratio = after / before if before else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + tolerance))
+    return rows
+
+def main(arguments):
+    if arguments["--optimize"]:
+        before, after, optimized = run_optimize(int(arguments["--runs"]),
+                                                arguments["--db_dir"],
+                                                int(arguments["--page_size"]))
+        for fmt in sorted(optimized):
+            result = optimized[fmt]
+            print("{0}: {1} -> {2} bytes, added {3}".format(
+                fmt, result["size_before"], result["size_after"],
+                ", ".join(result["added"]) or "nothing"))
+        for name, before_median, after_median, ratio, slower in compare(after, before):
+            print("{0:<42} {1:9.3f} ms -> {2:9.3f} ms  x{3:.2f}".format(
+                name, before_median * 1000, after_median * 1000, ratio))
+        return 0
+
+    report = run(int(arguments["--runs"]), arguments["--db_dir"])
+
+    if arguments["--save"]:
+        with open(arguments["--save"], "w") as outfile:
+            json.dump(report, outfile, indent=1, sort_keys=True)
+
+    if not arguments["--baseline"]:
+        for name in sorted(report["results"]):
+            result = report["results"][name]
+            print("{0:<42} {1:9.3f} ms  (min {2:.3f} ms)".format(
+                name, result["median"] * 1000, result["min"] * 1000))
+        return 0
+
+    with open(arguments["--baseline"]) as infile:
+        baseline = json.load(infile)
+    if baseline["machine"] != report["machine"]:
+        print("WARNING: the baseline was measured on another machine or Python")
+
+    regressed = False
+    for name, before, after, ratio, slower in compare(report, baseline,
+                                                       float(arguments["--tolerance"])):
+        print("{0:<42} {1:9.3f} ms -> {2:9.3f} ms  x{3:.2f}{4}".format(
+            name, before * 1000, after * 1000, ratio, "  REGRESSION" if slower else ""))
+        regressed = regressed or slower
+    return 1 if regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(docopt(__doc__)))
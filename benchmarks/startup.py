@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Startup time of the EMSL_api.py command line.
+
+Times `EMSL_api.py list_atoms` against a small database built from the
+test samples, next to a bare interpreter, and fails if the command costs
+more than target_overhead seconds on top of interpreter startup.
+
+Usage:
+  python benchmarks/startup.py [runs]
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, here)
+
+from fixtures import build_fixture
+
+#seconds list_atoms may take beyond starting the interpreter
+target_overhead = 0.05
+
+def best_time(command, runs, env):
+    """Run a command runs times, returning the fastest wall time."""
+
+    best = None
+    with open(os.devnull, "w") as devnull:
+        for i in range(runs):
+            start = time.time()
+            subprocess.check_call(command, stdout=devnull, env=env)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+def main(runs=20):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmpdir, "startup.db")
+        build_fixture(db_path)
+
+        env = dict(os.environ, PYTHONPATH=root)
+        script = os.path.join(root, "scripts", "EMSL_api.py")
+        commands = [("python", [sys.executable, "-c", "pass"]),
+                    ("import ebsel", [sys.executable, "-c", "import ebsel"]),
+                    ("list_atoms", [sys.executable, script, "list_atoms",
+                                    "--basis=6-31G*", "--format=g94",
+                                    "--db_path=" + db_path])]
+
+        times = {}
+        for label, command in commands:
+            times[label] = best_time(command, runs, env)
+            print("{0:<14} {1:8.1f} ms".format(label, times[label] * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    overhead = times["list_atoms"] - times["python"]
+    print("{0:<14} {1:8.1f} ms (target {2:.1f} ms)".format(
+        "overhead", overhead * 1000, target_overhead * 1000))
+    return 0 if overhead <= target_overhead else 1
+
+if __name__ == '__main__':
+    runs = 20
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    sys.exit(main(runs))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Size and read latency of each way of storing data_tab.data.
+
+Usage:
+  storage.py [--runs=<n>] [--db_dir=<db_dir>]
+  storage.py (-h | --help)
+
+Options:
+  -h --help          Show this screen.
+  --runs=<n>         Timed runs of each benchmark [default: 5]
+  --db_dir=<db_dir>  Directory of a Gaussian94.db to measure copies of, each
+                     converted by optimize_db; by default the database is
+                     built from the db/g94 basis set files in each mode
+
+Every mode (text, zlib and zlib-dict, each with and without dedup) gets its
+own database. Reads go through the page cache, warm after the untimed run,
+so the times show the cost of decompressing and of the block_tab lookups
+rather than the I/O saved by a smaller file.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+
+from fixtures import build_gbs_fixture
+from read_paths import timed
+from ebsel import compression
+from ebsel.EMSL_dump import dedup_report, optimize_db
+from ebsel.EMSL_local import EMSL_local
+from ebsel.docopt import docopt
+
+#(compression, dedup)
+modes = [(codec, dedup) for dedup in [False, True]
+         for codec in [None] + compression.modes]
+
+def mode_name(mode):
+    codec, dedup = mode
+    name = codec or "text"
+    if dedup:
+        name += "+dedup"
+    return name
+
+def build(db_path, mode, db_dir=None):
+    """Make the database of one mode.
+
+    @return: seconds taken
+    @rtype : float
+    """
+
+    codec, dedup = mode
+    start = time.time()
+    if db_dir is None:
+        build_gbs_fixture(db_path, codec, dedup)
+    else:
+        shutil.copy(os.path.join(db_dir, "Gaussian94.db"), db_path)
+        optimize_db(db_path, "g94", compression=codec, dedup=dedup)
+    return time.time() - start
+
+def data_bytes(db_path):
+    """Get the size of the stored blocks, each counted once."""
+
+    conn = sqlite3.connect(db_path)
+    size = "SELECT COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0) FROM {0}"
+    try:
+        return sum(conn.execute(size.format(table)).fetchone()[0]
+                   for table in ["data_tab", "block_tab"])
+    finally:
+        conn.close()
+
+def benchmarks(db_path):
+    """Get the lookups to time on one database.
+
+    @return: (name, function) pairs
+    @rtype : list
+    """
+
+    el = EMSL_local(db_path, fmt="g94", debug=False)
+    names = [name for name, description in el.get_available_basis_sets()]
+    conn = sqlite3.connect(db_path)
+    largest = conn.execute("""SELECT name FROM output_tab GROUP BY basis_id
+                              ORDER BY SUM(n_primitives) DESC LIMIT 1""").fetchone()[0]
+    conn.close()
+
+    def every_basis_set():
+        for name in names:
+            el.get_basis(name)
+
+    return [("get_basis[6-31G*]",
+             lambda: el.get_basis("6-31G*", ["H", "C", "N", "O"])),
+            ("get_basis[{0}]".format(largest), lambda: el.get_basis(largest)),
+            ("get_basis[all {0}]".format(len(names)), every_basis_set)]
+
+def run(runs=5, db_dir=None):
+    """Build and time the database of every mode.
+
+    @param runs: timed runs of each benchmark
+    @type runs : int
+    @param db_dir: directory of the Gaussian94.db to copy, or None to build
+    from the basis set files
+    @type db_dir : str
+    @return: {mode name : {"build_seconds", "file_bytes", "data_bytes",
+    "dedup", "results"}}; dedup is the dedup_report of the database
+    @rtype : dict
+    """
+
+    tmpdir = tempfile.mkdtemp()
+    report = {}
+    try:
+        for mode in modes:
+            db_path = os.path.join(tmpdir, mode_name(mode) + ".db")
+            seconds = build(db_path, mode, db_dir)
+            results = dict((name, timed(fn, runs))
+                           for name, fn in benchmarks(db_path))
+            report[mode_name(mode)] = {"build_seconds" : seconds,
+                                       "file_bytes" : os.path.getsize(db_path),
+                                       "data_bytes" : data_bytes(db_path),
+                                       "dedup" : dedup_report(db_path),
+                                       "results" : results}
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return report
+
+def main(arguments):
+    report = run(int(arguments["--runs"]), arguments["--db_dir"])
+
+    print("{0:<16} {1:>12} {2:>12} {3:>8}".format("mode", "file bytes", "data bytes", "build s"))
+    for mode in modes:
+        r = report[mode_name(mode)]
+        print("{0:<16} {1:12d} {2:12d} {3:8.2f}".format(
+            mode_name(mode), r["file_bytes"], r["data_bytes"], r["build_seconds"]))
+
+    dedup = report[mode_name(modes[0])]["dedup"]
+    print()
+    print("{0} of {1} blocks are distinct; storing each once saves {2} of {3} bytes ({4:.1%})".format(
+        dedup["unique_blocks"], dedup["blocks"], dedup["saved_bytes"],
+        dedup["bytes"], dedup["saved_fraction"]))
+
+    print()
+    names = sorted(report[mode_name(modes[0])]["results"])
+    for name in names:
+        medians = ["{0}={1:.3f} ms".format(mode_name(mode),
+                                           report[mode_name(mode)]["results"][name]["median"] * 1000)
+                   for mode in modes]
+        print("{0:<24} {1}".format(name, "  ".join(medians)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(docopt(__doc__)))
@@ -8,10 +8,80 @@ import re
 import sys
 import os
 import json
+import random
+import struct
+import threading
 import time
+from .EMSL_local import shell_stats
+from . import compression as codec
+from .formats import format_dict
+from .metrics import BuildMetrics
+from .names import normalize_name
 
 if sys.version_info.major == 3:
     raw_input = input
+    import queue
+    from urllib.parse import urlsplit
+else:
+    import Queue as queue
+    from urlparse import urlsplit
+
+#one quoted argument of a "new basisSet(...)" catalog line and the comma or
+#closing parenthesis after it
+basis_set_arg = re.compile(r"""\s*(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)')\s*([,)])""")
+escaped_char = re.compile(r"\\(.)")
+whitespace = re.compile(r"\s+")
+escapes = {"n" : "\n", "t" : "\t", "r" : "\r"}
+
+def parse_basis_set_args(line):
+    """Read the string arguments of a "new basisSet(...)" catalog line
+    without evaluating it.
+
+    @param line: catalog line
+    @type line : str
+    @return: arguments, unescaped
+    @rtype : list
+    @raise ValueError: if the arguments are not all string literals
+    """
+
+    marker = "new basisSet("
+    pos = line.find(marker) + len(marker)
+    args = []
+
+    while True:
+        m = basis_set_arg.match(line, pos)
+        if m is None:
+            raise ValueError("Cannot parse catalog line {0}".format(line))
+
+        value = m.group(1)
+        if value is None:
+            value = m.group(2)
+        if "\\" in value:
+            value = escaped_char.sub(lambda e: escapes.get(e.group(1), e.group(1)), value)
+        args.append(value)
+
+        if m.group(3) == ")":
+            return args
+        pos = m.end()
+
+def block_hash(text):
+    """Get the content address of a block of basis set data: the first 64
+    bits of its SHA-256, as a signed integer so that it can be the
+    INTEGER PRIMARY KEY of block_tab. Among the few hundred thousand
+    blocks of every format together, the odds of a collision are below
+    one in 10**8; should one happen anyway, EMSL_dump.store_block keeps
+    the second block inline.
+
+    @param text: basis set data for one element
+    @type text : str
+    @return: hash
+    @rtype : int
+    """
+
+    import hashlib
+
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return struct.unpack(">q", digest[:8])[0]
 
 def install_with_pip(name):
 
@@ -36,32 +106,160 @@ def install_with_pip(name):
             sys.exit(1)
 
 
+class DownloadError(Exception):
+    """A basis set could not be downloaded and extracted within the allowed
+    number of attempts.
+    """
+
+    def __init__(self, name, attempts, error):
+        self.name = name
+        self.attempts = attempts
+        self.error = error
+        msg = "{0} failed after {1} attempts: {2!r}".format(name, attempts,
+                                                            error)
+        Exception.__init__(self, msg)
+
+
+class RateLimiter(object):
+    """Space out calls to wait() so that they happen at most rate times per
+    second, across all threads sharing the limiter.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
 class EMSL_dump(object):
-    
-    format_dict = {"g94": "Gaussian94",
-                   "gamess-us": "GAMESS-US",
-                   "gamess-uk": "GAMESS-UK",
-                   "turbomole": "Turbomole",
-                   "tx93": "TX93",
-                   "molpro": "Molpro",
-                   "molproint": "MolproInt",
-                   "hondo": "Hondo",
-                   "supermolecule": "SuperMolecule",
-                   "molcas": "Molcas",
-                   "hyperchem": "HyperChem",
-                   "dalton": "Dalton",
-                   "demon-ks": "deMon-KS",
-                   "demon2k": "deMon2k",
-                   "aces2": "AcesII",
-                   "nwchem" : "NWChem"
-                   }
-                        
+
+    format_dict = format_dict
+
+    url_root = "https://bse.pnl.gov:443"
+    list_path = "/bse/portal/user/anon/js_peid/11535052407933/panel/Main/template/content"
+    download_path = "/bse/portal/user/anon/js_peid/11535052407933/action/portlets.BasisSetAction/template/courier_content/panel/Main//eventSubmit_doDownload/true"
+
+    #shared by every instance: element abbreviations read from
+    #elts_abrev.dat, and parsed catalogs by SHA-256 of the catalog page
+    dict_ele_cache = None
+    known_elements = None
+    catalog_cache = {}
+
     def __init__(self, db_path=None, format="GAMESS-US", contraction="True",
-                 debug=True):
+                 debug=True, num_workers=4, rate_limit=None, max_attempts=10,
+                 backoff=0.1, max_backoff=10.0, url_root=None,
+                 pipeline="threads", max_pending=None, resume=False,
+                 skip_failed=False, bulk_load=False, batch_size=50,
+                 archive=None, offline=False, parse_workers=0, update=False,
+                 verbose=True, metrics=None, compression=None, dedup=False):
+        """Set up a dump of Basis Set Exchange data in one format.
+
+        @param num_workers: number of concurrent download threads
+        @type num_workers : int
+        @param rate_limit: maximum requests per second to any one host, or
+        None for no limit
+        @type rate_limit : float
+        @param max_attempts: download/extraction attempts per basis set
+        @type max_attempts : int
+        @param backoff: delay in seconds after the first failed attempt,
+        doubling on each further failure
+        @type backoff : float
+        @param max_backoff: upper bound on the delay between attempts
+        @type max_backoff : float
+        @param url_root: scheme, host and port of the Basis Set Exchange
+        @type url_root : str
+        @param pipeline: "threads" to build with create_sql, or "asyncio"
+        to build with create_sql_async
+        @type pipeline : str
+        @param max_pending: for the asyncio pipeline, the maximum number of
+        basis sets downloaded or parsed but not yet written
+        @type max_pending : int
+        @param resume: continue a build in an existing database, skipping
+        basis sets recorded as finished in its checkpoint_tab
+        @type resume : bool
+        @param skip_failed: when resuming, also skip basis sets recorded in
+        failure_tab instead of trying them again
+        @type skip_failed : bool
+        @param bulk_load: build with a write-ahead log and relaxed syncing,
+        committing batch_size basis sets per transaction
+        @type bulk_load : bool
+        @param batch_size: basis sets per transaction for bulk loads and for
+        the asyncio pipeline's writer
+        @type batch_size : int
+        @param archive: response archive, or its directory, to read
+        downloads from and record them to
+        @type archive : ResponseArchive
+        @param offline: never use the network; requests missing from the
+        archive fail
+        @type offline : bool
+        @param parse_workers: number of processes that extract downloaded
+        data during a build; 0 extracts in the downloading thread
+        @type parse_workers : int
+        @param update: refresh an existing database, downloading only the
+        basis sets that are new or modified in the catalog
+        @type update : bool
+        @param verbose: print a line per request and per stored basis set
+        @type verbose : bool
+        @param metrics: counters, latencies and queue depths of builds,
+        shared by every thread; a fresh one with no report sink by default
+        @type metrics : BuildMetrics
+        @param compression: store basis set data compressed, "zlib" or
+        "zlib-dict" (see compression), or None for text
+        @type compression : str
+        @param dedup: store each distinct block of basis set data once, in
+        block_tab, with data_tab rows pointing to it by hash
+        @type dedup : bool
+        """
+
         self.db_path = db_path
         self.format = format
         self.contraction = str(contraction)
         self.debug = debug
+        self.num_workers = num_workers
+        self.rate_limit = rate_limit
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if url_root is not None:
+            self.url_root = url_root
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.resume = resume
+        self.skip_failed = skip_failed
+        self.bulk_load = bulk_load
+        self.batch_size = batch_size
+        self.build_report = None
+        if archive is not None:
+            from .archive import ResponseArchive
+            if not isinstance(archive, ResponseArchive):
+                archive = ResponseArchive(archive)
+        self.archive = archive
+        self.offline = offline
+        self.parse_workers = parse_workers
+        self.parse_pool = None
+        self.update = update
+        self.verbose = verbose
+        if metrics is None:
+            metrics = BuildMetrics()
+        self.metrics = metrics
+        self.rate_limiters = {}
+        self.rate_limiters_lock = threading.Lock()
+        if compression is not None and compression not in codec.modes:
+            raise ValueError("Unknown compression {0}, expected one of {1}".format(compression, codec.modes))
+        self.compression = compression
+        #preset dictionary for "zlib-dict", trained when a build finishes
+        self.dictionary = None
+        self.dedup = dedup
+
         try:
             import requests
         except:
@@ -70,23 +268,168 @@ class EMSL_dump(object):
         finally:
             self.requests = requests
 
+        self.session = self.make_session()
+
         self.extraction_map = {"GAMESS-US" : self.extract_basis_data_gamess_us,
                            "NWChem" : self.extract_basis_data_nwchem,
                            "Gaussian94" : self.extract_basis_data_gaussian94}
 
+    def make_session(self):
+        """Make a requests session whose keep-alive connection pool is large
+        enough for every worker thread to hold a connection.
+
+        @return: HTTP session
+        @rtype : requests.Session
+        """
+
+        session = self.requests.Session()
+        adapter = self.requests.adapters.HTTPAdapter(
+            pool_connections=self.num_workers, pool_maxsize=self.num_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def wait_for_host(self, url):
+        """Block until the per-host rate limit allows another request to
+        the host of url.
+
+        @param url: URL about to be requested
+        @type url : str
+        """
+
+        if not self.rate_limit:
+            return
+
+        host = urlsplit(url).netloc
+        with self.rate_limiters_lock:
+            try:
+                limiter = self.rate_limiters[host]
+            except KeyError:
+                limiter = RateLimiter(self.rate_limit)
+                self.rate_limiters[host] = limiter
+
+        limiter.wait()
+
+    def backoff_delay(self, attempt):
+        """Get the delay before retrying after a failed attempt: exponential
+        in the attempt number, capped at self.max_backoff, with random
+        jitter so that workers failing together do not retry together.
+
+        @param attempt: number of the failed attempt, counting from 0
+        @type attempt : int
+        @return: delay in seconds
+        @rtype : float
+        """
+
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(delay / 2.0, delay)
+
+    def fetch(self, url, params=None, replay=True, modified=None):
+        """GET a URL through the shared session, honoring the rate limit.
+        If there is an archive and replay is set, archived responses are
+        returned without touching the network; offline, they always are.
+
+        @param url: URL to fetch
+        @type url : str
+        @param params: query parameters
+        @type params : dict
+        @param replay: whether an archived response may be returned
+        @type replay : bool
+        @param modified: last modified date of the catalog entry the
+        request is for, if any, see archive_params
+        @type modified : str
+        @return: response body
+        @rtype : unicode
+        """
+
+        if self.archive is not None and (replay or self.offline):
+            text = self.archive.get(url, self.archive_params(params, modified))
+            if text is None and self.offline and modified is not None:
+                #archives filled before requests were keyed by date
+                text = self.archive.get(url, params)
+            if text is not None:
+                self.metrics.incr("archive_hits")
+                return text
+            if self.offline:
+                msg = "Offline and not in archive: {0} {1}".format(url, params)
+                raise IOError(msg)
+
+        self.wait_for_host(url)
+        start = time.time()
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        self.metrics.observe("fetch", time.time() - start)
+        self.metrics.incr("fetched")
+        self.metrics.incr("bytes_fetched", len(response.content))
+        return response.text
+
+    def archive_params(self, params, modified=None):
+        """Get the parameters a response is archived under: the query
+        parameters plus the last modified date of the catalog entry, so that
+        a basis set changed since it was archived is downloaded again.
+
+        @param params: query parameters
+        @type params : dict
+        @param modified: last modified date of the catalog entry, or None
+        @type modified : str
+        @return: archive parameters
+        @rtype : dict
+        """
+
+        if modified is None:
+            return params
+        archived = dict(params or {})
+        archived["modified"] = modified
+        return archived
+
+    def archive_response(self, url, params, text, modified=None):
+        """Keep a response in the archive, if there is one. Only responses
+        that were parsed successfully should be archived.
+
+        @param url: requested URL
+        @type url : str
+        @param params: query parameters
+        @type params : dict
+        @param text: response body
+        @type text : unicode
+        @param modified: last modified date of the catalog entry the
+        request is for, if any
+        @type modified : str
+        """
+
+        if self.archive is not None:
+            self.archive.put(url, self.archive_params(params, modified), text)
+
     def get_list_format(self):
         """List all the format available in EMSL"""
         return self.format_dict
 
+    def get_shell_stats_fn(self):
+        """Get the function that computes (max_am, n_shells, n_primitives)
+        for one element's block of basis data in self.format.
+
+        @return: shell statistics function
+        @rtype : function
+        """
+
+        for key, value in self.format_dict.items():
+            if value == self.format and key in shell_stats:
+                return shell_stats[key]
+
+        raise NotImplementedError("No shell statistics available for {0} data".format(self.format))
+
     def set_db_path(self, path):
         """Define the database path"""
         self.db_path = path
 
     def get_dict_ele(self):
-        """A dict of element"""
-        elt_path = os.path.dirname(__file__) + "/src/elts_abrev.dat"
+        """A dict of element, read once and shared by every instance"""
+        if EMSL_dump.dict_ele_cache is not None:
+            return EMSL_dump.dict_ele_cache
+
+        elt_path = os.path.join(os.path.dirname(__file__), "elts_abrev.dat")
         if not os.path.exists(elt_path):
-            elt_path = "src/elts_abrev.dat"
+            elt_path = "ebsel/elts_abrev.dat"
 
         with open(elt_path, "r") as f:
             data = f.readlines()
@@ -95,36 +438,109 @@ class EMSL_dump(object):
         for i in data:
             l = i.split("-")
             dict_ele[l[1].strip().lower()] = l[2].strip().lower()
+
+        EMSL_dump.known_elements = frozenset(dict_ele)
+        EMSL_dump.dict_ele_cache = dict_ele
         return dict_ele
 
     def dwl_basis_list_raw(self):
-        print("Download all the name available in EMSL. It can take some time.",)
-        sys.stdout.flush()
+        if self.verbose:
+            print("Download all the name available in EMSL. It can take some time.",)
+            sys.stdout.flush()
 
         """Download the source code of the iframe who contains the list of the basis set available"""
 
-        url = "https://bse.pnl.gov/bse/portal/user/anon/js_peid/11535052407933/panel/Main/template/content"
-        if self.debug:
-            import cPickle as pickle
+        url = self.url_root + self.list_path
+        if self.archive is not None:
+            #online the catalog is always fetched again, offline replayed
+            page = self.fetch(url, replay=False)
+            self.archive_response(url, None, page)
+
+        elif self.debug:
+            try:
+                import cPickle as pickle
+            except ImportError:
+                import pickle
             dbcache = 'db/cache'
             if not os.path.isfile(dbcache):
-                page = self.requests.get(url).text
-                file = open(dbcache, 'w')
-                pickle.dump(page, file)
+                page = self.fetch(url)
+                file = open(dbcache, 'wb')
+                pickle.dump(page, file, 0)
             else:
-                file = open(dbcache, 'r')
+                file = open(dbcache, 'rb')
                 page = pickle.load(file)
             file.close()
 
         else:
-            page = self.requests.get(url).text
+            page = self.fetch(url)
 
-        print("Done")
+        if self.verbose:
+            print("Done")
         return page
 
     def bl_raw_to_array(self, data_raw):
         """Parse the raw html to create a basis set array whith all the info:
-        url, name, description
+        url, name, description, keeping the basis sets that can be
+        downloaded in self.format
+
+        @param data_raw: catalog page
+        @type data_raw : unicode
+        @return: [name, xml path, description, elements] entries
+        @rtype : list
+        """
+
+        array_sort = self.select_basis(self.parse_catalog(data_raw))
+        if self.verbose:
+            print(len(array_sort), "basis sets will be downloaded")
+
+        return array_sort
+
+    def select_basis(self, catalog):
+        """Keep the catalog entries that can be downloaded in self.format.
+        Only NWChem has ECP-only basis sets.
+
+        @param catalog: [name, xml path, description, elements] entries as
+        produced by parse_catalog
+        @type catalog : list
+        @return: entries for self.format
+        @rtype : list
+        """
+
+        if self.format == "NWChem":
+            return list(catalog)
+        return [entry for entry in catalog if "-ecp" not in entry[1].lower()]
+
+    def parse_catalog(self, data_raw):
+        """Parse the raw html of the catalog page into an array of every
+        published basis set, whatever the format, sorted by name.
+
+        Parsed catalogs are kept by the SHA-256 of the page, in memory and,
+        if there is one, in the archive, so the same page is parsed once.
+
+        @param data_raw: catalog page
+        @type data_raw : unicode
+        @return: [name, xml path, description, elements, last modified,
+        contributor] entries
+        @rtype : list
+        """
+
+        import hashlib
+
+        #the suffix tells apart catalogs cached with other entry layouts
+        digest = hashlib.sha256(data_raw.encode("utf-8")).hexdigest() + "-2"
+        catalog = self.catalog_cache.get(digest)
+        if catalog is None and self.archive is not None:
+            catalog = self.archive.load_parsed(digest)
+        if catalog is None:
+            catalog = self.parse_catalog_page(data_raw)
+            if self.archive is not None:
+                self.archive.save_parsed(digest, catalog)
+        self.catalog_cache[digest] = catalog
+
+        return [list(entry) for entry in catalog]
+
+    def parse_catalog_page(self, data_raw):
+        """Parse every "new basisSet(...)" line of the catalog page.
 
         Explanation of tuple data from 'tup' by index:
 
@@ -143,19 +559,15 @@ class EMSL_dump(object):
         10 - human-readable summary/description of basis set
         """
 
-        known_elements = self.get_dict_ele().keys()
+        self.get_dict_ele()
+        known_elements = self.known_elements
 
         d = {}
         names = {}
 
         for line in data_raw.split('\n'):
             if "new basisSet(" in line:
-                b = line.find("(")
-                e = line.find(");")
-
-                s = line[b + 1:e]
-
-                tup = eval(s)
+                tup = parse_basis_set_args(line)
 
                 #non-published (e.g. rejected) basis sets should be ignored
                 if tup[4] != "published":
@@ -172,23 +584,18 @@ class EMSL_dump(object):
                 else:
                     names[name] = [name]
 
-                raw_elts = re.sub('[["\ \]]', '', tup[3]).split(',')
+                raw_elts = tup[3].replace(" ", "").replace('"', "").strip("[]").split(',')
                 #filter out weird elements from exotic basis sets, e.g. Uuu
                 elts = [e for e in raw_elts if e.lower() in known_elements]
 
-                des = re.sub('\s+', ' ', tup[-1])
+                des = whitespace.sub(' ', tup[-1])
 
-                if "-ecp" in xml_path.lower() and self.format != "NWChem":
-                    continue
-                d[name] = [name, xml_path, des, elts]
+                d[name] = [name, xml_path, des, elts, tup[7], tup[9]]
 
         """Tric for the unicity of the name"""
         array = [d[key] for key in d]
 
-        array_sort = sorted(array, key=lambda x: x[0])
-        print(len(array_sort), "basis sets will be downloaded")
-
-        return array_sort
+        return sorted(array, key=lambda x: x[0])
 
     def extract_basis_data_gaussian94(self, data, name, description, elements):
         """Extract the Gaussian94 basis data raw html to get a nice tuple.
@@ -264,100 +671,116 @@ class EMSL_dump(object):
 
         return (name, description, pairs)
 
-    def extract_basis_nwchem(self, data, name):
-        """Extract atomic orbital, charge density fitting, or exchange
-        correlation functional basis data from a text region passed in as
-        data. The charge density fitting and exchange correlation functional
-        basis set data are employed for density functional calculations.
+    def scan_nwchem_sections(self, data):
+        """Find the basis set sections of a NWChem download in one pass over
+        its lines. A section runs from a 'BASIS "<type>" PRINT' or 'ECP'
+        line to the next 'END' line; only the first section of each type
+        is kept.
 
-        @param data: text region containing basis set data
-        @type data : str
-        @param name: name of basis type: "ao basis", "cd basis", or "xc basis"
-        @type name : str
-        @return: per-element basis set chunks
-        @rtype : list
+        @param data: raw HTML from BSE
+        @type data : unicode
+        @return: section text by type: "ao basis", "cd basis", "xc basis"
+        or "ecp"
+        @rtype : dict
         """
 
-        begin_marker = """BASIS "{0}" PRINT""".format(name)
-        end_marker = "END"
+        sections = {}
+        current = None
+        lines = []
 
-        #search for the basis set data begin marker
-        #calling "upper" on data because original data has inconsistent
-        #capitalization
-        begin = data.upper().find(begin_marker.upper())
-        end = data.upper().find(end_marker, begin)
+        for line in data.split("\n"):
+            key = line.strip().upper()
+            if current is not None:
+                if key == "END":
+                    if current not in sections:
+                        sections[current] = "\n".join(lines).strip()
+                    current = None
+                else:
+                    lines.append(line)
+            elif key == "ECP":
+                current = "ecp"
+                lines = []
+            elif key.startswith('BASIS "') and key.endswith('" PRINT'):
+                current = key[7:-7].lower()
+                lines = []
+
+        return sections
+
+    def group_lines(self, region, starts_chunk):
+        """Split a text region into chunks of lines, starting a new chunk at
+        each line for which starts_chunk is true.
+
+        @param region: text region
+        @type region : str
+        @param starts_chunk: test for the first line of a chunk
+        @type starts_chunk : function
+        @return: chunks as solid text blocks
+        @rtype : list
+        """
 
-        #No basis data found
-        if begin == -1:
-            if self.debug and False:
-                print(data)
+        if not region:
             return []
 
-        trimmed = data[begin+len(begin_marker) : end].strip()
-
         chunks = []
         lines = []
 
-        #group lines of data delimited by #BASIS SET... into per-element chunks
-        for line in trimmed.split("\n"):
-            if line.upper().startswith("#BASIS SET"):
+        for line in region.split("\n"):
+            if starts_chunk(line):
                 if lines:
                     chunks.append(lines)
                 lines = [line]
             else:
                 lines.append(line)
 
-        #handle trailing chunk that is not followed by another #BASIS SET...
+        #handle trailing chunk that is not followed by another start line
         if lines and (not chunks or lines != chunks[-1]):
             chunks.append(lines)
 
         #join lines back into solid text blocks
-        chunks = ["\n".join(c) for c in chunks]
-        return chunks
+        return ["\n".join(c) for c in chunks]
+
+    def extract_basis_nwchem(self, data, name, sections=None):
+        """Extract atomic orbital, charge density fitting, or exchange
+        correlation functional basis data from a text region passed in as
+        data. The charge density fitting and exchange correlation functional
+        basis set data are employed for density functional calculations.
+
+        @param data: text region containing basis set data
+        @type data : str
+        @param name: name of basis type: "ao basis", "cd basis", or "xc basis"
+        @type name : str
+        @param sections: sections already found by scan_nwchem_sections
+        @type sections : dict
+        @return: per-element basis set chunks
+        @rtype : list
+        """
+
+        if sections is None:
+            sections = self.scan_nwchem_sections(data)
+
+        #group lines of data delimited by #BASIS SET... into per-element chunks
+        return self.group_lines(sections.get(name),
+                                lambda line: line.upper().startswith("#BASIS SET"))
 
-    def extract_ecp_nwchem(self, data):
+    def extract_ecp_nwchem(self, data, sections=None):
         """Extract the effective core potential basis data from a text region
         passed in as data.
 
         @param data: text region containing ECP data
         @type data : str
+        @param sections: sections already found by scan_nwchem_sections
+        @type sections : dict
         @return: per-element effective core potential chunks
         @rtype : list
         """
 
-        ecp_begin_mark = "ECP\n"
-        ecp_end_mark = "END"
-        ecp_begin = data.upper().find(ecp_begin_mark)
-        ecp_end = data.upper().find(ecp_end_mark, ecp_begin)
-        ecp_region = ""
-        
-        if ecp_begin > -1 and ecp_end > -1:
-            ecp_region = data[ecp_begin + len(ecp_begin_mark) : ecp_end].strip()
-
-        #No ECP data, so return empty list
-        else:
-            return []
-
-        chunks = []
-        lines = []
+        if sections is None:
+            sections = self.scan_nwchem_sections(data)
 
         #group lines of data delimited by XX nelec YY into chunks, e.g.
         #"Zn nelec 18" begins a zinc ECP
-        for line in ecp_region.split("\n"):
-            if line.lower().find(" nelec ") > -1:
-                if lines:
-                    chunks.append(lines)
-                lines = [line]
-            else:
-                lines.append(line)
-
-        #handle trailing chunk that is not followed by another XX nelec YY..
-        if lines and (not chunks or lines != chunks[-1]):
-            chunks.append(lines)
-
-        #join lines back into solid text blocks
-        chunks = ["\n".join(c) for c in chunks]
-        return chunks
+        return self.group_lines(sections.get("ecp"),
+                                lambda line: line.lower().find(" nelec ") > -1)
 
     def unpack_nwchem_basis_block(self, data):
         """Unserialize a NWChem basis data block and extract components
@@ -404,10 +827,11 @@ class EMSL_dump(object):
                     
             raise ValueError("Can't find element symbol in {0}".format(txt))
 
-        ao_chunks = self.extract_basis_nwchem(data, "ao basis")
-        cd_chunks = self.extract_basis_nwchem(data, "cd basis")
-        xc_chunks = self.extract_basis_nwchem(data, "xc basis")
-        ecp_chunks = self.extract_ecp_nwchem(data)
+        sections = self.scan_nwchem_sections(data)
+        ao_chunks = self.extract_basis_nwchem(data, "ao basis", sections)
+        cd_chunks = self.extract_basis_nwchem(data, "cd basis", sections)
+        xc_chunks = self.extract_basis_nwchem(data, "xc basis", sections)
+        ecp_chunks = self.extract_ecp_nwchem(data, sections)
 
         if not any([ao_chunks, cd_chunks, xc_chunks, ecp_chunks]):
             raise ValueError("No basis set data found while attempting to process {0} ({1})".format(name, description))
@@ -446,8 +870,7 @@ class EMSL_dump(object):
 
                 packed[symbol] = (idx, chunk_dict)
 
-        values = packed.values()
-        values.sort()
+        values = sorted(packed.values(), key=lambda v: v[0])
 
         #Assign (Symbol, Serialized) to final pairs
         pairs = []
@@ -465,13 +888,16 @@ class EMSL_dump(object):
 
         d = []
 
+        #find the $DATA ... $END region once, and only clean up that region
         b = data.find("$DATA")
-        e = data.find("$END")
-        if (b == -1 or data.find("$DATA$END") != -1):
+        e = data.find("$END", b)
+        if (b == -1 or e == -1 or not data[b + 5:e].strip()):
             if self.debug:
                 print(data)
             raise Exception("WARNING not DATA")
         else:
+            region = data[b + 5:e - 1]
+
             #ELEM replacements are required by buggy CRENBL ECP basis set
             replacements = [("PHOSPHOROUS", "PHOSPHORUS"),
                             ("D+", "E+"),
@@ -481,9 +907,10 @@ class EMSL_dump(object):
                             ("ELEMENT117", "Ununseptium".upper())]
 
             for old, new in replacements:
-                data = data.replace(old, new)
+                if old in region:
+                    region = region.replace(old, new)
 
-            split_data = data[b + 5:e - 1].split('\n\n')
+            split_data = region.split('\n\n')
 
             dict_ele = self.get_dict_ele()
 
@@ -508,84 +935,790 @@ class EMSL_dump(object):
 
         return [name, des, d]
 
-    def create_sql(self, list_basis_array):
-        """Create the sql from the list of basis available data"""
+    def get_extraction_method(self):
+        """Get the method that extracts per-element data from a raw BSE
+        download in self.format.
 
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        @return: extraction method
+        @rtype : function
+        """
+
+        extraction_method = self.extraction_map.get(self.format)
+        if extraction_method is None:
+            raise NotImplementedError("No parser currently available for {0} data".format(self.format))
+        return extraction_method
+
+    def download_request(self, name, path_xml, elts):
+        """Get the URL and query parameters that download one basis set.
+
+        @param name: basis set name
+        @type name : str
+        @param path_xml: path to the basis set's xml file on the BSE
+        @type path_xml : str
+        @param elts: element symbols e.g. ['H', 'C', 'N', 'O', 'Cl']
+        @type elts : list
+        @return: (url, params)
+        @rtype : tuple
+        """
+
+        url = self.url_root + self.download_path
+        params = {'bsurl': path_xml, 'bsname': name,
+                  'elts': " ".join(elts),
+                  'format': self.format,
+                  'minimize': self.contraction}
+        return (url, params)
+
+    def start_parse_pool(self):
+        """Start the extraction processes if parse_workers asks for some and
+        they are not running yet.
+
+        @return: whether a pool was started, which the caller should stop
+        with stop_parse_pool
+        @rtype : bool
+        """
+
+        if not self.parse_workers or self.parse_pool is not None:
+            return False
+
+        from concurrent.futures import ProcessPoolExecutor
+        self.parse_pool = ProcessPoolExecutor(self.parse_workers)
+        return True
+
+    def stop_parse_pool(self):
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+            self.parse_pool = None
+
+    def extract(self, data, name, des, elts):
+        """Extract per-element data from a raw BSE download, in the
+        extraction processes if they are running, or else in this thread.
+
+        @param data: raw HTML from BSE
+        @type data : unicode
+        @param name: basis set name
+        @type name : str
+        @param des: basis set description
+        @type des : str
+        @param elts: element symbols e.g. ['H', 'C', 'N', 'O', 'Cl']
+        @type elts : list
+        @return: (name, description, data-pairs)
+        @rtype : tuple
+        """
+
+        start = time.time()
+        if self.parse_pool is None:
+            basis_data = self.get_extraction_method()(data, name, des, elts)
+        else:
+            future = self.parse_pool.submit(extract_basis_data, self.format,
+                                            self.debug, data, name, des, elts)
+            basis_data = future.result()
+
+        self.metrics.observe("parse", time.time() - start)
+        self.metrics.incr("parsed")
+        return basis_data
+
+    def download_basis(self, name, path_xml, des, elts, modified=None):
+        """Download one basis set and extract its per-element data. Failed
+        downloads and extractions are retried up to self.max_attempts times,
+        backing off exponentially between attempts.
+
+        @param name: basis set name
+        @type name : str
+        @param path_xml: path to the basis set's xml file on the BSE
+        @type path_xml : str
+        @param des: basis set description
+        @type des : str
+        @param elts: element symbols e.g. ['H', 'C', 'N', 'O', 'Cl']
+        @type elts : list
+        @param modified: last modified date from the catalog, which keys
+        the download in the archive
+        @type modified : str
+        @return: (name, description, data-pairs)
+        @rtype : tuple
+        @raise DownloadError: if every attempt failed
+        """
+
+        self.get_extraction_method()
+        url, params = self.download_request(name, path_xml, elts)
 
-        c.execute('''CREATE TABLE basis_tab(
+        for attempt in range(self.max_attempts):
+            if self.verbose:
+                m = "URL: {0} params {1} attempt {2}".format(url, params, attempt)
+                print(m)
+
+            try:
+                text = self.fetch(url, params=params, modified=modified)
+                basis_data = self.extract(text, name, des, elts)
+                self.archive_response(url, params, text, modified)
+                return basis_data
+            except Exception as e:
+                error = e
+                if attempt + 1 < self.max_attempts:
+                    self.metrics.incr("retried")
+                    time.sleep(self.backoff_delay(attempt))
+
+        raise DownloadError(name, self.max_attempts, error)
+
+    def create_tables(self, c):
+        """Create the basis set tables and the output_tab view, plus the
+        checkpoint_tab and failure_tab tables that let an interrupted build
+        resume. When resuming or updating, tables that already exist are
+        kept.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        """
+
+        if self.resume or self.update:
+            create = "CREATE {0} IF NOT EXISTS"
+        else:
+            create = "CREATE {0}"
+        table = create.format("TABLE")
+        view = create.format("VIEW")
+
+        c.execute(table + ''' basis_tab(
                             basis_id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 name text,
                          description text,
+                            xml_path text,
+                            modified text,
+                         contributor text,
+                           norm_name text COLLATE NOCASE,
                                 UNIQUE(name)
                   );''')
 
-        c.execute('''CREATE TABLE data_tab(
+        c.execute(table + ''' data_tab(
                            basis_id INTEGER,
                                 elt TEXT,
                                data TEXT,
+                             max_am INTEGER,
+                           n_shells INTEGER,
+                       n_primitives INTEGER,
+                         block_hash INTEGER,
                     FOREIGN KEY(basis_id)
                     REFERENCES basis_tab(basis_id)
                     );''')
 
-        c.execute(''' CREATE VIEW output_tab AS
+        self.create_block_tab(c, table)
+        self.create_output_tab(c, view)
+
+        c.execute(table + ''' checkpoint_tab(
+                               name TEXT PRIMARY KEY,
+                           finished TEXT
+                    );''')
+
+        c.execute(table + ''' failure_tab(
+                               name TEXT PRIMARY KEY,
+                           xml_path TEXT,
+                           attempts INTEGER,
+                              error TEXT,
+                             failed TEXT
+                    );''')
+
+        if self.resume or self.update:
+            self.upgrade_tables(c)
+            self.load_dictionary(c)
+
+    def load_dictionary(self, c):
+        """In zlib-dict mode, pick up the preset dictionary of an existing
+        database so that further blocks are compressed with it.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        """
+
+        if self.compression == "zlib-dict" and self.dictionary is None:
+            for dictionary in codec.read_dictionaries(c).values():
+                self.dictionary = dictionary
+
+    def encode_block(self, text):
+        """Get the data_tab.data value storing a block of basis set data.
+        In zlib-dict mode blocks stay text until there is a dictionary.
+
+        @param text: basis set data for one element
+        @type text : str
+        @return: text, or compressed data as a BLOB
+        @rtype : str or sqlite3.Binary
+        """
+
+        if self.compression == "zlib":
+            return sqlite3.Binary(codec.compress_block(text))
+        if self.compression == "zlib-dict" and self.dictionary is not None:
+            return sqlite3.Binary(codec.compress_block(text, self.dictionary))
+        return text
+
+    def compress_data(self, c):
+        """Compress the data_tab and block_tab values still stored as text.
+        In zlib-dict mode a database without a dictionary first gets one,
+        trained on all of those blocks.
+
+        @param c: cursor on the database
+        @type c : sqlite3.Cursor
+        @return: number of values compressed
+        @rtype : int
+        """
+
+        if self.compression is None:
+            return 0
+
+        rows = {}
+        for table in ["data_tab", "block_tab"]:
+            c.execute("SELECT rowid, data FROM {0} WHERE typeof(data)='text'".format(table))
+            rows[table] = c.fetchall()
+        self.load_dictionary(c)
+        blocks = [data for table in rows for rowid, data in rows[table]]
+        if self.compression == "zlib-dict" and self.dictionary is None and blocks:
+            self.dictionary = codec.train_dictionary(blocks)
+            codec.store_dictionary(c, self.dictionary)
+
+        for table in rows:
+            c.executemany("UPDATE {0} SET data=? WHERE rowid=?".format(table),
+                          [[self.encode_block(data), rowid] for rowid, data in rows[table]])
+        return len(blocks)
+
+    def dedup_data(self, c):
+        """Move the blocks stored in data_tab rows to block_tab, keeping one
+        copy of each. Blocks keep their encoding, compressed or not.
+
+        @param c: cursor on the database
+        @type c : sqlite3.Cursor
+        @return: number of data_tab rows changed
+        @rtype : int
+        """
+
+        dictionaries = codec.read_dictionaries(c)
+        c.execute("SELECT rowid, data FROM data_tab WHERE data IS NOT NULL")
+        rows = c.fetchall()
+        refs = []
+        for rowid, data in rows:
+            text = codec.decompress_block(data, dictionaries)
+            key = self.store_block(c, text, data, dictionaries)
+            if key is not None:
+                refs.append([key, rowid])
+
+        c.executemany("UPDATE data_tab SET data=NULL, block_hash=? WHERE rowid=?", refs)
+        return len(refs)
+
+    def store_block(self, c, text, encoded, dictionaries=None):
+        """Put a block in block_tab, unless an identical block is already
+        there. The contents of a block found under the same hash are
+        compared, so that a hash collision cannot swap one block for
+        another.
+
+        @param c: cursor on the database
+        @type c : sqlite3.Cursor
+        @param text: basis set data for one element
+        @type text : str
+        @param encoded: the block as it is to be stored, see encode_block
+        @type encoded : str or sqlite3.Binary
+        @param dictionaries: preset dictionaries by checksum, or None to
+        read them from the database if needed
+        @type dictionaries : dict
+        @return: hash of the block, or None if a different block has that
+        hash, in which case the block should be stored inline
+        @rtype : int
+        """
+
+        key = block_hash(text)
+        c.execute("SELECT data FROM block_tab WHERE block_hash=?", [key])
+        row = c.fetchone()
+        if row is None:
+            c.execute("INSERT INTO block_tab VALUES (?,?)", [key, encoded])
+            return key
+
+        stored = row[0]
+        if stored == encoded:
+            return key
+        if dictionaries is None:
+            dictionaries = codec.read_dictionaries(c)
+        if codec.decompress_block(stored, dictionaries) == text:
+            return key
+        return None
+
+    def prune_blocks(self, c):
+        """Delete the blocks of block_tab that no data_tab row refers to
+        any more, as after basis sets are replaced or removed.
+
+        @param c: cursor on the database
+        @type c : sqlite3.Cursor
+        @return: number of blocks deleted
+        @rtype : int
+        """
+
+        c.execute("SELECT 1 FROM block_tab LIMIT 1")
+        if c.fetchone() is None:
+            return 0
+        c.execute("""DELETE FROM block_tab WHERE block_hash NOT IN
+                     (SELECT block_hash FROM data_tab WHERE block_hash IS NOT NULL)""")
+        return c.rowcount
+
+    def create_block_tab(self, c, table="CREATE TABLE IF NOT EXISTS"):
+        """Create block_tab, which holds the blocks of basis set data that
+        data_tab rows refer to by block_hash rather than store in data.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        """
+
+        c.execute(table + ''' block_tab(
+                         block_hash INTEGER PRIMARY KEY,
+                               data
+                    );''')
+
+    def create_output_tab(self, c, view="CREATE VIEW"):
+        #the LEFT JOIN is left out of queries that do not read data
+        c.execute(view + ''' output_tab AS
                         SELECT basis_id,
                                name,
+                               norm_name,
                                description,
                                elt,
-                               data
+                               COALESCE(data_tab.data, block_tab.data) AS data,
+                               max_am,
+                               n_shells,
+                               n_primitives
                         FROM   basis_tab
                 NATURAL JOIN   data_tab
+                   LEFT JOIN   block_tab
+                          ON   block_tab.block_hash = data_tab.block_hash
                     ''')
 
+    def add_columns(self, c, table, columns):
+        """Add the columns missing from a table.
+
+        @param c: cursor on the database
+        @type c : sqlite3.Cursor
+        @param table: table name
+        @type table : str
+        @param columns: (name, type) of the columns the table should have
+        @type columns : list
+        @return: names of the columns added
+        @rtype : list
+        """
+
+        c.execute("PRAGMA table_info({0})".format(table))
+        present = set([row[1] for row in c.fetchall()])
+        added = []
+        for column, type_ in columns:
+            if column not in present:
+                c.execute("ALTER TABLE {0} ADD COLUMN {1} {2}".format(table, column, type_))
+                added.append(column)
+        return added
+
+    def upgrade_tables(self, c):
+        """Bring the tables of a database built by an older version up to
+        the current layout, so that it can be resumed or updated.
+
+        Catalog metadata columns added to basis_tab stay NULL, so every
+        basis set counts as modified on the next update. Normalized names
+        and the shell statistics columns added to data_tab are filled in
+        from the stored data. block_tab starts empty.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        """
+
+        added_names = self.add_columns(c, "basis_tab", [("xml_path", "text"),
+                                                        ("modified", "text"),
+                                                        ("contributor", "text"),
+                                                        ("norm_name", "text COLLATE NOCASE")])
+        if "norm_name" in added_names:
+            c.execute("SELECT basis_id, name FROM basis_tab")
+            names = [[normalize_name(name), basis_id] for basis_id, name in c.fetchall()]
+            c.executemany("UPDATE basis_tab SET norm_name=? WHERE basis_id=?",
+                          names)
+
+        added = self.add_columns(c, "data_tab", [("max_am", "INTEGER"),
+                                                 ("n_shells", "INTEGER"),
+                                                 ("n_primitives", "INTEGER")])
+        if added:
+            stats_fn = self.get_shell_stats_fn()
+            c.execute("SELECT rowid, data FROM data_tab")
+            stats = [list(stats_fn(data)) + [rowid] for rowid, data in c.fetchall()]
+            c.executemany("UPDATE data_tab SET max_am=?, n_shells=?, n_primitives=? WHERE rowid=?",
+                          stats)
+
+        blocks = self.add_columns(c, "data_tab", [("block_hash", "INTEGER")])
+        if blocks:
+            self.create_block_tab(c)
+
+        if added or blocks or "norm_name" in added_names:
+            c.execute("DROP VIEW IF EXISTS output_tab")
+            self.create_output_tab(c)
+
+    def pending_basis(self, c, list_basis_array):
+        """Filter out basis sets that an earlier run of a resumed build
+        already finished. Unless self.skip_failed is set, basis sets that
+        failed before are tried again.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @param list_basis_array: [name, xml path, description, elements]
+        entries as produced by bl_raw_to_array
+        @type list_basis_array : list
+        @return: entries still to be downloaded
+        @rtype : list
+        """
+
+        if self.update:
+            return self.changed_basis(c, list_basis_array)
+
+        c.execute("SELECT name FROM checkpoint_tab")
+        done = set([row[0] for row in c.fetchall()])
+        if self.skip_failed:
+            c.execute("SELECT name FROM failure_tab")
+            done.update([row[0] for row in c.fetchall()])
+
+        pending = [entry for entry in list_basis_array if entry[0] not in done]
+        skipped = len(list_basis_array) - len(pending)
+        if skipped:
+            print(skipped, "basis sets already done, skipping them")
+        return pending
+
+    def changed_basis(self, c, list_basis_array):
+        """Compare the catalog with the catalog metadata in basis_tab. Basis
+        sets no longer in the catalog are deleted; those that are new, or
+        whose xml path or last modified date changed, are returned to be
+        downloaded.
+
+        @param c: cursor on the database being updated
+        @type c : sqlite3.Cursor
+        @param list_basis_array: [name, xml path, description, elements,
+        last modified, contributor] entries as produced by bl_raw_to_array
+        @type list_basis_array : list
+        @return: entries to be downloaded
+        @rtype : list
+        """
+
+        c.execute("SELECT basis_id, name, xml_path, modified FROM basis_tab")
+        stored = dict((row[1], row) for row in c.fetchall())
+
+        new, changed = [], []
+        for entry in list_basis_array:
+            name, path_xml = entry[:2]
+            modified = self.catalog_meta(entry)[1]
+            if name not in stored:
+                new.append(entry)
+            elif stored[name][2:] != (path_xml, modified) or modified is None:
+                changed.append(entry)
+
+        catalog_names = set([entry[0] for entry in list_basis_array])
+        removed = [row for name, row in stored.items() if name not in catalog_names]
+        for basis_id, name, path_xml, modified in removed:
+            self.delete_basis(c, basis_id, name)
+
+        print(len(new), "new,", len(changed), "modified,", len(removed),
+              "removed,", len(stored) - len(changed) - len(removed),
+              "unchanged basis sets")
+        return new + changed
+
+    def catalog_meta(self, entry):
+        """Get the catalog metadata kept in basis_tab for an entry. Entries
+        made by hand may carry only name, xml path, description and
+        elements.
+
+        @param entry: [name, xml path, description, elements, last
+        modified, contributor]
+        @type entry : list
+        @return: (xml path, last modified, contributor)
+        @rtype : tuple
+        """
+
+        meta = list(entry[4:6])
+        meta += [None] * (2 - len(meta))
+        return (entry[1], meta[0], meta[1])
+
+    def delete_basis(self, c, basis_id, name):
+        """Remove a basis set and its checkpoint. Does not commit.
+
+        @param c: cursor on the database being updated
+        @type c : sqlite3.Cursor
+        @param basis_id: basis set id
+        @type basis_id : int
+        @param name: basis set name
+        @type name : str
+        """
+
+        c.execute("DELETE FROM data_tab WHERE basis_id=?", [basis_id])
+        c.execute("DELETE FROM basis_tab WHERE basis_id=?", [basis_id])
+        c.execute("DELETE FROM checkpoint_tab WHERE name=?", [name])
+
+    def record_finished(self, c, name):
+        """Checkpoint a basis set as finished. Meant to be committed in the
+        same transaction as the basis set data.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @param name: basis set name
+        @type name : str
+        """
+
+        c.execute("INSERT OR REPLACE INTO checkpoint_tab VALUES (?,?)",
+                  [name, time.strftime("%Y-%m-%d %H:%M:%S")])
+        c.execute("DELETE FROM failure_tab WHERE name=?", [name])
+
+    def record_failure(self, c, entry, attempts, error):
+        """Move a basis set that could not be downloaded, parsed or inserted
+        to failure_tab, adding to the attempts of earlier runs.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @param entry: [name, xml path, description, elements]
+        @type entry : list
+        @param attempts: attempts made in this run
+        @type attempts : int
+        @param error: description of the last error
+        @type error : str
+        """
+
+        name, path_xml = entry[:2]
+        c.execute("SELECT attempts FROM failure_tab WHERE name=?", [name])
+        row = c.fetchone()
+        if row:
+            attempts += row[0]
+
+        c.execute("INSERT OR REPLACE INTO failure_tab VALUES (?,?,?,?,?)",
+                  [name, path_xml, attempts, error,
+                   time.strftime("%Y-%m-%d %H:%M:%S")])
+
+    def store_basis(self, c, entry, basis_data, error):
+        """Insert a downloaded basis set and checkpoint it, or record why it
+        could not be downloaded. Does not commit.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @param entry: [name, xml path, description, elements]
+        @type entry : list
+        @param basis_data: (name, description, data-pairs), or None
+        @type basis_data : tuple
+        @param error: the DownloadError or other exception if basis_data
+        is None
+        @type error : Exception
+        @return: number of basis set rows stored, 0 on failure
+        @rtype : int
+        """
+
+        start = time.time()
+        if basis_data is not None:
+            rows = self.insert_basis(c, *basis_data,
+                                     meta=self.catalog_meta(entry))
+            if rows:
+                self.record_finished(c, entry[0])
+                self.metrics.observe("insert", time.time() - start)
+                self.metrics.incr("inserted")
+                self.metrics.incr("rows", rows)
+                return rows
+            error = "duplicate basis set name"
+            attempts = 1
+        else:
+            attempts = getattr(error, "attempts", 1)
+            error = str(getattr(error, "error", error))
+
+        self.record_failure(c, entry, attempts, error)
+        self.metrics.incr("failed")
+        return 0
+
+    def create_indexes(self, c):
+        """Create indexes that speed up lookups through output_tab. These
+        are created after loading so that inserts do not maintain them.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        """
+
+        c.execute("""CREATE INDEX IF NOT EXISTS data_tab_basis_elt
+                     ON data_tab(basis_id, elt)""")
+        #covers the per-element basis_id lookups of get_available_basis_sets
+        c.execute("""CREATE INDEX IF NOT EXISTS data_tab_elt_basis
+                     ON data_tab(elt, basis_id)""")
+        c.execute("""CREATE INDEX IF NOT EXISTS basis_tab_norm_name
+                     ON basis_tab(norm_name COLLATE NOCASE)""")
+        self.create_search_index(c)
+
+    def create_search_index(self, c):
+        """Index the basis set names and descriptions for full-text search
+        with EMSL_local.search. search_tab is an FTS5 table whose content
+        is basis_tab; it is rebuilt from basis_tab after each load, so that
+        inserts, updates and deletes do not maintain it one row at a time.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @return: False if this SQLite lacks FTS5, so there is no index
+        @rtype : bool
+        """
+
+        try:
+            c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS search_tab
+                         USING fts5(name, description, content='basis_tab',
+                                    content_rowid='basis_id')""")
+        except sqlite3.OperationalError:
+            if self.verbose:
+                print("SQLite has no FTS5, not indexing basis sets for search",
+                      file=sys.stderr)
+            return False
+
+        c.execute("INSERT INTO search_tab(search_tab) VALUES('rebuild')")
+        return True
+
+    def begin_build(self, conn):
+        """Prepare a connection for loading. In bulk_load mode, switch to a
+        write-ahead log that is only synced at checkpoints.
+
+        @param conn: connection to the database being built
+        @type conn : sqlite3.Connection
+        """
+
+        if self.bulk_load:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+
+    def finish_build(self, conn):
+        """Create indexes and gather query planner statistics once loading
+        is done, drop blocks no longer referred to and compress the blocks
+        still stored as text. In bulk_load mode, fold the write-ahead log
+        back into the database file.
+
+        @param conn: connection to the database being built
+        @type conn : sqlite3.Connection
+        """
+
+        c = conn.cursor()
+        self.create_indexes(c)
+        conn.commit()
+        #without statistics the planner can drive name lookups from the
+        #elt index, which matches nearly every basis set
+        c.execute("ANALYZE")
         conn.commit()
 
-        import Queue
-        import threading
+        pruned = self.prune_blocks(c)
+        if self.compress_data(c) or pruned:
+            conn.commit()
+            #give back the pages the text or the dropped blocks took
+            conn.execute("VACUUM")
+
+        if self.bulk_load:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+    def report_build(self, nb_basis, rows, elapsed, final=True):
+        """Report and keep in self.build_report the throughput of a build,
+        with a final snapshot of self.metrics.
+
+        @param nb_basis: number of basis sets stored
+        @type nb_basis : int
+        @param rows: number of basis_tab and data_tab rows inserted
+        @type rows : int
+        @param elapsed: seconds taken by the build
+        @type elapsed : float
+        @param final: whether to send the snapshot to the metrics sinks as
+        the final one; builds sharing metrics send it themselves
+        @type final : bool
+        @return: build statistics
+        @rtype : dict
+        """
 
-        num_worker_threads = 1
-        attemps_max = 20
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        if final:
+            snapshot = self.metrics.report(final=True)
+        else:
+            snapshot = self.metrics.snapshot()
+        self.build_report = {"basis_sets" : nb_basis,
+                             "rows" : rows,
+                             "seconds" : elapsed,
+                             "rows_per_second" : rate,
+                             "metrics" : snapshot}
+
+        print("Stored {0} basis sets, {1} rows in {2:.1f} s ({3:.0f} rows/s)".format(nb_basis, rows, elapsed, rate))
+        return self.build_report
+
+    def insert_basis(self, c, name, des, d, meta=(None, None, None)):
+        """Insert one basis set and its per-element data, with shell
+        statistics for each element. In dedup mode the data goes to
+        block_tab, unless an identical block is already there (see
+        store_block). When updating, a basis set that is already present is
+        replaced in place, keeping its basis_id. Does not commit.
+
+        @param c: cursor on the database being built
+        @type c : sqlite3.Cursor
+        @param name: basis set name
+        @type name : str
+        @param des: basis set description
+        @type des : str
+        @param d: data-pairs e.g. [["Ca", "#BASIS SET..."], ...]
+        @type d : list
+        @param meta: catalog metadata (xml path, last modified, contributor)
+        @type meta : tuple
+        @return: number of rows inserted, 0 if the name was already present
+        and not updating
+        @rtype : int
+        """
 
-        q_in = Queue.Queue(num_worker_threads)
-        q_out = Queue.Queue(num_worker_threads)
+        try:
+            c.execute(
+                "INSERT INTO basis_tab(name,norm_name,description,xml_path,modified,contributor) VALUES (?,?,?,?,?,?)", [
+                    name, normalize_name(name), des] + list(meta))
+            id_ = c.lastrowid
+        except sqlite3.IntegrityError:
+            if not self.update:
+                return 0
+            c.execute("SELECT basis_id FROM basis_tab WHERE name=?", [name])
+            id_ = c.fetchone()[0]
+            c.execute(
+                "UPDATE basis_tab SET description=?, xml_path=?, modified=?, contributor=? WHERE basis_id=?",
+                [des] + list(meta) + [id_])
+            c.execute("DELETE FROM data_tab WHERE basis_id=?", [id_])
+
+        stats_fn = self.get_shell_stats_fn()
+        if self.dedup:
+            rows = []
+            for k in d:
+                encoded = self.encode_block(k[1])
+                key = self.store_block(c, k[1], encoded)
+                if key is not None:
+                    encoded = None
+                rows.append([id_, k[0], encoded] + list(stats_fn(k[1])) + [key])
+        else:
+            rows = [[id_, k[0], self.encode_block(k[1])] + list(stats_fn(k[1])) + [None]
+                    for k in d]
+        c.executemany(
+            "INSERT INTO data_tab(basis_id,elt,data,max_am,n_shells,n_primitives,block_hash) VALUES (?,?,?,?,?,?,?)",
+            rows)
+        return 1 + len(d)
 
-        def worker():
-            """get a Job from the q_in, do stuff, when finish put it in the q_out"""
-            extraction_method = self.extraction_map[self.format]
-            if extraction_method is None:
-                raise NotImplementedError("No parser currently available for {0} data".format(self.format))
+    def create_sql(self, list_basis_array):
+        """Create the sql from the list of basis available data
 
-            while True:
-                basis_data = []
-                name, path_xml, des, elts = q_in.get()
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
 
-                url = "https://bse.pnl.gov:443/bse/portal/user/anon/js_peid/11535052407933/action/portlets.BasisSetAction/template/courier_content/panel/Main/"
-                url += "/eventSubmit_doDownload/true"
+        start = time.time()
+        conn = sqlite3.connect(self.db_path)
+        self.begin_build(conn)
+        c = conn.cursor()
 
-                params = {'bsurl': path_xml, 'bsname': name,
-                          'elts': " ".join(elts),
-                          'format': self.format,
-                          'minimize': self.contraction}
+        self.create_tables(c)
+        conn.commit()
+        list_basis_array = self.pending_basis(c, list_basis_array)
+        if self.bulk_load:
+            batch_size = self.batch_size
+        else:
+            batch_size = 1
 
-                attemps = 0
-                while attemps < attemps_max:
-                    m = "URL: {0} params {1} attempt {2}".format(url, params,
-                                                                 attemps)
-                    print(m)
-                    text = self.requests.get(url, params=params).text
+        q_in = queue.Queue(self.num_workers)
+        q_out = queue.Queue(self.num_workers)
 
-                    try:
-                        basis_data = extraction_method(text, name, des, elts)
-                    except:
-                        # import ipdb; ipdb.set_trace()
-                        time.sleep(0.1)
-                        attemps += 1
-                    else:
-                        break
+        def worker():
+            """get a Job from the q_in, do stuff, when finish put it in the q_out"""
+            while True:
+                entry = q_in.get()
+                basis_data, error = None, None
+                try:
+                    basis_data = self.download_basis(*entry[:5])
+                except Exception as e:
+                    error = e
 
                 try:
-                    q_out.put(basis_data)
+                    q_out.put((entry, basis_data, error))
                 except:
                     if self.debug:
                         print("Fail on q_out.put", basis_data)
@@ -595,59 +1728,537 @@ class EMSL_dump(object):
 
 
         def enqueue():
-            for [name, path_xml, des, elts] in list_basis_array:
-                print("PARAMS", [name, path_xml, des, elts])
-                q_in.put([name, path_xml, des, elts])
+            for entry in list_basis_array:
+                if self.verbose:
+                    print("PARAMS", entry[:4])
+                q_in.put(entry)
 
             return 0
 
+        started = self.start_parse_pool()
+
         t = threading.Thread(target=enqueue)
         t.daemon = True
         t.start()
 
-        for i in range(num_worker_threads):
+        for i in range(self.num_workers):
             t = threading.Thread(target=worker)
             t.daemon = True
             t.start()
 
         nb_basis = len(list_basis_array)
+        failed = []
+        rows = 0
+
+        try:
+            for i in range(nb_basis):
+                entry, basis_data, error = q_out.get()
+                q_out.task_done()
+                name = entry[0]
+                self.metrics.queue_depth("download", q_in.qsize())
+                self.metrics.queue_depth("insert", q_out.qsize())
+
+                stored = self.store_basis(c, entry, basis_data, error)
+                if stored:
+                    rows += stored
+                    if self.verbose:
+                        print('{:>3}'.format(i + 1), "/", nb_basis, name)
+                else:
+                    failed.append(name)
+                    if self.verbose:
+                        print('{:>3}'.format(i + 1), "/", nb_basis, name, "fail")
 
-        for i in range(nb_basis):
-            name, des, d = q_out.get()
-            q_out.task_done()
+                if (i + 1) % batch_size == 0:
+                    conn.commit()
+                self.metrics.maybe_report()
+        finally:
+            if started:
+                self.stop_parse_pool()
 
-            try:
-                c.execute(
-                    "INSERT INTO basis_tab(name,description) VALUES (?,?)", [
-                        name, des])
-                conn.commit()
-            except sqlite3.IntegrityError:
-                print('{:>3}'.format(i + 1), "/", nb_basis, name, "fail")
+        conn.commit()
+        self.finish_build(conn)
+        conn.close()
+        self.report_build(nb_basis - len(failed), rows, time.time() - start)
 
-            id_ = c.lastrowid
+        q_in.join()
+        return failed
+
+    def create_sql_async(self, list_basis_array):
+        """Create the sql from the list of basis available data, with
+        downloads, extraction and inserts running as separate asyncio
+        pipeline stages.
+
+        @param list_basis_array: [name, xml path, description, elements]
+        entries as produced by bl_raw_to_array
+        @type list_basis_array : list
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
+
+        from .pipeline import AsyncBuild
+
+        started = self.start_parse_pool()
+        try:
+            build = AsyncBuild(self, max_pending=self.max_pending,
+                               parse_executor=self.parse_pool)
+            return build.run(list_basis_array)
+        finally:
+            if started:
+                self.stop_parse_pool()
+
+    def fill_archive(self):
+        """Download the catalog and every basis set in self.format into the
+        archive without building a database. Requests that are already
+        archived are not repeated.
+
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
+
+        from multiprocessing.pool import ThreadPool
+
+        if self.archive is None:
+            raise ValueError("fill_archive needs an archive")
+
+        _data = self.dwl_basis_list_raw()
+        array_basis = self.bl_raw_to_array(_data)
+        del _data
+
+        def download(entry):
             try:
-                c.executemany(
-                    "INSERT INTO data_tab VALUES (?,?,?)", [
-                        [id_] + k for k in d])
-                conn.commit()
+                self.download_basis(*entry[:5])
+            except DownloadError:
+                return entry[0]
 
-                print('{:>3}'.format(i + 1), "/", nb_basis, name)
+        started = self.start_parse_pool()
+        pool = ThreadPool(self.num_workers)
+        try:
+            failed = [name for name in pool.map(download, array_basis) if name]
+        finally:
+            pool.close()
+            pool.join()
+            if started:
+                self.stop_parse_pool()
 
-            except:
-                print('{:>3}'.format(i + 1), "/", nb_basis, name, "fail")
-                raise
+        return failed
 
-        conn.close()
+    def update_db(self):
+        """Bring an existing database up to date with the catalog,
+        downloading only the basis sets that are new or were modified since
+        it was built, and removing those no longer published. With an
+        archive, the catalog still comes from the network unless offline,
+        and archived downloads of modified basis sets are not replayed.
 
-        q_in.join()
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
+
+        self.update = True
+        return self.new_db()
 
     def new_db(self):
-        """Create new_db from scratch"""
+        """Create new_db from scratch, finish an interrupted build if
+        self.resume is set, or refresh an existing one if self.update is set
+
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
 
         _data = self.dwl_basis_list_raw()
         array_basis = self.bl_raw_to_array(_data)
         del _data
 
-        self.create_sql(array_basis)
+        if self.pipeline == "asyncio":
+            return self.create_sql_async(array_basis)
+        else:
+            return self.create_sql(array_basis)
+
+
+#dumps used by extract_basis_data, one per format and debug setting, kept
+#for the life of an extraction process
+process_dumps = {}
+
+def extract_basis_data(format, debug, data, name, des, elts):
+    """Extract per-element data from a raw BSE download. Meant to run in
+    the extraction processes started by EMSL_dump.start_parse_pool.
+
+    @param format: BSE format name, e.g. "Gaussian94"
+    @type format : str
+    @param debug: debug setting of the dump that downloaded the data
+    @type debug : bool
+    @return: (name, description, data-pairs)
+    @rtype : tuple
+    """
+
+    try:
+        ed = process_dumps[(format, debug)]
+    except KeyError:
+        ed = EMSL_dump(format=format, debug=debug)
+        process_dumps[(format, debug)] = ed
+    return ed.get_extraction_method()(data, name, des, elts)
+
+default_formats = ["gamess-us", "nwchem", "g94"]
+
+def fill_archive(archive, formats=default_formats, **options):
+    """Fill a response archive with everything needed to build the
+    databases for several formats.
+
+    @param archive: response archive or its directory
+    @type archive : ResponseArchive
+    @param formats: formats by short name, e.g. "g94"
+    @type formats : list
+    @param options: further EMSL_dump options, e.g. num_workers
+    @return: names of failed basis sets by format
+    @rtype : dict
+    """
+
+    failed = {}
+    for fmt in formats:
+        ed = EMSL_dump(format=EMSL_dump.format_dict[fmt], archive=archive,
+                       **options)
+        failed[fmt] = ed.fill_archive()
+    return failed
+
+def rebuild_one(args):
+    fmt, db_path, archive, options = args
+    ed = EMSL_dump(db_path, format=EMSL_dump.format_dict[fmt],
+                   archive=archive, offline=True, **options)
+    return fmt, ed.new_db()
+
+def rebuild_from_archive(archive, db_paths, **options):
+    """Rebuild the databases for several formats at once, one process per
+    format, from a response archive alone.
+
+    @param archive: archive directory
+    @type archive : str
+    @param db_paths: database path by format short name, e.g. "g94"
+    @type db_paths : dict
+    @param options: further EMSL_dump options, e.g. bulk_load
+    @return: names of failed basis sets by format
+    @rtype : dict
+    """
+
+    from multiprocessing import Pool
+    from .archive import ResponseArchive
+
+    if isinstance(archive, ResponseArchive):
+        archive = archive.root
+
+    jobs = [(fmt, db_path, archive, options) for fmt, db_path in sorted(db_paths.items())]
+    pool = Pool(len(jobs))
+    try:
+        results = pool.map(rebuild_one, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict(results)
+
+class MultiFormatBuild(object):
+    """Build the databases for several formats in one pass. The catalog is
+    downloaded and parsed once; the downloads of every format are then
+    interleaved on one shared work queue served by num_workers threads
+    through a single HTTP session, while one writer thread per format fills
+    that format's database.
+    """
+
+    def __init__(self, db_paths, **options):
+        """Set up one dump per format, sharing the first one's session and
+        rate limiters.
+
+        @param db_paths: database path by format short name, e.g. "g94"
+        @type db_paths : dict
+        @param options: further EMSL_dump options, e.g. num_workers
+        """
+
+        self.dumps = []
+        for fmt, db_path in sorted(db_paths.items()):
+            ed = EMSL_dump(db_path, format=EMSL_dump.format_dict[fmt],
+                           **options)
+            if self.dumps:
+                shared = self.dumps[0][1]
+                ed.session = shared.session
+                ed.rate_limiters = shared.rate_limiters
+                ed.rate_limiters_lock = shared.rate_limiters_lock
+                ed.metrics = shared.metrics
+                ed.parse_workers = 0
+            self.dumps.append((fmt, ed))
+
+        self.num_workers = self.dumps[0][1].num_workers
+        self.verbose = self.dumps[0][1].verbose
+        self.metrics = self.dumps[0][1].metrics
+        self.progress_lock = threading.Lock()
+
+    def open_db(self, ed, catalog):
+        """Open and prepare a format's database for its writer thread.
+
+        @return: (connection, entries still to be downloaded)
+        @rtype : tuple
+        """
+
+        conn = sqlite3.connect(ed.db_path, check_same_thread=False)
+        ed.begin_build(conn)
+        c = conn.cursor()
+        ed.create_tables(c)
+        conn.commit()
+        return conn, ed.pending_basis(c, ed.select_basis(catalog))
+
+    def progress(self, fmt, name, ok):
+        """Report one finished basis set against the combined total."""
+
+        with self.progress_lock:
+            self.nb_done += 1
+            if not self.verbose:
+                return
+            line = ['{:>4}'.format(self.nb_done), "/", self.nb_total,
+                    "[{0}]".format(fmt), name]
+            if not ok:
+                line.append("fail")
+            print(*line)
+
+    def writer(self, fmt, ed, conn, q_out, nb_basis):
+        """Store the results of one format as they arrive. If storing
+        fails, the rest of the format's results are still taken off q_out,
+        so the download workers never block, and the error is kept for run
+        to raise.
+        """
+
+        start = time.time()
+        c = conn.cursor()
+        if ed.bulk_load:
+            batch_size = ed.batch_size
+        else:
+            batch_size = 1
+
+        rows = 0
+        received = 0
+        try:
+            for i in range(nb_basis):
+                entry, basis_data, error = q_out.get()
+                received += 1
+                self.metrics.queue_depth("insert " + fmt, q_out.qsize())
+                stored = ed.store_basis(c, entry, basis_data, error)
+                rows += stored
+                if not stored:
+                    self.failed[fmt].append(entry[0])
+                self.progress(fmt, entry[0], stored)
+                self.metrics.maybe_report()
+
+                if (i + 1) % batch_size == 0:
+                    conn.commit()
+
+            conn.commit()
+            ed.finish_build(conn)
+        except Exception as e:
+            self.errors[fmt] = e
+            for i in range(received, nb_basis):
+                q_out.get()
+        else:
+            ed.report_build(nb_basis - len(self.failed[fmt]), rows,
+                            time.time() - start, final=False)
+        finally:
+            conn.close()
+
+    def run(self):
+        """Download the catalog, then build every format's database.
+
+        @return: names of failed basis sets by format
+        @rtype : dict
+        @raise Exception: the error of a format whose writer failed, once
+        every download has finished
+        """
+
+        start = time.time()
+        first = self.dumps[0][1]
+        catalog = first.parse_catalog(first.dwl_basis_list_raw())
+
+        q_in = queue.Queue(self.num_workers)
+        jobs = []
+        writers = []
+        self.failed = {}
+        self.errors = {}
+        for fmt, ed in self.dumps:
+            conn, pending = self.open_db(ed, catalog)
+            if self.verbose:
+                print(len(pending), "basis sets will be downloaded in", fmt)
+            q_out = queue.Queue(self.num_workers)
+            jobs.append([(ed, q_out, entry) for entry in pending])
+            self.failed[fmt] = []
+            writers.append(threading.Thread(target=self.writer,
+                                            args=(fmt, ed, conn, q_out,
+                                                  len(pending))))
+
+        #interleave the formats so that every database fills at once
+        schedule = []
+        for i in range(max([len(j) for j in jobs] or [0])):
+            schedule.extend([j[i] for j in jobs if i < len(j)])
+        self.nb_total = len(schedule)
+        self.nb_done = 0
 
+        def worker():
+            while True:
+                job = q_in.get()
+                if job is None:
+                    break
+                self.metrics.queue_depth("download", q_in.qsize())
+                ed, q_out, entry = job
+                basis_data, error = None, None
+                try:
+                    basis_data = ed.download_basis(*entry[:5])
+                except Exception as e:
+                    error = e
+                q_out.put((entry, basis_data, error))
+
+        #every format extracts in the first dump's processes, if any
+        started = first.start_parse_pool()
+        for fmt, ed in self.dumps:
+            ed.parse_pool = first.parse_pool
+
+        workers = [threading.Thread(target=worker) for i in range(self.num_workers)]
+        for t in workers + writers:
+            t.daemon = True
+            t.start()
+
+        try:
+            for job in schedule:
+                q_in.put(job)
+            for t in workers:
+                q_in.put(None)
+            for t in workers + writers:
+                t.join()
+        finally:
+            if started:
+                first.stop_parse_pool()
+                for fmt, ed in self.dumps:
+                    ed.parse_pool = None
+
+        if self.errors:
+            raise self.errors[sorted(self.errors)[0]]
+
+        nb_failed = sum([len(names) for names in self.failed.values()])
+        self.metrics.report(final=True)
+        print("Built {0} databases, {1} basis sets, {2} failed in {3:.1f} s".format(len(self.dumps), self.nb_total - nb_failed, nb_failed, time.time() - start))
+        return self.failed
+
+def new_dbs(db_paths, **options):
+    """Build the databases for several formats in one pass, sharing the
+    downloaded catalog, the download workers and the HTTP session.
+
+    @param db_paths: database path by format short name, e.g. "g94"
+    @type db_paths : dict
+    @param options: further EMSL_dump options, e.g. num_workers
+    @return: names of failed basis sets by format
+    @rtype : dict
+    """
+
+    return MultiFormatBuild(db_paths, **options).run()
+
+def optimize_db(db_path, fmt="gamess-us", page_size=4096, vacuum=True,
+                compression=None, dedup=False):
+    """Tune an existing database for reading, in place: bring its tables up
+    to the current layout, create the indexes of create_indexes (including
+    the full-text index), gather query planner statistics, then rewrite the
+    file with VACUUM using page_size bytes per page.
+
+    With dedup, the basis set data is first moved to block_tab, one copy
+    of each distinct block (see EMSL_dump.dedup_data). With compression,
+    the data still stored as text is compressed (see
+    EMSL_dump.compress_data).
+
+    Running it again on an optimized database only repeats ANALYZE and
+    VACUUM.
+
+    @param db_path: database to optimize
+    @type db_path : str
+    @param fmt: format short name of the database, e.g. "g94"; only used
+    to fill in shell statistics missing from older databases
+    @type fmt : str
+    @param page_size: database page size, a power of two from 512 to 65536
+    @type page_size : int
+    @param vacuum: whether to VACUUM; without it, page_size is not applied
+    and the space freed by compression is not given back
+    @type vacuum : bool
+    @param compression: "zlib" or "zlib-dict" to compress the data, or None
+    @type compression : str
+    @param dedup: whether to de-duplicate the data
+    @type dedup : bool
+    @return: {"db_path", "added", "deduplicated", "compressed", "page_size",
+    "size_before", "size_after", "seconds"}; added lists the indexes and
+    tables created, deduplicated counts the data_tab rows moved to
+    block_tab and compressed the blocks compressed
+    @rtype : dict
+    """
+
+    start = time.time()
+    size_before = os.path.getsize(db_path)
+    ed = EMSL_dump(db_path, format=EMSL_dump.format_dict[fmt], debug=False,
+                   update=True, verbose=False, compression=compression)
+
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    schema = "SELECT name FROM sqlite_master WHERE type IN ('index', 'table')"
+    present = set(row[0] for row in c.execute(schema).fetchall())
+
+    ed.upgrade_tables(c)
+    ed.create_indexes(c)
+    deduplicated = ed.dedup_data(c) if dedup else 0
+    compressed = ed.compress_data(c)
+    conn.commit()
+    added = sorted(row[0] for row in c.execute(schema).fetchall()
+                   if row[0] not in present and not row[0].startswith("search_tab_"))
+
+    c.execute("ANALYZE")
+    conn.commit()
+
+    if vacuum:
+        #page_size cannot change in WAL mode
+        c.execute("PRAGMA journal_mode=DELETE")
+        c.execute("PRAGMA page_size={0:d}".format(page_size))
+        c.execute("VACUUM")
+
+    page_size = c.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+
+    return {"db_path" : db_path,
+            "added" : added,
+            "deduplicated" : deduplicated,
+            "compressed" : compressed,
+            "page_size" : page_size,
+            "size_before" : size_before,
+            "size_after" : os.path.getsize(db_path),
+            "seconds" : time.time() - start}
+
+def dedup_report(db_path):
+    """Measure how much de-duplication saves in a database, or would save
+    in one that stores every block in data_tab. Sizes are those of the
+    stored blocks, so of the compressed ones in a compressed database.
+
+    @param db_path: database to measure
+    @type db_path : str
+    @return: {"blocks", "unique_blocks", "bytes", "unique_bytes",
+    "saved_bytes", "saved_fraction", "in_block_tab"}; blocks and bytes
+    count every data_tab row's block, unique_blocks and unique_bytes each
+    distinct block once; in_block_tab counts the data_tab rows whose block
+    is kept in block_tab
+    @rtype : dict
+    """
+
+    conn = sqlite3.connect(db_path)
+    size = "COUNT(*), COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0)"
+    try:
+        blocks, total = conn.execute("SELECT {0} FROM output_tab".format(size)).fetchone()
+        unique_blocks, unique_bytes = conn.execute(
+            "SELECT {0} FROM (SELECT DISTINCT data FROM output_tab)".format(size)).fetchone()
+        in_block_tab = conn.execute(
+            "SELECT COUNT(*) FROM data_tab WHERE block_hash IS NOT NULL").fetchone()[0]
+    finally:
+        conn.close()
 
+    saved = total - unique_bytes
+    return {"blocks" : blocks,
+            "unique_blocks" : unique_blocks,
+            "bytes" : total,
+            "unique_bytes" : unique_bytes,
+            "saved_bytes" : saved,
+            "saved_fraction" : float(saved) / total if total else 0.0,
+            "in_block_tab" : in_block_tab}
@@ -4,11 +4,18 @@
 
 from __future__ import print_function, absolute_import
 from . import conversion
+from .compression import decompress_block, read_dictionaries
+from .formats import db_map
+from .metrics import null_timer
+from . import sqltrace
+from .names import load_aliases, normalize_name, read_aliases, resolve_name
 import glob
 import json
 import os
+import re
 import sqlite3
 import sys
+import threading
 
 def checkSQLite3(db_path, fmt):
     # Check if db file is readable
@@ -34,9 +41,9 @@ def checkSQLite3(db_path, fmt):
     # Check if the file system allows I/O on sqlite3 (lustre)
     # If not, copy on /dev/shm and remove after opening
     try:
-        EMSL_local(db_path, fmt).get_available_basis_sets()
+        probe_db(db_path)
     except sqlite3.OperationalError:
-        print("I/O Error for you file system", file=sys.stdrerr)
+        print("I/O Error for you file system", file=sys.stderr)
         print("Try some fixes", file=sys.stderr)
         new_db_path = "/dev/shm/%d.db" % (os.getpid())
         os.system("cp %s %s" % (db_path, new_db_path))
@@ -47,7 +54,7 @@ def checkSQLite3(db_path, fmt):
 
     # Try again to check
     try:
-        EMSL_local(db_path, fmt).get_available_basis_sets()
+        probe_db(db_path)
     except:
         print("Sorry...", file=sys.stderr)
         os.system("rm -f /dev/shm/%d.db" % (os.getpid()))
@@ -58,6 +65,16 @@ def checkSQLite3(db_path, fmt):
         return db_path, changed
 
 
+def probe_db(db_path):
+    """Read one row, enough to fail if the file system cannot lock the
+    database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("SELECT name FROM basis_tab LIMIT 1").fetchall()
+    finally:
+        conn.close()
+
+
 def cond_sql_or(table_name, l_value):
 
     l = []
@@ -67,20 +84,193 @@ def cond_sql_or(table_name, l_value):
 
     return l
 
+def search_terms(text):
+    """Split search text into words: "6-31G* polarization" ->
+    ["6", "31G", "polarization"]."""
+
+    return re.findall(r"\w+", text, re.UNICODE)
+
+def fts_query(terms):
+    """Make an FTS5 query for rows holding every term, as a word or the
+    start of one."""
+
+    return " AND ".join('"{0}"*'.format(t) for t in terms)
+
+def elements_subquery(elements):
+    """SQL selecting the basis_id of basis sets with data for every
+    element, as a list of conditions for "AND"ing."""
+
+    if not elements:
+        return [], []
+    q = "SELECT basis_id FROM data_tab WHERE elt=?"
+    return (["basis_id IN ({0})".format(" INTERSECT ".join([q] * len(elements)))],
+            list(elements))
+
+#Shell labels in order of increasing angular momentum, so that a label's
+#index is its angular momentum quantum number
+shells = "S P D F G H I K L M".split()
+
+def shell_stats_gamess_us(block):
+    """Get angular momentum and shell statistics for one element's block of
+    GAMESS-US basis set data.
+
+    An "L" shell encountered before any D shell is GAMESS-US notation for
+    a fused SP shell and counts as P; after a D shell it is a true L shell.
+
+    @param block: basis set data for one element
+    @type block : str
+    @return: (max_am, n_shells, n_primitives); max_am is None if no shells
+    @rtype : tuple
+    """
+
+    greatest = None
+    n_shells = 0
+    n_primitives = 0
+    d_encountered = False
+
+    for line in block.split("\n"):
+        pieces = line.split()
+        try:
+            b = pieces[0]
+            if b == "D":
+                d_encountered = True
+            if b == "L" and not d_encountered:
+                b = "P"
+            index = shells.index(b)
+        except (IndexError, ValueError):
+            continue
+
+        greatest = max(greatest, index) if greatest is not None else index
+        n_shells += 1
+        try:
+            n_primitives += int(pieces[1])
+        except (IndexError, ValueError):
+            pass
+
+    return (greatest, n_shells, n_primitives)
+
+def shell_stats_nwchem(block_json):
+    """Get angular momentum and shell statistics for one element's block of
+    NWChem basis set data, which is a JSON object of basis sections.
+
+    N.B.: This ignores ECP data.
+
+    @param block_json: serialized basis set data for one element
+    @type block_json : str
+    @return: (max_am, n_shells, n_primitives); max_am is None if no shells
+    @rtype : tuple
+    """
+
+    greatest = None
+    n_shells = 0
+    n_primitives = 0
+    block_packed = json.loads(block_json)
+
+    for name in ["ao basis", "cd basis", "xc basis"]:
+        try:
+            block = block_packed[name]
+        except KeyError:
+            continue
+
+        in_shell = False
+        for line in block.split("\n")[1:]:
+            pieces = line.split()
+            if not pieces or line.startswith("#"):
+                continue
+            try:
+                b = pieces[1]
+                index = shells.index(b)
+            except (IndexError, ValueError):
+                if in_shell:
+                    n_primitives += 1
+                continue
+
+            greatest = max(greatest, index) if greatest is not None else index
+            n_shells += 1
+            in_shell = True
+
+    return (greatest, n_shells, n_primitives)
+
+def shell_stats_gaussian94(block):
+    """Get angular momentum and shell statistics for one element's block of
+    Gaussian 94 basis set data. A fused "SP" shell counts as P.
+
+    @param block: basis set data for one element
+    @type block : str
+    @return: (max_am, n_shells, n_primitives); max_am is None if no shells
+    @rtype : tuple
+    """
+
+    greatest = None
+    n_shells = 0
+    n_primitives = 0
+
+    for line in block.split("\n")[1:]:
+        pieces = line.split()
+        try:
+            b = pieces[0]
+            if b == "SP":
+                b = "P"
+            index = shells.index(b)
+        except (IndexError, ValueError):
+            continue
+
+        greatest = max(greatest, index) if greatest is not None else index
+        n_shells += 1
+        try:
+            n_primitives += int(pieces[1])
+        except (IndexError, ValueError):
+            pass
+
+    return (greatest, n_shells, n_primitives)
+
+#Per-format functions to compute (max_am, n_shells, n_primitives) of a block
+shell_stats = {"gamess-us" : shell_stats_gamess_us,
+               "nwchem" : shell_stats_nwchem,
+               "g94" : shell_stats_gaussian94}
+
+#Highest angular momentum each format can handle; None means no limit.
+#GAMESS-US went from G to I in January 2013; Gaussian and programs using its
+#format, like Psi4, may support arbitrarily high angular momentum
+am_limits = {"gamess-us" : "I",
+             "nwchem" : "I",
+             "g94" : None}
+
 
 class EMSL_local(object):
-    def __init__(self, db_path=None, fmt="gamess-us", debug=True):
+    def __init__(self, db_path=None, fmt="gamess-us", debug=True,
+                 metrics=None, trace=None, aliases=None):
+        """
+        :param db_path: sqlite3 database, or None for the bundled one for fmt
+        :type db_path : str
+        :param fmt: output format, e.g. "nwchem"
+        :type fmt : str
+        :param debug: warn about angular momentum too high for fmt
+        :type debug : bool
+        :param metrics: optional per-stage timings and counters of lookups;
+        off (and nearly free) when None
+        :type metrics : metrics.LookupMetrics
+        :param trace: record every query with its plan: True for a new
+        trace, an SQLTrace to share one, False for none; None follows the
+        EBSEL_SQL_TRACE environment variable
+        :type trace : bool or sqltrace.SQLTrace
+        :param aliases: more basis set name aliases, {alias : name} or the
+        path of an aliases file, on top of those of names.load_aliases
+        :type aliases : dict or str
+        """
+
         self.fmt = fmt
+        #bundled databases are checked by checkSQLite3 on first use
+        self.checked = db_path is not None
         if db_path is None:
             db_path = self.db_from_format(fmt)
 
         self.db_path = db_path
 
-        self.shells = "S P D F G H I K L M".split()
-        #Per-format functions to check maximum angular momentum
-        self.am_checkers = {"gamess-us" : self.check_gamess_us,
-                            "nwchem" : self.check_nwchem,
-                            "g94" : self.check_gaussian94}
+        self.shells = shells
+        #each thread's last angular momentum check, behind the deprecated
+        #max_am and am_too_large
+        self.last_am_check = threading.local()
 
         #Per-format functions to perform extra formatting on basis set output.
         #The lambda just returns raw data unchanged.
@@ -88,6 +278,53 @@ class EMSL_local(object):
                                "nwchem" : self.wrap_nwchem,
                                "g94" : self.wrap_g94}
         self.debug = debug
+        self.metrics = metrics
+
+        if trace is None:
+            trace = sqltrace.session_trace()
+        elif trace is True:
+            trace = sqltrace.SQLTrace()
+        elif trace is False:
+            trace = None
+        self.trace = trace
+
+        self.aliases = dict(load_aliases())
+        if isinstance(aliases, dict):
+            for alias, name in aliases.items():
+                self.add_alias(alias, name)
+        elif aliases:
+            read_aliases(aliases, self.aliases)
+        #whether basis_tab has norm_name, found out on connecting
+        self.normalized = None
+        #preset dictionaries of compressed data, read on connecting
+        self.dictionaries = None
+
+    def stage(self, name):
+        """Time a stage of a lookup if metrics are on.
+
+        :param name: stage name, see metrics.LookupMetrics
+        :type name : str
+        :return: context manager
+        """
+
+        if self.metrics is None:
+            return null_timer
+        return self.metrics.stage(name)
+
+    def count(self, name, n=1):
+        if self.metrics is not None:
+            self.metrics.incr(name, n)
+
+    def stats(self):
+        """Get per-stage timings and counters of lookups so far.
+
+        :return: see metrics.LookupMetrics.stats, or None if metrics are off
+        :rtype : dict
+        """
+
+        if self.metrics is None:
+            return None
+        return self.metrics.stats()
 
     def db_from_format(self, fmt):
         """Get appropriate db_path from corresponding format.
@@ -98,9 +335,6 @@ class EMSL_local(object):
         :rtype : str
         """
 
-        db_map = {"gamess-us" : "db/Gamess-us.db",
-                  "nwchem" : "db/NWChem.db",
-                  "g94" : "db/Gaussian94.db"}
         try:
             dbfile = db_map[fmt]
             db_path = os.path.dirname(os.path.dirname(__file__)) + "/" + dbfile
@@ -109,125 +343,147 @@ class EMSL_local(object):
             sys.stderr.write(msg)
             sys.exit(1)
 
-        db_path, db_path_changed = checkSQLite3(db_path, fmt)
         return db_path
 
-    def check_gamess_us(self, basis_blocks):
-        """GAMESS-US supports only up to I basis functions. See if any
-        basis blocks have higher basis functions.
+    def connect(self):
+        """Open the database, checking a bundled one with checkSQLite3 the
+        first time, which may move it to /dev/shm.
 
-        N.B.: Prior to January 2013, GAMESS-US supported only up to G basis
-        functions.
-
-        GAMESS has a special notation used in e.g. Pople basis sets: an
-        "L" basis indicates S and P basis functions both with the
-        same exponent. If we encounter an L function before a D function,
-        it is a special-type L function and should be treated as a composite
-        of S and P.
+        :return: connection
+        :rtype : sqlite3.Connection
+        """
 
-        @param basis_blocks: blocks of basis set data
-        @type basis_blocks : list
-        @return: (max_basis_fn, too_large)
-        @rtype : tuple
+        if not self.checked:
+            with self.stage("check"):
+                self.db_path, db_path_changed = checkSQLite3(self.db_path, self.fmt)
+            self.checked = True
+        conn = sqlite3.connect(self.db_path)
+        if self.trace is not None:
+            self.trace.attach(conn)
+        if self.normalized is None:
+            #databases built before norm_name existed are searched by name
+            columns = conn.execute("PRAGMA table_info(basis_tab)").fetchall()
+            self.normalized = "norm_name" in [col[1] for col in columns]
+        if self.dictionaries is None:
+            self.dictionaries = read_dictionaries(conn)
+        return conn
+
+    def add_alias(self, alias, name):
+        """Make another spelling of a basis set name resolve to it.
+
+        :param alias: the other spelling, e.g. "6-31G(d)"
+        :type alias : str
+        :param name: the name in the database, e.g. "6-31G*"
+        :type name : str
         """
 
-        greatest = 0
-        d_encountered = False
+        self.aliases[normalize_name(alias)] = name
 
-        for block in basis_blocks:
-            for line in block.split("\n"):
-                pieces = line.split()
-                try:
-                    b = pieces[0]
-                    if b == "D":
-                        d_encountered = True
-
-                    #If no D function has been encountered yet, an L function
-                    #should be treated as a fused "SP" function, which is P for
-                    #purposes of determining the greatest function AM
-                    #encountered so far
-                    if b == "L" and not d_encountered:
-                        b = "P"
-                    index = self.shells.index(b)
-                    greatest = max(greatest, index)
-                except (IndexError, ValueError):
-                    pass
+    def resolve_name(self, basis_name):
+        """Get the basis set name that a spelling stands for.
 
-        mbf = self.shells[greatest]
-        if greatest > self.shells.index("I"):
-            too_large = True
-        else:
-            too_large = False
+        :param basis_name: name or alias of a basis set
+        :type basis_name : str
+        :return: basis set name
+        :rtype : str
+        """
 
-        return (mbf, too_large)
+        return resolve_name(basis_name, self.aliases)
 
+    def name_condition(self, basis_name):
+        """Get an SQL condition on output_tab, with its parameter, that
+        picks a basis set by any accepted spelling of its name. Call after
+        connecting.
 
-    def check_nwchem(self, basis_blocks):
-        """NWChem supports only up to I basis functions. See if any
-        basis blocks have higher basis functions.
+        :param basis_name: name or alias of a basis set
+        :type basis_name : str
+        :return: (condition, parameter)
+        :rtype : tuple
+        """
 
-        N.B.: This ignores ECP data.
+        name = self.resolve_name(basis_name)
+        if self.normalized:
+            return ("norm_name=?", normalize_name(name))
+        return ("name=? COLLATE NOCASE", name)
+
+    def query(self, c, cmd, params=()):
+        """Run a query and fetch all of its rows, timing and tracing it
+        when those are on.
+
+        :param c: cursor
+        :type c : sqlite3.Cursor
+        :param cmd: SQL statement
+        :type cmd : str
+        :param params: parameters to bind
+        :type params : tuple or dict
+        :return: rows
+        :rtype : list
+        """
 
-        @param basis_blocks: blocks of basis set data
-        @type basis_blocks : list
+        with self.stage("sql"):
+            if self.trace is not None:
+                rows = self.trace.execute(c, cmd, params)
+            else:
+                c.execute(cmd, params)
+                rows = c.fetchall()
+        self.count("queries")
+        self.count("rows", len(rows))
+        return rows
+
+    def max_am_result(self, greatest):
+        """Turn a maximum angular momentum index into a shell label and
+        a flag telling whether it exceeds what self.fmt supports.
+
+        @param greatest: maximum angular momentum, or None if no shells
+        @type greatest : int
         @return: (max_basis_fn, too_large)
         @rtype : tuple
         """
 
-        names = ["ao basis", "cd basis", "xc basis"]
-        greatest = 0
-
-        for block_json in basis_blocks:
-            block_packed = json.loads(block_json)
-            for name in names:
-                try:
-                    block = block_packed[name]
-                except KeyError:
-                    continue
-                for line in block.split("\n")[1:]:
-                    pieces = line.split()
-                    try:
-                        b = pieces[1]
-                        index = self.shells.index(b)
-                        greatest = max(greatest, index)
-                    except (IndexError, ValueError):
-                        pass
+        if greatest is None:
+            greatest = 0
 
         mbf = self.shells[greatest]
-        if greatest > self.shells.index("I"):
+        limit = am_limits[self.fmt]
+        if limit is not None and greatest > self.shells.index(limit):
             too_large = True
         else:
             too_large = False
 
         return (mbf, too_large)
 
-    def check_gaussian94(self, basis_blocks):
-        """Gaussian and programs using its basis set format, like Psi4,
-        may support arbitrarily high angular momentum basis functions.
-        So only report the maximum, never declare the value too large.
+    def rows_max_am(self, l_data_raw):
+        """Find the maximum angular momentum of fetched blocks, from the
+        max_am column fetched with each block or, for blocks that have none
+        (databases built before the column existed), from the block itself.
 
-        @param basis_blocks: blocks of basis set data
-        @type basis_blocks : list
+        @param l_data_raw: (data, max_am) rows, see fetch_basis_raw
+        @type l_data_raw : list
         @return: (max_basis_fn, too_large)
         @rtype : tuple
         """
 
-        greatest = 0
+        stats_fn = shell_stats[self.fmt]
+        found = [b[1] if b[1] is not None else stats_fn(b[0])[0]
+                 for b in l_data_raw]
+        found = [f for f in found if f is not None]
+        greatest = max(found) if found else None
 
-        for block in basis_blocks:
-            for line in block.split("\n")[1:]:
-                pieces = line.split()
-                try:
-                    b = pieces[0]
-                    index = self.shells.index(b)
-                    greatest = max(greatest, index)
-                except (IndexError, ValueError):
-                    pass
+        return self.max_am_result(greatest)
 
-        mbf = self.shells[greatest]
-        too_large = False
+    @property
+    def max_am(self):
+        """Deprecated: maximum angular momentum of the data from this
+        thread's last get_basis call, or None before any. Use get_max_am."""
 
-        return (mbf, too_large)
+        return getattr(self.last_am_check, "result", (None, False))[0]
+
+    @property
+    def am_too_large(self):
+        """Deprecated: whether max_am is too high for self.fmt. Use
+        get_max_am."""
+
+        return getattr(self.last_am_check, "result", (None, False))[1]
 
     def wrap_g94(self, blocks, basis_name):
         """Wrap up Gaussian 94 blocks with **** at head and foot.
@@ -301,9 +557,11 @@ class EMSL_local(object):
         """
 
         fn_type = self.spherical_or_cartesian(basis_name)
+        with self.stage("decode"):
+            decoded = [json.loads(block_json) for block_json in blocks]
+
         groups = {}
-        for block_json in blocks:
-            block = json.loads(block_json)
+        for block in decoded:
             for key in block:
                 try:
                     groups[key].append(block[key])
@@ -343,15 +601,21 @@ class EMSL_local(object):
         parser_map = {"nwchem" : c.parse_multi_nwchem,
                       "g94" : c.parse_multi_g94}
 
-        with open(file_name) as infile:
-            file_data = infile.read()
-        origin = "db/" + file_name.split("db/", 1)[-1]
-        parsefn = parser_map[fmt]
-        parsed = parsefn(file_data, origin)
+        with self.stage("fs_parse"):
+            with open(file_name) as infile:
+                file_data = infile.read()
+            origin = "db/" + file_name.split("db/", 1)[-1]
+            parsefn = parser_map[fmt]
+            parsed = parsefn(file_data, origin)
+        self.count("files_parsed")
 
         return parsed
 
     def get_basis_files(self, fmt):
+        with self.stage("fs_scan"):
+            return self.scan_basis_files(fmt)
+
+    def scan_basis_files(self, fmt):
         """Get available basis set files for supplementing basis set data
         stored in sqlite. Also warn if extraneous files are present.
 
@@ -446,7 +710,12 @@ class EMSL_local(object):
         :type allowed_basis_names : list
         """
 
-        conn = sqlite3.connect(self.db_path)
+        with self.stage("get_available_basis_sets"):
+            return self.find_basis_sets(elements, allowed_basis_names,
+                                        search_extra)
+
+    def find_basis_sets(self, elements, allowed_basis_names, search_extra):
+        conn = self.connect()
         c = conn.cursor()
 
         if allowed_basis_names:
@@ -460,31 +729,21 @@ class EMSL_local(object):
                      WHERE {0}"""
 
             cmd = cmd.format(basis_filter_clause)
+            info = self.query(c, cmd)
 
         else:
-            q = """SELECT DISTINCT basis_id
+            #basis sets with data for every element, in one query that
+            #searches the data_tab(elt, basis_id) index once per element
+            q = """SELECT basis_id
                       FROM output_tab
                       WHERE elt=? AND {0}""".format(basis_filter_clause)
 
-            cmd = " INTERSECT ".join([q] * len(elements)) + ";"
-            c.execute(cmd, elements)
-
-            basis_ids = [i[0] for i in c.fetchall()]
-
-            basis_filter_clause = " ".join(cond_sql_or("basis_id", basis_ids))
-            elements_filter_clause = " ".join(cond_sql_or("elt", elements))
-
-            column_to_fech = "name, description"
-
-            filter_where = " ({}) AND ({})".format(elements_filter_clause, basis_filter_clause)
-
-            cmd = """SELECT DISTINCT {0}
-                     FROM output_tab
-                     WHERE {1}
-                     ORDER BY name""".format(column_to_fech, filter_where)
+            cmd = """SELECT name, description
+                     FROM basis_tab
+                     WHERE basis_id IN ({0})
+                     ORDER BY name""".format(" INTERSECT ".join([q] * len(elements)))
+            info = self.query(c, cmd, elements)
 
-        c.execute(cmd)
-        info = c.fetchall()
         conn.close()
 
         final = [i[:] for i in info]
@@ -497,6 +756,71 @@ class EMSL_local(object):
             return final + extra
         return final
 
+    def search(self, query, elements=[], limit=None):
+        """Find basis sets by words of their names and descriptions, e.g.
+        "triple zeta polarization" or "6-31G". Every word must start a word
+        of the name or description. Results are ranked by BM25 relevance,
+        with name matches counting ten times description matches; a basis
+        set whose name, or an alias of it, is the query comes first.
+
+        Databases built without the search_tab full-text index (older
+        ones, or SQLite without FTS5) are searched with LIKE, and the
+        results sorted by name.
+
+        :param query: words to search for
+        :type query : str
+        :param elements: optional element symbols every result must have
+        :type elements : list
+        :param limit: maximum number of results, or None for all
+        :type limit : int
+        :return: (name, description) of the matching basis sets
+        :rtype : list
+        """
+
+        with self.stage("search"):
+            return self.search_basis_sets(query, elements, limit)
+
+    def search_basis_sets(self, query, elements, limit):
+        name = self.resolve_name(query)
+        if normalize_name(name) != normalize_name(query):
+            #an alias: search for what it stands for
+            query = name
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        conn = self.connect()
+        c = conn.cursor()
+        condition, name = self.name_condition(query)
+        where, where_params = elements_subquery(elements)
+        limit = -1 if limit is None else limit
+
+        cmd = """SELECT name, description
+                 FROM basis_tab
+                 JOIN (SELECT rowid AS basis_id, bm25(search_tab, 10.0, 1.0) AS score
+                       FROM search_tab
+                       WHERE search_tab MATCH ?) USING (basis_id)
+                 {0}
+                 ORDER BY ({1}) DESC, score
+                 LIMIT ?"""
+        cmd = cmd.format("WHERE " + " AND ".join(where) if where else "",
+                         condition)
+        try:
+            found = self.query(c, cmd, [fts_query(terms)] + where_params + [name, limit])
+        except sqlite3.OperationalError:
+            for term in terms:
+                where.append("(name LIKE ? OR description LIKE ?)")
+                where_params += ["%" + term + "%"] * 2
+            cmd = """SELECT name, description
+                     FROM basis_tab
+                     WHERE {0}
+                     ORDER BY ({1}) DESC, name
+                     LIMIT ?""".format(" AND ".join(where), condition)
+            found = self.query(c, cmd, where_params + [name, limit])
+        conn.close()
+
+        return [tuple(row) for row in found]
+
     def get_available_elements_fs(self, fmt, basis_name):
         """Get the available elements from a basis set that is stored
         on the file system.
@@ -520,36 +844,96 @@ class EMSL_local(object):
         return elements
 
     def get_available_elements(self, basis_name):
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         c = conn.cursor()
 
-        c.execute(
-            "SELECT DISTINCT elt from output_tab WHERE name=:name_us COLLATE NOCASE", {
-                "name_us": basis_name})
-
-        data = c.fetchall()
+        condition, name = self.name_condition(basis_name)
+        data = self.query(c,
+            "SELECT DISTINCT elt from output_tab WHERE " + condition, [name])
         data = [str(i[0]) for i in data]
         conn.close()
 
         if not data:
             for fmt in ["nwchem", "g94"]:
-                data = self.get_available_elements_fs(fmt, basis_name)
+                data = self.get_available_elements_fs(fmt, self.resolve_name(basis_name))
                 if data:
                     break
         return data
 
-    def process_raw_data(self, l_data_raw, basis_name):
+    def get_shell_stats(self, basis_name, elements=[]):
+        """Get per-element angular momentum and shell statistics for a basis
+        set stored in the sqlite3 database. The statistics are computed once
+        when the database is built; databases built before the statistics
+        columns existed are handled by scanning the stored data instead.
+
+        :param basis_name: name of the basis set
+        :type basis_name : str
+        :param elements: elements to report, or all elements if empty
+        :type elements : list
+        :return: (element, max_am, n_shells, n_primitives) for each element
+        :rtype : list
+        """
+
+        conn = self.connect()
+        c = conn.cursor()
+
+        if elements:
+            cmd_ele = "AND " + " ".join(cond_sql_or("elt", elements))
+        else:
+            cmd_ele = ""
+
+        condition, name = self.name_condition(basis_name)
+        query = """SELECT elt, {columns} from output_tab
+        WHERE {condition}
+        {cmd_ele}"""
+
+        try:
+            rows = self.query(c, query.format(columns="max_am, n_shells, n_primitives",
+                                              condition=condition,
+                                              cmd_ele=cmd_ele), [name])
+            stats = [tuple(row) for row in rows]
+        except sqlite3.OperationalError:
+            rows = self.query(c, query.format(columns="data", condition=condition,
+                                              cmd_ele=cmd_ele), [name])
+            stats_fn = shell_stats[self.fmt]
+            stats = [(elt,) + stats_fn(decompress_block(data, self.dictionaries))
+                     for elt, data in rows]
+
+        conn.close()
+        return stats
+
+    def get_max_am(self, basis_name, elements=[]):
+        """Look up the maximum angular momentum of a basis set's data and
+        whether it is too high for self.fmt.
+
+        :param basis_name: name of the basis set
+        :type basis_name : str
+        :param elements: elements to check, or all elements if empty
+        :type elements : list
+        :return: (max_basis_fn, too_large)
+        :rtype : tuple
+        """
+
+        found = [s[1] for s in self.get_shell_stats(basis_name, elements)]
+        found = [f for f in found if f is not None]
+        greatest = max(found) if found else None
+
+        return self.max_am_result(greatest)
+
+    def process_raw_data(self, l_data_raw, basis_name, elements=[]):
         unpacked = [b[0] for b in l_data_raw]
-        validator = self.am_checkers[self.fmt]
         wrapper = self.block_wrappers[self.fmt]
 
-        self.max_am, self.am_too_large = validator(unpacked)
+        with self.stage("am_check"):
+            max_am, too_large = self.rows_max_am(l_data_raw)
+        self.last_am_check.result = (max_am, too_large)
 
-        if self.am_too_large and self.debug:
-            msg = "WARNING: Basis set data contains angular momentum up to {0}, which is too high for {1}\n".format(self.max_am, self.fmt)
+        if too_large and self.debug:
+            msg = "WARNING: Basis set data contains angular momentum up to {0}, which is too high for {1}\n".format(max_am, self.fmt)
             sys.stderr.write(msg)
 
-        transformed = wrapper(unpacked, basis_name)
+        with self.stage("wrap"):
+            transformed = wrapper(unpacked, basis_name)
         return transformed
 
     def convert_from_format(self, fmt, basis_name, destination_format,
@@ -570,8 +954,14 @@ class EMSL_local(object):
         :rtype : list
         """
 
+        with self.stage("convert"):
+            return self.convert_basis(fmt, basis_name, destination_format,
+                                      elements, bypass_db)
+
+    def convert_basis(self, fmt, basis_name, destination_format, elements,
+                      bypass_db):
         completed = []
-        el = EMSL_local(fmt=fmt, debug=False)
+        el = EMSL_local(fmt=fmt, debug=False, metrics=self.metrics)
         c = conversion.Converter()
 
         wrappers = {"nwchem" : c.wrap_converted_nwchem,
@@ -602,16 +992,17 @@ class EMSL_local(object):
         #bypassing the database to force use of basis data from file system
         if not completed:
             bs = self.get_available_basis_sets_fs(fmt, allowed_basis_names=[basis_name])
+            if not bs:
+                return []
 
-            if bs:
-                flist = self.get_basis_files(fmt)
-                basfile = [x["file"] for x in flist if x["name"] == basis_name][0]
-                bse = self.load_basis_file(fmt, basfile)
-                if not elements:
-                    elements = [p.symbol for p in bse]
+            flist = self.get_basis_files(fmt)
+            basfile = [x["file"] for x in flist if x["name"] == basis_name][0]
+            bse = self.load_basis_file(fmt, basfile)
+            if not elements:
+                elements = [p.symbol for p in bse]
 
-                selected = [p for p in bse if p.symbol in elements]
-                wrapped = wrapper(selected)
+            selected = [p for p in bse if p.symbol in elements]
+            wrapped = wrapper(selected)
 
         else:
             wrapped = wrapper(completed)
@@ -621,16 +1012,18 @@ class EMSL_local(object):
 
     def fetch_basis_raw(self, basis_name, elements):
         """Get raw basis data for named basis set from a sqlite3 database.
+        Blocks stored compressed are decompressed.
 
         :param basis_name: name of the basis set
         :type basis_name : str
         :param elements: elements that need basis data
         :type elements : list
-        :return: basis set data for one or more elements
+        :return: (data, max_am) for one or more elements; max_am is None
+        for databases without the max_am column
         :rtype : list
         """
 
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         c = conn.cursor()
 
         if elements:
@@ -638,14 +1031,25 @@ class EMSL_local(object):
         else:
             cmd_ele = ""
 
-        query = """SELECT DISTINCT data from output_tab
-        WHERE name="{basis_name}" COLLATE NOCASE
-        {cmd_ele}""".format(basis_name=basis_name,
-                            cmd_ele=cmd_ele)
-        c.execute(query)
-
-        l_data_raw = c.fetchall()
+        condition, name = self.name_condition(basis_name)
+        query = """SELECT DISTINCT data, {max_am} from output_tab
+        WHERE {condition}
+        {cmd_ele}"""
+        try:
+            l_data_raw = self.query(c, query.format(max_am="max_am",
+                                                    condition=condition,
+                                                    cmd_ele=cmd_ele), [name])
+        except sqlite3.OperationalError:
+            l_data_raw = self.query(c, query.format(max_am="NULL",
+                                                    condition=condition,
+                                                    cmd_ele=cmd_ele), [name])
         conn.close()
+
+        #blocks of databases built with compression are BLOBs
+        if any(not isinstance(row[0], type(u"")) for row in l_data_raw):
+            with self.stage("decompress"):
+                l_data_raw = [(decompress_block(row[0], self.dictionaries), row[1])
+                              for row in l_data_raw]
         return l_data_raw
 
     def fetch_basis(self, basis_name, elements):
@@ -662,7 +1066,8 @@ class EMSL_local(object):
         #TODO: move special nwchem json treatment here, convert others to list-of-dicts form
         l_data_raw = self.fetch_basis_raw(basis_name, elements)
         if l_data_raw:
-            processed = self.process_raw_data(l_data_raw, basis_name)
+            processed = self.process_raw_data(l_data_raw, basis_name,
+                                              elements)
             return processed
 
     def get_basis(self, basis_name, elements=[], convert_from="", bypass_db=False):
@@ -678,6 +1083,9 @@ class EMSL_local(object):
          The primary basis set databases can be bypassed, forcing data to load
          from the file system basis entries, if bypass_db is set to True.
 
+         The name may be spelled in any case, or be an alias such as
+         6-31G(d) for 6-31G* (see names.py).
+
         :param basis_name: name of the basis set
         :type basis_name : str
         :param elements: elements that need basis data
@@ -690,6 +1098,12 @@ class EMSL_local(object):
         :rtype : list
         """
 
+        with self.stage("get_basis"):
+            return self.lookup_basis(basis_name, elements, convert_from,
+                                     bypass_db)
+
+    def lookup_basis(self, basis_name, elements, convert_from, bypass_db):
+        basis_name = self.resolve_name(basis_name)
         processed = []
         #conversions from nwchem and g94 available presently
         if convert_from in ("nwchem", "g94"):
@@ -704,6 +1118,7 @@ class EMSL_local(object):
 
         #no results from db, so try supplemenal filesystem data
         if not processed:
+            self.count("fs_fallbacks")
             #convert from nwchem by default, also if it's explicitly chosen
             if not convert_from or convert_from == "nwchem":
                 processed = self.convert_from_format("nwchem", basis_name,
@@ -720,6 +1135,31 @@ class EMSL_local(object):
 
         return processed
 
+    def get_basis_for_molecule(self, basis_name, path_or_coords,
+                               convert_from="", bypass_db=False):
+        """Get basis data for every distinct element of a molecule. The
+        geometry is read in one pass that keeps only its elements, so each
+        element is looked up once however many atoms it has.
+
+        :param basis_name: name of the basis set
+        :type basis_name : str
+        :param path_or_coords: XYZ, SDF/MOL or PDB file; or "symbol x y z"
+         lines or (symbol, x, y, z) tuples
+        :type path_or_coords : str or list
+        :param convert_from: optional format to first convert from
+        :type convert_from : str
+        :param bypass_db: if True, ignore data stored in sqlite3 database
+        :type bypass_db : bool
+        :return: basis set data for each element of the molecule
+        :rtype : list
+        """
+
+        from .molecule import read_elements
+
+        elements = read_elements(path_or_coords)
+        return self.get_basis(basis_name, elements, convert_from=convert_from,
+                              bypass_db=bypass_db)
+
 if __name__ == "__main__":
 
     e = EMSL_local("EMSL.db")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""On-disk archive of Basis Set Exchange responses, so that databases can be
+rebuilt reproducibly without the network.
+
+Layout under the archive root:
+
+* objects/ab/abcd....z -- zlib-compressed response bodies, named by the
+  SHA-256 of the uncompressed body, so identical responses are stored once
+* requests/ef/efgh....json -- one entry per request, named by the SHA-256
+  of the URL and sorted query parameters, pointing at an object
+* parsed/ij/ijkl....json -- results derived from a response body, such as
+  the parsed catalog, named by the SHA-256 of that body
+
+Entries are written to a temporary file and renamed into place, so several
+processes can fill or read the same archive at once.
+"""
+
+from __future__ import print_function, absolute_import
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+
+class ResponseArchive(object):
+    def __init__(self, root):
+        """Open, creating if necessary, the archive in directory root.
+
+        @param root: archive directory
+        @type root : str
+        """
+
+        self.root = root
+        for sub in ["objects", "requests", "parsed"]:
+            path = os.path.join(root, sub)
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    if not os.path.isdir(path):
+                        raise
+
+    def request_key(self, url, params=None):
+        """Get the key of a request: a hash of its URL and parameters that
+        does not depend on parameter order.
+
+        @param url: requested URL
+        @type url : str
+        @param params: query parameters
+        @type params : dict
+        @return: hex digest
+        @rtype : str
+        """
+
+        items = sorted((params or {}).items())
+        blob = json.dumps([url, items], sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def path_for(self, kind, digest, extension):
+        return os.path.join(self.root, kind, digest[:2], digest + extension)
+
+    def write_atomic(self, path, data):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as outfile:
+                outfile.write(data)
+            if hasattr(os, "replace"):
+                os.replace(tmp_path, path)
+            else:
+                os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, url, params=None):
+        """Get the archived response body for a request.
+
+        @param url: requested URL
+        @type url : str
+        @param params: query parameters
+        @type params : dict
+        @return: response body, or None if the request is not archived
+        @rtype : unicode
+        """
+
+        key = self.request_key(url, params)
+        try:
+            with open(self.path_for("requests", key, ".json"), "rb") as infile:
+                entry = json.loads(infile.read().decode("utf-8"))
+            with open(self.path_for("objects", entry["content"], ".z"), "rb") as infile:
+                compressed = infile.read()
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        return zlib.decompress(compressed).decode("utf-8")
+
+    def put(self, url, params, text):
+        """Archive the response body for a request.
+
+        @param url: requested URL
+        @type url : str
+        @param params: query parameters
+        @type params : dict
+        @param text: response body
+        @type text : unicode
+        @return: content hash of the stored body
+        @rtype : str
+        """
+
+        body = text.encode("utf-8")
+        content = hashlib.sha256(body).hexdigest()
+        object_path = self.path_for("objects", content, ".z")
+        if not os.path.exists(object_path):
+            self.write_atomic(object_path, zlib.compress(body, 9))
+
+        entry = {"url" : url,
+                 "params" : params or {},
+                 "content" : content}
+        key = self.request_key(url, params)
+        self.write_atomic(self.path_for("requests", key, ".json"),
+                          json.dumps(entry, sort_keys=True).encode("utf-8"))
+        return content
+
+    def load_parsed(self, digest):
+        """Get the result stored by save_parsed for a content hash.
+
+        @param digest: SHA-256 of the response body the result came from
+        @type digest : str
+        @return: stored result, or None if there is none
+        """
+
+        try:
+            with open(self.path_for("parsed", digest, ".json"), "rb") as infile:
+                return json.loads(infile.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save_parsed(self, digest, value):
+        """Store a result derived from a response body, so that the body
+        does not need parsing again.
+
+        @param digest: SHA-256 of the response body the result came from
+        @type digest : str
+        @param value: JSON-serializable result
+        """
+
+        self.write_atomic(self.path_for("parsed", digest, ".json"),
+                          json.dumps(value).encode("utf-8"))
+
+    def stats(self):
+        """Count archived requests and stored objects, and the compressed
+        size of the objects.
+
+        @return: {"requests": n, "objects": n, "bytes": n}
+        @rtype : dict
+        """
+
+        counts = {"requests" : 0, "objects" : 0, "bytes" : 0}
+        for kind, extension in [("requests", ".json"), ("objects", ".z")]:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, kind)):
+                for filename in filenames:
+                    if filename.endswith(extension):
+                        counts[kind] += 1
+                        if kind == "objects":
+                            counts["bytes"] += os.path.getsize(os.path.join(dirpath, filename))
+        return counts
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Run many get_basis_data requests from a manifest in one process.
+
+A manifest is either JSON lines, one object per line, or CSV with a header
+row, with the fields:
+
+* basis -- basis set name (required)
+* atoms -- element symbols: a list in JSON, or separated by spaces,
+  commas or semicolons; empty for every element of the basis set
+* output -- file to write, relative to the output directory (required)
+* format -- output format, e.g. "g94" [default: gamess-us]
+* db_path -- database to read instead of the format's bundled one
+* convert_from -- "nwchem" or "g94" to convert from that format
+
+Identical requests are looked up once however many outputs they have, and
+requests are grouped by format and database so that each group shares one
+EMSL_local.
+"""
+
+from __future__ import print_function, absolute_import
+import csv
+import json
+import os
+import re
+from .EMSL_local import EMSL_local
+from .formats import db_map
+
+atom_separator = re.compile(r"[\s;,]+")
+
+
+def parse_atoms(atoms):
+    if not atoms:
+        return []
+    if isinstance(atoms, list):
+        return [str(a) for a in atoms]
+    return [a for a in atom_separator.split(atoms) if a]
+
+
+def read_manifest(path):
+    """Read the jobs of a JSON-lines or CSV manifest, telling them apart by
+    the first character of the file.
+
+    @param path: manifest file
+    @type path : str
+    @return: jobs as dicts with every field filled in
+    @rtype : list
+    @raise ValueError: if a job lacks its basis or output
+    """
+
+    with open(path) as infile:
+        text = infile.read()
+
+    if text.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(text.splitlines()))
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        if not row.get("basis") or not row.get("output"):
+            raise ValueError("{0} job {1} needs a basis and an output".format(path, number))
+        jobs.append({"basis" : row["basis"],
+                     "atoms" : parse_atoms(row.get("atoms")),
+                     "output" : row["output"],
+                     "format" : row.get("format") or "gamess-us",
+                     "db_path" : row.get("db_path") or None,
+                     "convert_from" : row.get("convert_from") or ""})
+    return jobs
+
+
+def group_jobs(jobs):
+    """De-duplicate jobs and group them by format and database.
+
+    @param jobs: jobs from read_manifest
+    @type jobs : list
+    @return: {(format, db_path) : {(basis, atoms, convert_from) : [output, ...]}}
+    @rtype : dict
+    """
+
+    groups = {}
+    for job in jobs:
+        requests = groups.setdefault((job["format"], job["db_path"]), {})
+        key = (job["basis"], tuple(job["atoms"]), job["convert_from"])
+        outputs = requests.setdefault(key, [])
+        if job["output"] not in outputs:
+            outputs.append(job["output"])
+    return groups
+
+
+def run_request(el, request, outputs, outdir):
+    """Look up one request and write it to each of its outputs.
+
+    @return: (outputs written, [(output, error), ...])
+    @rtype : tuple
+    """
+
+    basis_name, atoms, convert_from = request
+    try:
+        blocks = el.get_basis(basis_name, list(atoms), convert_from)
+        #file system fallbacks give blank blocks for missing elements
+        if not any(block.strip() for block in blocks):
+            raise ValueError("no data for {0} {1}".format(basis_name, " ".join(atoms)))
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+        return 0, [(output, error) for output in outputs]
+
+    #same text as get_basis_data --save
+    text = "\n\n".join(blocks) + "\n"
+    failed = []
+    for output in outputs:
+        path = os.path.join(outdir, output)
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(path, "w") as outfile:
+                outfile.write(text + "\n")
+        except (IOError, OSError) as e:
+            failed.append((output, str(e)))
+    return len(outputs) - len(failed), failed
+
+
+def run_batch(jobs, outdir=".", workers=0):
+    """Run the jobs of a manifest.
+
+    @param jobs: jobs from read_manifest
+    @type jobs : list
+    @param outdir: directory that relative outputs are written to
+    @type outdir : str
+    @param workers: threads running requests, 0 to run them in turn
+    @type workers : int
+    @return: {"jobs", "requests", "written", "failed"}, failed being
+    [output, error] pairs
+    @rtype : dict
+    """
+
+    groups = group_jobs(jobs)
+    work = []
+    results = []
+    for (fmt, db_path), requests in sorted(groups.items(), key=lambda g: (g[0][0], g[0][1] or "")):
+        if db_path is None and fmt not in db_map:
+            error = "no database for format {0}".format(fmt)
+            results.extend((0, [(output, error) for output in outputs])
+                           for outputs in requests.values())
+            continue
+
+        el = EMSL_local(db_path=db_path, fmt=fmt, debug=False)
+        for request, outputs in requests.items():
+            work.append((el, request, outputs, outdir))
+
+    if workers:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            results.extend(pool.map(lambda args: run_request(*args), work))
+    else:
+        results.extend(run_request(*args) for args in work)
+
+    report = {"jobs" : len(jobs),
+              "requests" : len(results),
+              "written" : 0,
+              "failed" : []}
+    for written, failed in results:
+        report["written"] += written
+        report["failed"].extend(failed)
+    return report
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Compressed storage of basis set data.
+
+A database built with EMSL_dump(compression="zlib") stores each
+data_tab.data value as a zlib stream in a BLOB rather than as TEXT. With
+"zlib-dict" the streams start from a preset dictionary trained on the
+database's own blocks (see train_dictionary), which helps on blocks too
+short to compress well alone. The dictionary is kept in codec_tab under
+its Adler-32 checksum, which zlib also writes in the header of every
+stream that needs it, so a stream says which dictionary to inflate it with.
+
+Values stored as TEXT are read unchanged: a database may mix compressed
+and plain blocks, and databases built without compression read as before.
+Preset dictionaries need Python 3.3 or later.
+"""
+
+from __future__ import print_function, absolute_import
+import re
+import sqlite3
+import struct
+import zlib
+
+modes = ["zlib", "zlib-dict"]
+
+level = 9
+
+#zlib looks back at most 32 KB, so no dictionary should be longer; on the
+#db/g94 files 2 KB saves nearly as much and inflates twice as fast
+dictionary_size = 2048
+
+#lines of basis set text, or of the JSON strings that hold NWChem blocks
+segment_re = re.compile(r".+?(?:\n|\\n|$)", re.S)
+
+text_type = type(u"")
+
+
+def train_dictionary(blocks, size=dictionary_size):
+    """Make a preset dictionary out of the lines that recur across blocks,
+    those that would save the most bytes first. zlib encodes a match more
+    cheaply the closer it is to the end of the dictionary, so the most
+    valuable lines go last.
+
+    @param blocks: basis set data blocks
+    @type blocks : list
+    @param size: maximum dictionary length in bytes
+    @type size : int
+    @return: dictionary
+    @rtype : bytes
+    """
+
+    counts = {}
+    for block in blocks:
+        for segment in set(segment_re.findall(block)):
+            counts[segment] = counts.get(segment, 0) + 1
+
+    shared = [s for s in counts if counts[s] > 1]
+    shared.sort(key=lambda s: (-counts[s] * len(s), s))
+
+    chosen = []
+    total = 0
+    for segment in shared:
+        encoded = segment.encode("utf-8")
+        if total + len(encoded) <= size:
+            chosen.append(encoded)
+            total += len(encoded)
+
+    return b"".join(reversed(chosen))
+
+def dictionary_id(dictionary):
+    return zlib.adler32(dictionary) & 0xffffffff
+
+def compress_block(text, dictionary=None):
+    """Compress one block of basis set data.
+
+    @param text: basis set data
+    @type text : str
+    @param dictionary: preset dictionary, or None
+    @type dictionary : bytes
+    @return: zlib stream
+    @rtype : bytes
+    """
+
+    if dictionary is None:
+        return zlib.compress(text.encode("utf-8"), level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS,
+                                  zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                  dictionary)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+def stream_dictionary_id(data):
+    """Get the checksum of the preset dictionary a zlib stream was made
+    with, from its header.
+
+    @param data: zlib stream
+    @type data : bytes
+    @return: dictionary checksum, or None if the stream needs none
+    @rtype : int
+    """
+
+    header = bytearray(data[:6])
+    #FDICT flag of the FLG byte
+    if not header[1] & 0x20:
+        return None
+    return struct.unpack(">I", bytes(header[2:6]))[0]
+
+def decompress_block(data, dictionaries={}):
+    """Get back the text of a stored block. Text is returned unchanged.
+
+    @param data: data_tab.data value
+    @type data : str or bytes
+    @param dictionaries: preset dictionaries by checksum, see
+    read_dictionaries
+    @type dictionaries : dict
+    @return: basis set data
+    @rtype : str
+    @raise ValueError: if the stream needs a dictionary not given
+    """
+
+    if data is None or isinstance(data, text_type):
+        return data
+
+    data = bytes(data)
+    dict_id = stream_dictionary_id(data)
+    if dict_id is None:
+        return zlib.decompress(data).decode("utf-8")
+
+    try:
+        dictionary = dictionaries[dict_id]
+    except KeyError:
+        raise ValueError("No dictionary {0:08x} for compressed basis set data".format(dict_id))
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS, dictionary)
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+def read_dictionaries(conn):
+    """Get the preset dictionaries stored in a database.
+
+    @param conn: connection or cursor
+    @type conn : sqlite3.Connection
+    @return: dictionaries by checksum; empty if there is no codec_tab
+    @rtype : dict
+    """
+
+    try:
+        rows = conn.execute("SELECT dict_id, dictionary FROM codec_tab").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return dict((dict_id, bytes(dictionary)) for dict_id, dictionary in rows)
+
+def store_dictionary(c, dictionary):
+    """Keep a preset dictionary in a database's codec_tab.
+
+    @param c: cursor on the database
+    @type c : sqlite3.Cursor
+    @param dictionary: dictionary
+    @type dictionary : bytes
+    """
+
+    c.execute('''CREATE TABLE IF NOT EXISTS codec_tab(
+                            dict_id INTEGER PRIMARY KEY,
+                         dictionary BLOB
+                    );''')
+    c.execute("INSERT OR REPLACE INTO codec_tab VALUES (?,?)",
+              [dictionary_id(dictionary), sqlite3.Binary(dictionary)])
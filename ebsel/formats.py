@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Static tables of formats, importable without pulling in the rest of
+the package, so that command line arguments can be checked cheaply.
+"""
+
+#short format name -> format name used by the BSE
+format_dict = {"g94": "Gaussian94",
+               "gamess-us": "GAMESS-US",
+               "gamess-uk": "GAMESS-UK",
+               "turbomole": "Turbomole",
+               "tx93": "TX93",
+               "molpro": "Molpro",
+               "molproint": "MolproInt",
+               "hondo": "Hondo",
+               "supermolecule": "SuperMolecule",
+               "molcas": "Molcas",
+               "hyperchem": "HyperChem",
+               "dalton": "Dalton",
+               "demon-ks": "deMon-KS",
+               "demon2k": "deMon2k",
+               "aces2": "AcesII",
+               "nwchem" : "NWChem"
+               }
+
+#short format name -> bundled database, relative to the top of the source tree
+db_map = {"gamess-us" : "db/Gamess-us.db",
+          "nwchem" : "db/NWChem.db",
+          "g94" : "db/Gaussian94.db"}
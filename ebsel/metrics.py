@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Counters, latency histograms and queue depths for database builds.
+
+A BuildMetrics is shared by every thread of a build. Snapshots are handed
+to a callback and/or appended to a JSON-lines log at most once per
+interval while the build runs, and once more when it finishes.
+
+Counters:
+
+* fetched, archive_hits -- responses from the network, from the archive
+* bytes_fetched -- size of the responses from the network
+* parsed -- responses extracted into element data
+* retried -- failed download or extraction attempts that were retried
+* inserted, rows -- basis sets stored, and their basis_tab/data_tab rows
+* failed -- basis sets given up on
+
+Latencies are kept per stage ("fetch", "parse", "insert") as a histogram
+over fixed bucket bounds, in seconds.
+
+A LookupMetrics does the same for the stages of EMSL_local lookups; see
+its docstring for the stage and counter names.
+"""
+
+from __future__ import print_function, absolute_import
+import bisect
+import json
+import threading
+import time
+
+clock = getattr(time, "perf_counter", time.time)
+
+counter_names = ["fetched", "archive_hits", "bytes_fetched", "parsed",
+                 "retried", "inserted", "rows", "failed"]
+
+#upper bounds in seconds of the latency histogram buckets, plus overflow
+bucket_bounds = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                 1.0, 2.0, 5.0, 10.0]
+
+
+class Histogram(object):
+    def __init__(self):
+        self.buckets = [0] * (len(bucket_bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(bucket_bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        labels = ["<={0}".format(b) for b in bucket_bounds] + [">{0}".format(bucket_bounds[-1])]
+        return {"count" : self.count,
+                "total" : self.total,
+                "mean" : self.total / self.count if self.count else None,
+                "min" : self.min,
+                "max" : self.max,
+                "buckets" : dict((label, n) for label, n in zip(labels, self.buckets) if n)}
+
+
+class BuildMetrics(object):
+    counter_names = counter_names
+
+    def __init__(self, callback=None, log_path=None, interval=1.0):
+        """Set up metrics for a build.
+
+        @param callback: called with each snapshot dict
+        @type callback : function
+        @param log_path: file to append snapshots to, one JSON object per line
+        @type log_path : str
+        @param interval: minimum seconds between snapshots while running
+        @type interval : float
+        """
+
+        self.callback = callback
+        self.log_path = log_path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start = time.time()
+            self.last_report = self.start
+            self.counters = dict((name, 0) for name in self.counter_names)
+            self.latencies = {}
+            self.queues = {}
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        """Record the latency of one item in a stage."""
+
+        with self.lock:
+            try:
+                histogram = self.latencies[stage]
+            except KeyError:
+                histogram = Histogram()
+                self.latencies[stage] = histogram
+            histogram.observe(seconds)
+
+    def queue_depth(self, name, depth):
+        """Record the current depth of a queue, keeping its maximum."""
+
+        with self.lock:
+            last, deepest = self.queues.get(name, (0, 0))
+            self.queues[name] = (depth, max(deepest, depth))
+
+    def snapshot(self, final=False):
+        """Get the current state of every metric.
+
+        @param final: whether the build is over
+        @type final : bool
+        @return: {"time", "elapsed", "final", "counters", "latency",
+        "queues"}
+        @rtype : dict
+        """
+
+        with self.lock:
+            now = time.time()
+            return {"time" : now,
+                    "elapsed" : now - self.start,
+                    "final" : final,
+                    "counters" : dict(self.counters),
+                    "latency" : dict((stage, h.snapshot()) for stage, h in self.latencies.items()),
+                    "queues" : dict((name, {"depth" : depth, "max" : deepest})
+                                    for name, (depth, deepest) in self.queues.items())}
+
+    def maybe_report(self):
+        """Report a snapshot if interval seconds passed since the last."""
+
+        if self.callback is None and self.log_path is None:
+            return
+        with self.lock:
+            now = time.time()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+        self.report()
+
+    def report(self, final=False):
+        """Hand a snapshot to the callback and the JSON-lines log.
+
+        @return: the snapshot
+        @rtype : dict
+        """
+
+        snapshot = self.snapshot(final)
+        if self.callback is not None:
+            self.callback(snapshot)
+        if self.log_path is not None:
+            line = json.dumps(snapshot, sort_keys=True) + "\n"
+            with self.lock:
+                with open(self.log_path, "a") as outfile:
+                    outfile.write(line)
+        return snapshot
+
+
+class StageTimer(object):
+    """Context manager timing one pass through a stage."""
+
+    __slots__ = ["metrics", "stage", "start"]
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = clock()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, clock() - self.start)
+        return False
+
+
+class NullTimer(object):
+    """Context manager that does nothing, for when metrics are off."""
+
+    __slots__ = []
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+null_timer = NullTimer()
+
+
+class LookupMetrics(BuildMetrics):
+    """Counters and per-stage latencies of EMSL_local lookups.
+
+    Stages nest, so e.g. "get_basis" includes the time of the "sql" and
+    "wrap" stages inside it:
+
+    * get_basis, get_available_basis_sets, search -- whole calls
+    * check -- checkSQLite3 on first use of a bundled database
+    * sql -- running queries and fetching their rows
+    * decompress -- inflating blocks stored compressed
+    * decode -- JSON decoding of NWChem blocks
+    * am_check -- maximum angular momentum checks
+    * wrap -- format-specific wrapping of blocks
+    * fs_scan, fs_parse -- listing and parsing db/nwchem and db/g94 files
+    * convert -- convert_from_format, including its own lookups
+
+    Counters:
+
+    * queries, rows -- SQL statements run and rows they returned
+    * fs_fallbacks -- get_basis calls that found nothing in the database
+    * files_parsed -- basis set files read from the file system
+    """
+
+    counter_names = ["queries", "rows", "fs_fallbacks", "files_parsed"]
+
+    def stage(self, name):
+        """Time a stage: use as "with metrics.stage(name):"."""
+
+        return StageTimer(self, name)
+
+    def stats(self):
+        """Get calls and seconds spent per stage, with the counters.
+
+        @return: {"counters" : {name : n}, "stages" : {stage : {"calls",
+        "total", "mean", "min", "max"}}}
+        @rtype : dict
+        """
+
+        snapshot = self.snapshot()
+        stages = {}
+        for stage, latency in snapshot["latency"].items():
+            stages[stage] = {"calls" : latency["count"],
+                             "total" : latency["total"],
+                             "mean" : latency["mean"],
+                             "min" : latency["min"],
+                             "max" : latency["max"]}
+        return {"counters" : snapshot["counters"],
+                "stages" : stages}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Read the distinct elements of a molecule from an XYZ, SDF/MOL or PDB
+geometry file, without keeping the atoms: each file is read in one
+streaming pass that only looks at its element column.
+
+* XYZ: frames of an atom count line, a comment line and one
+  "symbol x y z" line per atom; the symbol may be an atomic number
+* SDF/MOL: the symbol in columns 32-34 of each atom block line, for every
+  molecule in the file
+* PDB: the element in columns 77-78 of ATOM/HETATM records, or from the
+  atom name in columns 13-16 if the element is missing
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import re
+
+#element symbol by atomic number and the canonical spelling of each symbol
+number_symbols = {}
+symbols = {}
+
+leading_letters = re.compile(r"[A-Za-z]+")
+
+
+def load_elements():
+    if symbols:
+        return
+    elt_path = os.path.join(os.path.dirname(__file__), "elts_abrev.dat")
+    with open(elt_path) as infile:
+        for line in infile:
+            fields = [f.strip() for f in line.split("-")]
+            if len(fields) >= 2 and fields[0].isdigit():
+                number_symbols[fields[0]] = fields[1]
+                symbols[fields[1].upper()] = fields[1]
+
+
+def element_symbol(label):
+    """Turn an atom label into an element symbol: "CL" or "Cl2" -> "Cl",
+    "6" -> "C".
+
+    @raise ValueError: if the label names no element
+    """
+
+    load_elements()
+    if label.isdigit():
+        try:
+            return number_symbols[str(int(label))]
+        except KeyError:
+            raise ValueError("No element with atomic number " + label)
+
+    match = leading_letters.match(label)
+    letters = match.group(0).upper() if match else ""
+    #labels such as "CA1" are tried as a two letter symbol, then one letter
+    for candidate in (letters[:2], letters[:1]):
+        if candidate in symbols:
+            return symbols[candidate]
+    raise ValueError("No element for atom label " + label)
+
+
+def xyz_labels(lines):
+    lines = iter(lines)
+    for count in lines:
+        if not count.strip():
+            continue
+        next(lines, None)
+        n_atoms = int(count.split()[0])
+        for i in range(n_atoms):
+            fields = (next(lines, None) or "").split()
+            if not fields:
+                raise ValueError("Truncated XYZ file: expected {0} atoms".format(n_atoms))
+            yield fields[0]
+
+
+def sdf_labels(lines):
+    lines = iter(lines)
+    while True:
+        header = [next(lines, None) for i in range(3)]
+        if header[-1] is None:
+            return
+        counts = next(lines, None)
+        if counts is None:
+            raise ValueError("Truncated SDF file: no counts line")
+        n_atoms = int(counts[:3])
+        for i in range(n_atoms):
+            line = next(lines, None)
+            if line is None:
+                raise ValueError("Truncated SDF file: expected {0} atoms".format(n_atoms))
+            yield line[31:34].strip()
+        #skip bonds and properties up to the next molecule
+        for line in lines:
+            if line.startswith("$$$$"):
+                break
+
+
+def pdb_labels(lines):
+    for line in lines:
+        if line.startswith("ATOM") or line.startswith("HETATM"):
+            element = line[76:78].strip()
+            if not element:
+                #the symbol is right-justified in columns 13-14 of the name,
+                #so " CA " is a carbon and "CA  " a calcium
+                name = line[12:16]
+                if name[:1].isalpha():
+                    element = name[:2]
+                else:
+                    element = name[1:2]
+            yield element
+
+
+def coordinate_labels(lines):
+    """First field of every line that has one, skipping XYZ count and
+    comment lines."""
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 4:
+            yield fields[0]
+
+
+def atom_labels(atoms):
+    """Symbol of every atom given as a "symbol x y z" string or as a
+    (symbol, x, y, z) sequence."""
+    for atom in atoms:
+        if hasattr(atom, "split"):
+            fields = atom.split()
+            if fields:
+                yield fields[0]
+        else:
+            yield str(atom[0])
+
+
+readers = {".xyz" : xyz_labels,
+           ".sdf" : sdf_labels,
+           ".mol" : sdf_labels,
+           ".pdb" : pdb_labels,
+           ".ent" : pdb_labels}
+
+
+def unique_elements(labels):
+    """Element symbols of labels, each once, in order of first appearance."""
+
+    seen = set()
+    elements = []
+    for label in labels:
+        if label not in seen:
+            seen.add(label)
+            symbol = element_symbol(label)
+            if symbol not in elements:
+                elements.append(symbol)
+    return elements
+
+
+def read_elements(path_or_coords):
+    """Get the distinct elements of a molecule.
+
+    A string is taken as a path if it names an existing file or has no
+    whitespace, and as coordinates otherwise.
+
+    @param path_or_coords: path of an XYZ, SDF/MOL or PDB file; or
+    coordinates as "symbol x y z" text lines, or a list of such lines or
+    of (symbol, x, y, z) tuples
+    @type path_or_coords : str or list
+    @return: element symbols in order of first appearance
+    @rtype : list
+    @raise ValueError: for an unknown file type or element, or a
+    truncated file
+    """
+
+    if not isinstance(path_or_coords, str) and not hasattr(path_or_coords, "splitlines"):
+        return unique_elements(atom_labels(path_or_coords))
+
+    if len(path_or_coords.split()) > 1 and not os.path.exists(path_or_coords):
+        return unique_elements(coordinate_labels(path_or_coords.splitlines()))
+
+    extension = os.path.splitext(path_or_coords)[1].lower()
+    try:
+        reader = readers[extension]
+    except KeyError:
+        raise ValueError("Unknown geometry file type: " + path_or_coords)
+
+    with open(path_or_coords) as infile:
+        return unique_elements(reader(infile))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Normalized basis set names and aliases.
+
+Databases store each basis set name normalized (see normalize_name) in
+basis_tab.norm_name, under a NOCASE index, so that a lookup by any
+spelling differing only in case or whitespace is one index search.
+
+Spellings that differ otherwise, such as 6-31G(d) for 6-31G*, are listed
+in aliases.dat and in any files named by the EBSEL_ALIASES environment
+variable, as "alias = name" lines.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+
+env_var = "EBSEL_ALIASES"
+
+#normalized alias -> name, from aliases.dat and EBSEL_ALIASES
+default_aliases = {}
+
+
+def normalize_name(name):
+    """Fold case and runs of whitespace: " 6-31g*" -> "6-31g*",
+    "DZVP  (DFT Orbital)" -> "dzvp (dft orbital)".
+
+    @param name: basis set name
+    @type name : str
+    @return: normalized name
+    @rtype : str
+    """
+
+    return " ".join(name.split()).lower()
+
+def read_aliases(path, aliases=None):
+    """Read an aliases file of "alias = name" lines; # starts a comment.
+
+    @param path: file to read
+    @type path : str
+    @param aliases: dict to add to, or None for a new one
+    @type aliases : dict
+    @return: normalized alias -> name
+    @rtype : dict
+    @raise ValueError: on a line that is not a comment or an alias
+    """
+
+    if aliases is None:
+        aliases = {}
+
+    with open(path) as infile:
+        for number, line in enumerate(infile, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            alias, sep, name = [f.strip() for f in line.rpartition("=")]
+            if not (sep and alias and name):
+                msg = "{0}:{1}: expected alias = name".format(path, number)
+                raise ValueError(msg)
+            aliases[normalize_name(alias)] = name
+
+    return aliases
+
+def load_aliases():
+    """Get the aliases of aliases.dat and of the EBSEL_ALIASES files.
+    They are read once.
+
+    @return: normalized alias -> name
+    @rtype : dict
+    """
+
+    if default_aliases:
+        return default_aliases
+
+    read_aliases(os.path.join(os.path.dirname(__file__), "aliases.dat"),
+                 default_aliases)
+    for path in os.environ.get(env_var, "").split(os.pathsep):
+        if path:
+            read_aliases(path, default_aliases)
+
+    return default_aliases
+
+def resolve_name(name, aliases):
+    """Get the name a spelling stands for: the aliased name if it is an
+    alias, otherwise the spelling itself.
+
+    @param name: basis set name as given
+    @type name : str
+    @param aliases: normalized alias -> name
+    @type aliases : dict
+    @return: basis set name
+    @rtype : str
+    """
+
+    return aliases.get(normalize_name(name), name)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""asyncio pipeline for building a basis set database with EMSL_dump.
+
+Downloads, extraction and SQLite inserts run as separate stages:
+
+* fetch: at most dump.num_workers downloads in flight, each run in a thread
+  pool through the dump's shared HTTP session
+* parse: the dump's extraction method, run in its own executor; with a
+  process pool, such as the dump's parse_pool, extraction runs through
+  extract_basis_data so that parsing never holds up the downloads
+* write: a single writer that owns the database connection and commits
+  finished basis sets in batches, checkpointing each one or recording it
+  in failure_tab
+
+Backpressure comes from max_pending, the number of basis sets that may be
+downloaded or parsed but not yet written. When the writer falls behind, no
+new downloads start until it catches up. If the writer fails, the downloads
+still in flight are cancelled and its error is raised from run.
+"""
+
+from __future__ import print_function, absolute_import
+import asyncio
+import functools
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .EMSL_dump import DownloadError, extract_basis_data
+
+
+class AsyncBuild(object):
+    def __init__(self, dump, max_pending=None, batch_size=None,
+                 parse_workers=1, parse_executor=None):
+        """Set up a pipelined build for one dump.
+
+        @param dump: dump configured with format, database path and
+        download settings
+        @type dump : EMSL_dump
+        @param max_pending: maximum basis sets fetched or parsed but not yet
+        written; defaults to four per download worker
+        @type max_pending : int
+        @param batch_size: maximum basis sets per write transaction;
+        defaults to dump.batch_size
+        @type batch_size : int
+        @param parse_workers: threads for extraction, if no parse_executor
+        @type parse_workers : int
+        @param parse_executor: executor to run extraction in
+        @type parse_executor : concurrent.futures.Executor
+        """
+
+        self.dump = dump
+        self.max_pending = max_pending or 4 * dump.num_workers
+        self.batch_size = batch_size or dump.batch_size
+        self.parse_workers = parse_workers
+        self.parse_executor = parse_executor
+
+    def run(self, list_basis_array):
+        """Build the database from the list of basis available data.
+
+        @param list_basis_array: [name, xml path, description, elements]
+        entries as produced by EMSL_dump.bl_raw_to_array
+        @type list_basis_array : list
+        @return: names of basis sets that could not be downloaded or parsed
+        @rtype : list
+        """
+
+        start = time.time()
+        loop = asyncio.new_event_loop()
+        try:
+            failed = loop.run_until_complete(self.build(list_basis_array))
+        finally:
+            loop.close()
+
+        self.dump.report_build(self.nb_basis - len(failed), self.rows,
+                               time.time() - start)
+        return failed
+
+    async def build(self, list_basis_array):
+        loop = asyncio.get_event_loop()
+        self.fetch_slots = asyncio.Semaphore(self.dump.num_workers)
+        #taken when a download starts and given back once the writer has
+        #stored the basis set, so the queue itself needs no bound
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.write_queue = asyncio.Queue()
+        self.failed = []
+        self.nb_done = 0
+        self.rows = 0
+
+        fetch_pool = ThreadPoolExecutor(self.dump.num_workers)
+        write_pool = ThreadPoolExecutor(1)
+        parse_pool = self.parse_executor
+        if parse_pool is None:
+            parse_pool = ThreadPoolExecutor(self.parse_workers)
+
+        conn, list_basis_array = await loop.run_in_executor(
+            write_pool, self.open_db, list_basis_array)
+        self.nb_basis = len(list_basis_array)
+        writer = asyncio.ensure_future(self.write_stage(conn, write_pool))
+        jobs = []
+
+        async def job(entry):
+            result, error = None, None
+            try:
+                result = await self.fetch_and_parse(entry, fetch_pool,
+                                                    parse_pool)
+            except Exception as e:
+                error = e
+            await self.write_queue.put((entry, result, error))
+            self.dump.metrics.queue_depth("insert", self.write_queue.qsize())
+
+        try:
+            for entry in list_basis_array:
+                await self.unless_failed(writer, self.pending.acquire())
+                jobs.append(asyncio.ensure_future(job(entry)))
+
+            await self.unless_failed(writer, asyncio.gather(*jobs))
+            await self.write_queue.put(None)
+            await writer
+            await loop.run_in_executor(write_pool, self.dump.finish_build,
+                                       conn)
+        finally:
+            for j in jobs:
+                j.cancel()
+            if not writer.done():
+                writer.cancel()
+            await asyncio.gather(writer, *jobs, return_exceptions=True)
+            await loop.run_in_executor(write_pool, conn.close)
+            fetch_pool.shutdown()
+            write_pool.shutdown()
+            if self.parse_executor is None:
+                parse_pool.shutdown()
+
+        return self.failed
+
+    async def unless_failed(self, writer, awaitable):
+        """Wait for awaitable, unless the writer stops first.
+
+        @param writer: the write stage's task
+        @type writer : asyncio.Future
+        @raise Exception: whatever the writer failed with
+        """
+
+        waiter = asyncio.ensure_future(awaitable)
+        await asyncio.wait([waiter, writer],
+                           return_when=asyncio.FIRST_COMPLETED)
+        if not waiter.done():
+            waiter.cancel()
+            writer.result()
+        return waiter.result()
+
+    def open_db(self, list_basis_array):
+        conn = sqlite3.connect(self.dump.db_path)
+        self.dump.begin_build(conn)
+        c = conn.cursor()
+        self.dump.create_tables(c)
+        conn.commit()
+        return conn, self.dump.pending_basis(c, list_basis_array)
+
+    async def fetch_and_parse(self, entry, fetch_pool, parse_pool):
+        """Download and extract one basis set, retrying the download when
+        either step fails.
+
+        @param entry: [name, xml path, description, elements]
+        @type entry : list
+        @return: (name, description, data-pairs)
+        @rtype : tuple
+        @raise DownloadError: if every attempt failed
+        """
+
+        loop = asyncio.get_event_loop()
+        name, path_xml, des, elts = entry[:4]
+        modified = entry[4] if len(entry) > 4 else None
+        url, params = self.dump.download_request(name, path_xml, elts)
+
+        if isinstance(parse_pool, ProcessPoolExecutor):
+            #bound methods would carry the whole dump to the process
+            extraction_method = functools.partial(extract_basis_data,
+                                                  self.dump.format,
+                                                  self.dump.debug)
+        else:
+            extraction_method = self.dump.get_extraction_method()
+
+        for attempt in range(self.dump.max_attempts):
+            text = None
+            async with self.fetch_slots:
+                try:
+                    text = await loop.run_in_executor(fetch_pool,
+                                                      self.dump.fetch,
+                                                      url, params, True,
+                                                      modified)
+                except Exception as e:
+                    error = e
+
+            if text is not None:
+                try:
+                    start = time.time()
+                    basis_data = await loop.run_in_executor(parse_pool,
+                                                            extraction_method,
+                                                            text, name, des,
+                                                            elts)
+                    self.dump.metrics.observe("parse", time.time() - start)
+                    self.dump.metrics.incr("parsed")
+                    await loop.run_in_executor(fetch_pool,
+                                               self.dump.archive_response,
+                                               url, params, text, modified)
+                    return basis_data
+                except Exception as e:
+                    error = e
+
+            if attempt + 1 < self.dump.max_attempts:
+                self.dump.metrics.incr("retried")
+                await asyncio.sleep(self.dump.backoff_delay(attempt))
+
+        raise DownloadError(name, self.dump.max_attempts, error)
+
+    async def write_stage(self, conn, write_pool):
+        """Insert finished basis sets, committing whatever has queued up,
+        up to batch_size basis sets, in one transaction.
+        """
+
+        loop = asyncio.get_event_loop()
+        finished = False
+
+        while not finished:
+            batch = []
+            item = await self.write_queue.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size or self.write_queue.empty():
+                    break
+                item = await self.write_queue.get()
+            finished = item is None
+
+            if batch:
+                await loop.run_in_executor(write_pool, self.write_batch,
+                                           conn, batch)
+                for item in batch:
+                    self.pending.release()
+
+    def write_batch(self, conn, batch):
+        c = conn.cursor()
+        for entry, result, error in batch:
+            self.nb_done += 1
+            name = entry[0]
+            stored = self.dump.store_basis(c, entry, result, error)
+            self.rows += stored
+            if not stored:
+                self.failed.append(name)
+                if self.dump.verbose:
+                    print('{:>3}'.format(self.nb_done), "/", self.nb_basis, name, "fail")
+            elif self.dump.verbose:
+                print('{:>3}'.format(self.nb_done), "/", self.nb_basis, name)
+        conn.commit()
+        self.dump.metrics.maybe_report()
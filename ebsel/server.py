@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Serve basis set lookups over HTTP, on a TCP port or a Unix socket, so
+that callers pay for process startup and opening the databases once.
+
+Endpoints, all GET, take their arguments as query parameters:
+
+* /list_formats
+* /list_basis?format=g94&atom=H&atom=C
+* /list_atoms?format=g94&basis=6-31G*
+* /get_basis_data?format=g94&basis=6-31G*&atom=H[&convert_from=nwchem]
+* /stats -- cache hits and misses
+
+Replies are JSON unless output=text is given, in which case they are the
+same text EMSL_api.py prints. Errors are JSON {"error": message} with
+status 400 for bad arguments and 404 for unknown endpoints.
+
+One EMSL_local is kept per format, and results are kept in a shared LRU
+cache. Requests are handled by a fixed pool of worker threads. A worker
+stays with its connection between keep-alive requests, so a connection idle
+for idle_timeout seconds is closed, and replies close the connection while
+other connections are waiting for a worker.
+"""
+
+from __future__ import print_function, absolute_import
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .EMSL_local import EMSL_local
+from .formats import db_map, format_dict
+
+if sys.version_info.major == 3:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import UnixStreamServer
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import UnixStreamServer
+    from urlparse import parse_qs, urlsplit
+
+
+class BadRequest(Exception):
+    pass
+
+
+class BasisService(object):
+    def __init__(self, db_paths=None, cache_size=1024):
+        """Set up lookups for every format with a database.
+
+        @param db_paths: database path by format short name, e.g. "g94";
+        formats not given use their bundled database
+        @type db_paths : dict
+        @param cache_size: maximum results kept in the cache
+        @type cache_size : int
+        """
+
+        self.db_paths = db_paths or {}
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.locals = {}
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def local(self, fmt):
+        """Get the long-lived EMSL_local for a format.
+
+        @raise BadRequest: if the format has no database
+        """
+
+        if fmt not in db_map and fmt not in self.db_paths:
+            raise BadRequest("Format {0} has no database".format(fmt))
+
+        with self.lock:
+            try:
+                return self.locals[fmt]
+            except KeyError:
+                el = EMSL_local(db_path=self.db_paths.get(fmt), fmt=fmt,
+                                debug=False)
+                self.locals[fmt] = el
+                return el
+
+    def cached(self, key, fn, *args):
+        """Get fn(*args) from the cache under key, computing and storing it
+        if it is not there. Concurrent misses on one key may both compute.
+        """
+
+        with self.lock:
+            try:
+                value = self.cache.pop(key)
+                self.cache[key] = value
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+
+        value = fn(*args)
+
+        with self.lock:
+            self.cache[key] = value
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return value
+
+    def list_basis(self, fmt, elements=[]):
+        el = self.local(fmt)
+        return self.cached(("list_basis", fmt, tuple(elements)),
+                           el.get_available_basis_sets, elements)
+
+    def list_atoms(self, fmt, basis_name):
+        el = self.local(fmt)
+        return self.cached(("list_atoms", fmt, basis_name),
+                           el.get_available_elements, basis_name)
+
+    def get_basis_data(self, fmt, basis_name, elements=[], convert_from=""):
+        el = self.local(fmt)
+        if convert_from not in ("", "nwchem", "g94"):
+            raise BadRequest("Conversion from {0} not implemented".format(convert_from))
+        return self.cached(("get_basis_data", fmt, basis_name,
+                            tuple(elements), convert_from),
+                           el.get_basis, basis_name, elements, convert_from)
+
+    def stats(self):
+        with self.lock:
+            return {"formats" : sorted(self.locals),
+                    "cached" : len(self.cache),
+                    "hits" : self.hits,
+                    "misses" : self.misses}
+
+
+class BasisHandler(BaseHTTPRequestHandler):
+    """Answer one request from the server's BasisService."""
+
+    protocol_version = "HTTP/1.1"
+    #seconds allowed for any socket operation within a request; between
+    #requests the server's shorter idle_timeout applies
+    timeout = 30
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.connection.settimeout(self.server.idle_timeout)
+            self.handle_one_request()
+
+    def parse_request(self):
+        #the request line has arrived
+        self.connection.settimeout(self.timeout)
+        return BaseHTTPRequestHandler.parse_request(self)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        endpoint = url.path.strip("/")
+        as_text = query.get("output", ["json"])[0] == "text"
+
+        try:
+            method = getattr(self, "endpoint_" + endpoint, None)
+            if method is None:
+                self.reply_json(404, {"error" : "No such endpoint: " + url.path})
+                return
+            value, text = method(query)
+        except BadRequest as e:
+            self.reply_json(400, {"error" : str(e)})
+            return
+        except Exception as e:
+            self.server.handle_error(self.request, self.client_address)
+            self.reply_json(500, {"error" : str(e)})
+            return
+
+        if as_text:
+            self.reply(200, text, "text/plain; charset=utf-8")
+        else:
+            self.reply_json(200, value)
+
+    def argument(self, query, name, default=None):
+        try:
+            return query[name][0]
+        except KeyError:
+            if default is None:
+                raise BadRequest("Missing argument: " + name)
+            return default
+
+    def endpoint_list_formats(self, query):
+        formats = sorted(format_dict)
+        return formats, "\n".join(formats)
+
+    def endpoint_list_basis(self, query):
+        fmt = self.argument(query, "format", "gamess-us")
+        names = self.server.service.list_basis(fmt, query.get("atom", []))
+        value = [{"name" : name, "description" : des} for name, des in names]
+        text = "\n".join("{} - '{}' || {:<50}".format(i + 1, name, des)
+                         for i, (name, des) in enumerate(names))
+        return value, text
+
+    def endpoint_list_atoms(self, query):
+        fmt = self.argument(query, "format", "gamess-us")
+        elements = self.server.service.list_atoms(fmt, self.argument(query, "basis"))
+        return elements, ", ".join(elements)
+
+    def endpoint_get_basis_data(self, query):
+        fmt = self.argument(query, "format", "gamess-us")
+        basis_name = self.argument(query, "basis")
+        blocks = self.server.service.get_basis_data(
+            fmt, basis_name, query.get("atom", []),
+            self.argument(query, "convert_from", ""))
+        if not blocks:
+            raise BadRequest("No data for basis set {0}".format(basis_name))
+        return blocks, "\n\n".join(blocks) + "\n"
+
+    def endpoint_stats(self, query):
+        stats = self.server.service.stats()
+        return stats, "\n".join("{0}: {1}".format(k, v) for k, v in sorted(stats.items()))
+
+    def reply_json(self, status, value):
+        self.reply(status, json.dumps(value), "application/json")
+
+    def reply(self, status, body, content_type):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.waiting:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        #Unix socket peers have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class PoolMixIn(object):
+    """Handle each request in a fixed pool of threads, rather than the
+    thread per request of socketserver.ThreadingMixIn."""
+
+    def setup_pool(self, service, workers, verbose, idle_timeout):
+        self.service = service
+        self.verbose = verbose
+        self.idle_timeout = idle_timeout
+        self.pool = ThreadPoolExecutor(workers)
+        #connections accepted but not yet taken by a worker
+        self.waiting = 0
+        self.waiting_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.waiting_lock:
+            self.waiting += 1
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        with self.waiting_lock:
+            self.waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super(PoolMixIn, self).server_close()
+        self.pool.shutdown(wait=False)
+
+
+class BasisHTTPServer(PoolMixIn, HTTPServer):
+    def __init__(self, address, service, workers=4, verbose=True,
+                 idle_timeout=2.0):
+        HTTPServer.__init__(self, address, BasisHandler)
+        self.setup_pool(service, workers, verbose, idle_timeout)
+
+
+class BasisUnixServer(PoolMixIn, UnixStreamServer):
+    def __init__(self, path, service, workers=4, verbose=True,
+                 idle_timeout=2.0):
+        if os.path.exists(path):
+            os.unlink(path)
+        UnixStreamServer.__init__(self, path, BasisHandler)
+        self.setup_pool(service, workers, verbose, idle_timeout)
+
+    def server_close(self):
+        PoolMixIn.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def make_server(service, host="127.0.0.1", port=8000, socket_path=None,
+                workers=4, verbose=True, idle_timeout=2.0):
+    """Make a basis set server, listening on a Unix socket if socket_path
+    is given or else on host:port. Run it with serve_forever().
+
+    @param service: lookups to serve
+    @type service : BasisService
+    @param port: TCP port, 0 for any free port
+    @type port : int
+    @param socket_path: path of the Unix socket
+    @type socket_path : str
+    @param workers: threads answering requests
+    @type workers : int
+    @param verbose: log every request to stderr
+    @type verbose : bool
+    @param idle_timeout: seconds a keep-alive connection may wait for its
+    next request while holding a worker
+    @type idle_timeout : float
+    @rtype : BasisHTTPServer or BasisUnixServer
+    """
+
+    if socket_path:
+        return BasisUnixServer(socket_path, service, workers, verbose,
+                               idle_timeout)
+    return BasisHTTPServer((host, port), service, workers, verbose,
+                           idle_timeout)
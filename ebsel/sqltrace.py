@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""Tracing of the SQL run by EMSL_local.
+
+An SQLTrace attached to a connection records, for every query, the
+statement as SQLite ran it with its parameters bound, the rows returned,
+the wall time, the approximate number of virtual machine steps (from the
+progress handler) and the EXPLAIN QUERY PLAN output. Plans that visit
+every row of a table or index are flagged as full scans.
+
+Tracing is switched on per EMSL_local with trace=True (or a shared
+SQLTrace), or for every EMSL_local in the process by setting the
+environment variable EBSEL_SQL_TRACE to anything but "" or "0". The
+environment variable prints each query to stderr as it runs, and a
+summary of the slowest queries when the process exits.
+"""
+
+from __future__ import print_function, absolute_import
+import atexit
+import os
+import re
+import sys
+import threading
+import time
+
+clock = getattr(time, "perf_counter", time.time)
+
+env_var = "EBSEL_SQL_TRACE"
+
+#the process-wide trace turned on by env_var
+_session = None
+
+
+class SQLTrace(object):
+    def __init__(self, stream=None, explain=True, progress_steps=100):
+        """Set up a trace.
+
+        @param stream: file to print each query to as it runs, or None
+        @type stream : file
+        @param explain: whether to get EXPLAIN QUERY PLAN for each query
+        @type explain : bool
+        @param progress_steps: virtual machine instructions per call of the
+        progress handler, i.e. the resolution of the step counts
+        @type progress_steps : int
+        """
+
+        self.stream = stream
+        self.explain = explain
+        self.progress_steps = progress_steps
+        self.lock = threading.Lock()
+        #statements and progress calls seen by the callbacks, per thread
+        self.local = threading.local()
+        self.queries = []
+
+    def attach(self, conn):
+        """Install the trace and progress callbacks on a connection.
+
+        @param conn: connection to trace
+        @type conn : sqlite3.Connection
+        """
+
+        conn.set_trace_callback(self.traced)
+        conn.set_progress_handler(self.progressed, self.progress_steps)
+
+    #the callbacks also see statements run on the connection outside of
+    #execute, such as PRAGMAs, which are not recorded
+
+    def traced(self, statement):
+        statements = getattr(self.local, "statements", None)
+        if statements is not None:
+            statements.append(statement)
+
+    def progressed(self):
+        self.local.steps = getattr(self.local, "steps", 0) + 1
+        #returning non-zero, or raising, would abort the query
+        return 0
+
+    def plan(self, c, cmd, params):
+        """Get the query plan of a statement, indented by depth.
+
+        @return: plan lines
+        @rtype : list
+        """
+
+        c.execute("EXPLAIN QUERY PLAN " + cmd, params)
+        depths = {0 : -1}
+        lines = []
+        for row in c.fetchall():
+            node, parent, detail = row[0], row[1], row[-1]
+            depths[node] = depths.get(parent, -1) + 1
+            lines.append("  " * depths[node] + detail)
+        return lines
+
+    def execute(self, c, cmd, params=()):
+        """Run a query on a cursor of an attached connection, fetch all its
+        rows and record it.
+
+        @param c: cursor
+        @type c : sqlite3.Cursor
+        @param cmd: SQL statement
+        @type cmd : str
+        @param params: parameters to bind
+        @type params : tuple or dict
+        @return: rows
+        @rtype : list
+        """
+
+        self.local.statements = []
+        self.local.steps = 0
+        start = clock()
+        c.execute(cmd, params)
+        rows = c.fetchall()
+        seconds = clock() - start
+        statements = self.local.statements
+        steps = self.local.steps * self.progress_steps
+
+        plan = self.plan(c, cmd, params) if self.explain else []
+        record = {"sql" : bound_statement(statements, cmd),
+                  "cmd" : cmd,
+                  "params" : params,
+                  "rows" : len(rows),
+                  "seconds" : seconds,
+                  "steps" : steps,
+                  "plan" : plan,
+                  "full_scans" : [p.strip() for p in plan if is_full_scan(p)]}
+        with self.lock:
+            self.queries.append(record)
+            if self.stream is not None:
+                print(format_query(record), file=self.stream)
+        return rows
+
+    def slowest(self, n=10):
+        """Get the records of the slowest queries.
+
+        @param n: number of queries
+        @type n : int
+        @return: query records, slowest first
+        @rtype : list
+        """
+
+        with self.lock:
+            queries = list(self.queries)
+        queries.sort(key=lambda q: -q["seconds"])
+        return queries[:n]
+
+    def summary(self, n=10):
+        """Describe the traced queries: totals, the statements that did
+        full scans and the n slowest queries.
+
+        @param n: number of slowest queries to show
+        @type n : int
+        @return: report text
+        @rtype : str
+        """
+
+        with self.lock:
+            queries = list(self.queries)
+        total = sum(q["seconds"] for q in queries)
+        lines = ["{0} queries, {1:.3f} ms total".format(len(queries), total * 1000)]
+
+        scanning = {}
+        for q in queries:
+            if q["full_scans"]:
+                scanning[q["cmd"]] = scanning.get(q["cmd"], 0) + 1
+        if scanning:
+            lines.append("")
+            lines.append("Full scans:")
+            for cmd in sorted(scanning, key=lambda k: -scanning[k]):
+                lines.append("  x{0}  {1}".format(scanning[cmd], one_line(cmd)))
+
+        lines.append("")
+        lines.append("Slowest queries:")
+        for q in self.slowest(n):
+            lines.append(format_query(q))
+        return "\n".join(lines)
+
+
+def is_full_scan(plan_line):
+    """Tell whether a query plan line visits every row of a table or of
+    one of its indexes, rather than searching for rows. A name filter
+    whose collation differs from its index's shows up as a scan of the
+    whole index."""
+
+    detail = plan_line.strip()
+    return detail.startswith("SCAN") and "SUBQUERY" not in detail and \
+        "CONSTANT ROW" not in detail and "VIRTUAL TABLE" not in detail
+
+def one_line(sql):
+    return " ".join(sql.split())
+
+def bound_statement(statements, cmd):
+    """Pick the statement that ran cmd from those the trace callback saw,
+    which include statements run by SQLite itself, e.g. for FTS5 tables.
+
+    @param statements: statements in the order traced, parameters bound
+    @type statements : list
+    @param cmd: SQL statement as given, with placeholders
+    @type cmd : str
+    @return: the bound statement, or cmd if it was not seen
+    @rtype : str
+    """
+
+    prefix = one_line(re.split(r"[?:]", cmd, 1)[0])
+    for statement in statements:
+        if one_line(statement).startswith(prefix):
+            return statement
+    return cmd
+
+def format_query(record):
+    lines = ["-- {0:.3f} ms, {1} rows, ~{2} steps{3}".format(
+        record["seconds"] * 1000, record["rows"], record["steps"],
+        ", FULL SCAN" if record["full_scans"] else ""),
+             one_line(record["sql"])]
+    lines += ["   " + p for p in record["plan"]]
+    return "\n".join(lines)
+
+def session_trace():
+    """Get the process-wide trace if EBSEL_SQL_TRACE is set.
+
+    @return: the trace, or None
+    @rtype : SQLTrace
+    """
+
+    global _session
+
+    if os.environ.get(env_var, "0") in ("", "0"):
+        return None
+    if _session is None:
+        _session = SQLTrace(stream=sys.stderr)
+        atexit.register(lambda: print(_session.summary(), file=sys.stderr))
+    return _session
@@ -7,6 +7,12 @@
 
 Usage:
   EMSL_api.py list_basis        [--atom=<atom_name>...]
+                                [--molecule=<geometry_path>]
+                                [--db_path=<db_path>]
+                                [--format=<format>]
+  EMSL_api.py search <query>    [--atom=<atom_name>...]
+                                [--molecule=<geometry_path>]
+                                [--limit=<n>]
                                 [--db_path=<db_path>]
                                 [--format=<format>]
   EMSL_api.py list_atoms  --basis=<basis_name>
@@ -14,13 +20,46 @@ Usage:
                                 [--format=<format>]
   EMSL_api.py get_basis_data --basis=<basis_name>
                                 [--atom=<atom_name>...]
+                                [--molecule=<geometry_path>]
                                 [--db_path=<db_path>]
                                 [(--save [--path=<path>])]
                                 [--format=<format>]
   EMSL_api.py list_formats
+  EMSL_api.py batch          --manifest=<manifest_path>
+                             [--outdir=<outdir>] [--workers=<n>]
   EMSL_api.py create_db      --db_path=<db_path>
                              --format=<format>
                              [--no-contraction]
+                             [--workers=<n>]
+                             [--parse_workers=<n>]
+                             [--rate_limit=<per_second>]
+                             [--pipeline=<pipeline>]
+                             [--resume [--skip_failed]]
+                             [--bulk_load [--batch_size=<n>]]
+                             [--archive=<archive_path> [--offline]]
+                             [--compression=<codec>] [--dedup]
+                             [--quiet] [--metrics_log=<log_path>]
+  EMSL_api.py update_db      --db_path=<db_path>
+                             --format=<format>
+                             [--no-contraction]
+                             [--workers=<n>]
+                             [--parse_workers=<n>]
+                             [--rate_limit=<per_second>]
+                             [--pipeline=<pipeline>]
+                             [--archive=<archive_path> [--offline]]
+                             [--compression=<codec>] [--dedup]
+                             [--quiet] [--metrics_log=<log_path>]
+  EMSL_api.py fill_archive   --archive=<archive_path>
+                             [--no-contraction]
+                             [--workers=<n>]
+                             [--rate_limit=<per_second>]
+  EMSL_api.py optimize       [--db_path=<db_path>] [--format=<format>]
+                             [--page_size=<bytes>] [--no-vacuum]
+                             [--compression=<codec>] [--dedup]
+  EMSL_api.py serve          [--host=<host>] [--port=<port>]
+                             [--socket=<socket_path>]
+                             [--db_path=<db_path> --format=<format>]
+                             [--workers=<n>] [--quiet]
   EMSL_api.py (-h | --help)
   EMSL_api.py --version
 
@@ -28,12 +67,73 @@ Options:
   -h --help         Show this screen.
   --version         Show version.
   --no-contraction  Basis functions are not contracted
+  --workers=<n>     Number of concurrent downloads [default: 4]
+  --parse_workers=<n>  Processes extracting downloaded data, 0 for none [default: 0]
+  --rate_limit=<per_second>  Maximum requests per second to the BSE host
+  --pipeline=<pipeline>  Build with "threads" or "asyncio" [default: threads]
+  --resume          Continue an interrupted create_db, skipping finished basis sets
+  --skip_failed     When resuming, do not retry basis sets that failed before
+  --bulk_load       Load through a write-ahead log, many basis sets per commit
+  --batch_size=<n>  Basis sets per transaction when batching [default: 50]
+  --archive=<archive_path>  Directory of recorded BSE responses to read and fill
+  --offline         Build from the archive only, without the network
+  --quiet           Do not print a line per download and per basis set
+  --metrics_log=<log_path>  Append build metrics to this file as JSON lines
+  --molecule=<geometry_path>  Take the atoms from an XYZ, SDF or PDB file
+  --limit=<n>       Maximum number of search results [default: 20]
+  --manifest=<manifest_path>  JSON-lines or CSV file of get_basis_data jobs
+  --outdir=<outdir>  Directory for the outputs of batch jobs [default: .]
+  --page_size=<bytes>  Database page size set by optimize [default: 4096]
+  --no-vacuum       Do not rewrite the database file when optimizing
+  --compression=<codec>  Store basis set data compressed, zlib or zlib-dict
+  --dedup           Store each distinct block of basis set data once
+  --host=<host>     Address for serve to listen on [default: 127.0.0.1]
+  --port=<port>     Port for serve to listen on [default: 8000]
+  --socket=<socket_path>  Listen on this Unix socket instead of a port
 
 <db_path> is the path to the SQLite3 file containing the Basis sets.
 By default is $EMSL_API_ROOT/db/Gausian_uk.db
 
+search finds basis sets by words of their names and descriptions, best
+matches first, e.g. search "triple zeta polarization" --atom Se. Every word
+must start a word of the name or description.
+
+create_db --format=all builds the gamess-us, nwchem and g94 databases in one
+pass, sharing the catalog and the download workers; <db_path> is then the
+directory that receives Gamess-us.db, NWChem.db and Gaussian94.db.
+
+batch runs many get_basis_data jobs in one process. Each manifest line has a
+basis, an output file and optionally atoms, format, db_path and convert_from,
+e.g. {"basis": "6-31G*", "atoms": ["C", "H"], "format": "g94", "output": "ch.gbs"}
+or, in CSV with a header row, atoms separated by spaces. Identical requests
+are looked up once and --workers threads run them.
+
+serve answers list_basis, list_atoms, get_basis_data and list_formats
+requests over HTTP, as JSON or, with output=text, as the commands print them,
+e.g. GET /list_atoms?format=g94&basis=6-31G*. --workers is the number of
+threads answering requests; --db_path serves that database for --format.
+
+optimize tunes an existing database in place for reading: it brings the
+tables up to date, adds the lookup and search indexes, runs ANALYZE and
+VACUUMs with --page_size. Without --db_path it optimizes the bundled
+database of --format; --format=all optimizes all three, in the --db_path
+directory if given.
+
+--compression stores basis set data as zlib streams, which makes the
+databases several times smaller; zlib-dict also trains a small preset
+dictionary on the database's own data. Lookups read either kind of
+database, and optimize --compression compresses an existing one.
+
+--dedup keeps identical blocks of basis set data, e.g. the H and He blocks
+shared by many Pople basis sets, once in the database, addressed by a hash
+of their contents. optimize reports how much space it saves, or would save.
+
+update_db refreshes a database made by create_db, downloading only the basis
+sets that are new or were modified in the BSE catalog since it was built.
+
 Example of use:
     ./EMSL_api.py list_basis --atom Al --atom U
+    ./EMSL_api.py search "double zeta" --atom Al
     ./EMSL_api.py list_atoms --basis ANO-RCC
     ./EMSL_api.py get_basis_data --basis 3-21++G*
 """
@@ -42,15 +142,22 @@ from __future__ import print_function, absolute_import
 
 
 
+import os
 import sys
 from ebsel import version
 from ebsel.docopt import docopt
-from ebsel.EMSL_dump import EMSL_dump
-from ebsel.EMSL_local import EMSL_local
+from ebsel.formats import format_dict, db_map
 
-db_map = {"gamess-us" : "db/Gamess-us.db",
-          "nwchem" : "db/NWChem.db",
-          "g94" : "db/Gaussian94.db"}
+def requested_elements(arguments):
+    """Get the elements of --atom followed by those of the --molecule file
+    that are not already among them.
+    """
+
+    elts = arguments["--atom"]
+    if arguments["--molecule"]:
+        from ebsel.molecule import read_elements
+        elts += [x for x in read_elements(arguments["--molecule"]) if x not in elts]
+    return elts
 
 if __name__ == '__main__':
 
@@ -62,8 +169,10 @@ if __name__ == '__main__':
     #
     format = arguments["--format"] or "gamess-us"
 
-    format_dict = EMSL_dump().get_list_format()
-    if format not in format_dict:
+    #a static lookup: making an EMSL_dump would pull in requests
+    build_db = arguments["create_db"] or arguments["update_db"]
+    build_all = (build_db or arguments["optimize"]) and format == "all"
+    if format not in format_dict and not build_all:
         print("Format %s doesn't exist. Run list_formats to get the list of formats." % (format))
         sys.exit(1)
 
@@ -80,9 +189,10 @@ if __name__ == '__main__':
     # \_____/_|___/\__| \____/ \__,_|___/_|___/
 
     if arguments["list_basis"]:
-        e = EMSL_local(fmt=format)
+        from ebsel.EMSL_local import EMSL_local
+        e = EMSL_local(db_path=db_path, fmt=format)
 
-        elts = arguments["--atom"]
+        elts = requested_elements(arguments)
         l = e.get_available_basis_sets(elts)
 
         ct = 1
@@ -90,6 +200,24 @@ if __name__ == '__main__':
             print("{} - '{}' || {:<50}".format(ct, name, des))
             ct += 1
 
+    #  _____                     _
+    # /  ___|                   | |
+    # \ `--.  ___  __ _ _ __ ___| |__
+    #  `--. \/ _ \/ _` | '__/ __| '_ \
+    # /\__/ /  __/ (_| | | | (__| | | |
+    # \____/ \___|\__,_|_|  \___|_| |_|
+    if arguments["search"]:
+        from ebsel.EMSL_local import EMSL_local
+        e = EMSL_local(db_path=db_path, fmt=format)
+
+        elts = requested_elements(arguments)
+        l = e.search(arguments["<query>"], elts, int(arguments["--limit"]))
+
+        ct = 1
+        for name, des in l:
+            print("{} - '{}' || {:<50}".format(ct, name, des))
+            ct += 1
+
     #  _     _     _     _____ _                           _
     # | |   (_)   | |   |  ___| |                         | |
     # | |    _ ___| |_  | |__ | | ___ _ __ ___   ___ _ __ | |_ ___
@@ -97,7 +225,8 @@ if __name__ == '__main__':
     # | |___| \__ \ |_  | |___| |  __/ | | | | |  __/ | | | |_\__ \
     # \_____/_|___/\__| \____/|_|\___|_| |_| |_|\___|_| |_|\__|___/
     if arguments["list_atoms"]:
-        e = EMSL_local(fmt=format)
+        from ebsel.EMSL_local import EMSL_local
+        e = EMSL_local(db_path=db_path, fmt=format)
 
         basis_name = arguments["--basis"]
         l = e.get_available_elements(basis_name)
@@ -110,9 +239,10 @@ if __name__ == '__main__':
     # | |_/ / (_| \__ \ \__ \ | (_| | (_| | || (_| |
     # \____/ \__,_|___/_|___/  \__,_|\__,_|\__\__,_|
     if arguments["get_basis_data"]:
-        e = EMSL_local(fmt=format)
+        from ebsel.EMSL_local import EMSL_local
+        e = EMSL_local(db_path=db_path, fmt=format)
         basis_name = arguments["--basis"]
-        elts = arguments["--atom"]
+        elts = requested_elements(arguments)
 
         l = e.get_basis(basis_name, elts)
         str_ = "\n\n".join(l) + "\n"
@@ -138,22 +268,171 @@ if __name__ == '__main__':
     # | |___| \__ \ |_  | || (_) | |  | | | | | | (_| | |_\__ \
     # \_____/_|___/\__| |_| \___/|_|  |_| |_| |_|\__,_|\__|___/
     if arguments["list_formats"]:
-        e = EMSL_dump()
-        for i in e.get_list_format():
+        for i in format_dict:
             print(i)
 
+    # ______       _       _
+    # | ___ \     | |     | |
+    # | |_/ / __ _| |_ ___| |__
+    # | ___ \/ _` | __/ __| '_ \
+    # | |_/ / (_| | || (__| | | |
+    # \____/ \__,_|\__\___|_| |_|
+    if arguments["batch"]:
+        from ebsel.batch import read_manifest, run_batch
+
+        jobs = read_manifest(arguments["--manifest"])
+        report = run_batch(jobs, outdir=arguments["--outdir"],
+                           workers=int(arguments["--workers"]))
+        for output, error in report["failed"]:
+            print("{0}: {1}".format(output, error), file=sys.stderr)
+        print("{0} files written for {1} jobs ({2} lookups)".format(
+            report["written"], report["jobs"], report["requests"]))
+        if report["failed"]:
+            sys.exit(1)
+
     #  _____                _             _ _
     # /  __ \              | |           | | |
     # | /  \/_ __ ___  __ _| |_ ___    __| | |__
     # | |   | '__/ _ \/ _` | __/ _ \  / _` | '_ \
     # | \__/\ | |  __/ (_| | ||  __/ | (_| | |_) |
     #  \____/_|  \___|\__,_|\__\___|  \__,_|_.__/
-    if arguments["create_db"]:
+    if build_db:
+        from ebsel.EMSL_dump import EMSL_dump, new_dbs
+        from ebsel.metrics import BuildMetrics
+
         db_path = arguments["--db_path"]
         contraction = not arguments["--no-contraction"]
+        num_workers = int(arguments["--workers"])
+        parse_workers = int(arguments["--parse_workers"])
+        rate_limit = arguments["--rate_limit"]
+        if rate_limit:
+            rate_limit = float(rate_limit)
+        metrics = BuildMetrics(log_path=arguments["--metrics_log"])
+        verbose = not arguments["--quiet"]
+
+    if build_db and build_all:
+        if not os.path.isdir(db_path):
+            os.makedirs(db_path)
+        db_paths = dict((fmt, os.path.join(db_path, os.path.basename(path)))
+                        for fmt, path in db_map.items())
+
+        new_dbs(db_paths,
+                contraction=contraction,
+                num_workers=num_workers,
+                parse_workers=parse_workers,
+                rate_limit=rate_limit,
+                resume=arguments["--resume"],
+                skip_failed=arguments["--skip_failed"],
+                bulk_load=arguments["--bulk_load"],
+                batch_size=int(arguments["--batch_size"]),
+                archive=arguments["--archive"],
+                offline=arguments["--offline"],
+                update=arguments["update_db"],
+                verbose=verbose,
+                metrics=metrics,
+                compression=arguments["--compression"],
+                dedup=arguments["--dedup"])
 
+    elif build_db:
         e = EMSL_dump(
             db_path=db_path,
             format=format_dict[format],
-            contraction=contraction)
+            contraction=contraction,
+            num_workers=num_workers,
+            parse_workers=parse_workers,
+            rate_limit=rate_limit,
+            pipeline=arguments["--pipeline"],
+            resume=arguments["--resume"],
+            skip_failed=arguments["--skip_failed"],
+            bulk_load=arguments["--bulk_load"],
+            batch_size=int(arguments["--batch_size"]),
+            archive=arguments["--archive"],
+            offline=arguments["--offline"],
+            update=arguments["update_db"],
+            verbose=verbose,
+            metrics=metrics,
+            compression=arguments["--compression"],
+            dedup=arguments["--dedup"])
         e.new_db()
+
+    # ______ _ _ _                  _     _
+    # |  ___(_) | |                | |   (_)
+    # | |_   _| | |   __ _ _ __ ___| |__  ___   _____
+    # |  _| | | | |  / _` | '__/ __| '_ \| \ \ / / _ \
+    # | |   | | | | | (_| | | | (__| | | | |\ V /  __/
+    # \_|   |_|_|_|  \__,_|_|  \___|_| |_|_| \_/ \___|
+    if arguments["fill_archive"]:
+        from ebsel.EMSL_dump import fill_archive
+
+        rate_limit = arguments["--rate_limit"]
+        if rate_limit:
+            rate_limit = float(rate_limit)
+
+        failed = fill_archive(arguments["--archive"],
+                              contraction=not arguments["--no-contraction"],
+                              num_workers=int(arguments["--workers"]),
+                              rate_limit=rate_limit)
+        for fmt in sorted(failed):
+            if failed[fmt]:
+                print("{0} failures: {1}".format(fmt, failed[fmt]))
+
+    #  _____       _   _           _
+    # |  _  |     | | (_)         (_)
+    # | | | |_ __ | |_ _ _ __ ___  _ _______
+    # | | | | '_ \| __| | '_ ` _ \| |_  / _ \
+    # \ \_/ / |_) | |_| | | | | | | |/ /  __/
+    #  \___/| .__/ \__|_|_| |_| |_|_/___\___|
+    #       | |
+    #       |_|
+    if arguments["optimize"]:
+        from ebsel.EMSL_dump import dedup_report, optimize_db
+        from ebsel.EMSL_local import EMSL_local
+
+        formats = sorted(db_map) if build_all else [format]
+        for fmt in formats:
+            if build_all and db_path:
+                path = os.path.join(db_path, os.path.basename(db_map[fmt]))
+            else:
+                path = db_path or EMSL_local(fmt=fmt).db_path
+            result = optimize_db(path, fmt,
+                                 page_size=int(arguments["--page_size"]),
+                                 vacuum=not arguments["--no-vacuum"],
+                                 compression=arguments["--compression"],
+                                 dedup=arguments["--dedup"])
+            print("{0}: {1} -> {2} bytes in {3:.1f} s, added {4}".format(
+                path, result["size_before"], result["size_after"],
+                result["seconds"], ", ".join(result["added"]) or "nothing"))
+            if result["compressed"]:
+                print("compressed {0} blocks".format(result["compressed"]))
+            dedup = dedup_report(path)
+            print("{0} of {1} blocks are distinct; storing each once {2} {3} bytes ({4:.1%})".format(
+                dedup["unique_blocks"], dedup["blocks"],
+                "saves" if dedup["in_block_tab"] else "would save",
+                dedup["saved_bytes"], dedup["saved_fraction"]))
+
+    #  _____
+    # /  ___|
+    # \ `--.  ___ _ ____   _____
+    #  `--. \/ _ \ '__\ \ / / _ \
+    # /\__/ /  __/ |   \ V /  __/
+    # \____/ \___|_|    \_/ \___|
+    if arguments["serve"]:
+        from ebsel.server import BasisService, make_server
+
+        db_paths = {}
+        if db_path:
+            db_paths[format] = db_path
+        server = make_server(BasisService(db_paths),
+                             host=arguments["--host"],
+                             port=int(arguments["--port"]),
+                             socket_path=arguments["--socket"],
+                             workers=int(arguments["--workers"]),
+                             verbose=not arguments["--quiet"])
+        print("Serving on {0}".format(server.server_address))
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
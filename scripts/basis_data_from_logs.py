@@ -7,18 +7,40 @@
 dummy single-atom calculations and processing the output.
 
 Usage:
-  ./scripts/basis_data_from_logs.py name-of-quantum-chemistry-program
+  basis_data_from_logs.py [--workers=<n>] [--timeout=<seconds>]
+                          [--batch=<n>] <qc_exe>
+  basis_data_from_logs.py (-h | --help)
+
+Options:
+  -h --help              Show this screen.
+  --workers=<n>          Calculations to run at once [default: 1]
+  --timeout=<seconds>    Kill calculations that run longer than this
+  --batch=<n>            Elements per calculation [default: 1]
+
+Calculations run in a pool of --workers threads, and each finished log is
+parsed in the background while the others run. Finished calculations are
+recorded in a manifest in the work directory, so that an interrupted run
+can be restarted without repeating them.
+
+With --batch, each calculation holds atoms of up to that many elements,
+spaced far apart, and the log is split back into per-element data; the
+elements missing from a calculation's results are then run on their own.
 """
 
 from __future__ import print_function, absolute_import
+import json
 import os
-import sys
+import signal
+import subprocess
+import threading
+import time
 
 workdir = "/tmp/basis_data_from_logs"
 
-from ..ebsel import conversion
+from ebsel import conversion
+from ebsel.docopt import docopt
 
-def write_one_job(basis_set_name, element):
+def write_one_job(basis_set_name, element, workdir=workdir):
     filename = "{}/{}__{}.com".format(workdir, basis_set_name, element)
     deck = """#n UHF/{basis} Guess=Only gfinput
 
@@ -34,12 +56,77 @@ def write_one_job(basis_set_name, element):
 
     return filename
 
-def run_one_job(filename, qc_exe):
-    for r in ["*", "(", ")", "'", " ", ","]:
-        filename = filename.replace(r, "\\" + r)
-    cmd = "{0} {1}".format(qc_exe, filename)
-    print(cmd)
-    os.system(cmd)
+def write_batch_job(c, basis_set_name, elements, workdir=workdir,
+                    spacing=50.0):
+    """Write one guess-only deck holding an atom of each element, spaced
+    far apart along x.
+
+    @param c: converter, for atomic numbers
+    @type c : Converter
+    @param elements: element symbols
+    @type elements : list
+    @param spacing: distance between neighbouring atoms, in Angstroms
+    @type spacing : float
+    @return: deck file name
+    @rtype : str
+    """
+
+    filename = "{}/{}__{}-{}.com".format(workdir, basis_set_name, elements[0],
+                                         elements[-1])
+    atoms = ["{:<2}        {:10.5f}        0.00000        0.00000".format(element, i * spacing)
+             for i, element in enumerate(elements)]
+    #singlet for an even number of electrons, else doublet
+    electrons = sum(c.get_atomic_number(element) for element in elements)
+    deck = """#n UHF/{basis} Guess=Only gfinput
+
+ Title
+
+0 {multiplicity}
+{atoms}
+
+
+""".format(basis=basis_set_name, multiplicity=1 + electrons % 2,
+           atoms="\n".join(atoms))
+    with open(filename, "w") as outfile:
+        outfile.write(deck)
+
+    return filename
+
+def run_one_job(filename, qc_exe, timeout=None):
+    """Run the program on one input deck.
+
+    @param filename: input deck
+    @type filename : str
+    @param qc_exe: quantum chemistry program
+    @type qc_exe : str
+    @param timeout: seconds after which the program is killed, or None
+    @type timeout : float
+    @return: exit status, or None if the program was killed
+    @rtype : int
+    """
+
+    cmd = [qc_exe, filename]
+    print(" ".join(cmd))
+    if timeout is None:
+        return subprocess.call(cmd)
+
+    #in a process group of its own, so that a timeout also kills the
+    #programs it starts, like the l*.exe links of Gaussian
+    try:
+        process = subprocess.Popen(cmd, start_new_session=True)
+    except TypeError:
+        #Python 2
+        process = subprocess.Popen(cmd, preexec_fn=os.setsid)
+
+    #polled, since Popen.wait takes no timeout before Python 3.3
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() >= deadline:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            return None
+        time.sleep(0.1)
+    return process.returncode
 
 def extract_one_log(filename):
     try:
@@ -51,14 +138,195 @@ def extract_one_log(filename):
 
     return data
 
-def main(qc_exe):
-    failures = []
-    if not os.path.exists(workdir):
-        os.makedirs(workdir)
-    c = conversion.Converter()
+def parse_one_log(c, logname, element=None):
+    """Parse the basis set data of a single-atom log.
+
+    @param element: symbol of the atom the log should be for, if known
+    @type element : str
+    @return: parsed basis set data, or None, also if it is for another
+    element than the one given
+    @rtype : BasisSetEntry
+    """
+
+    data = extract_one_log(logname)
+
+    if "syntax error" in data:
+        print("Syntax error in log -- misnamed basis set?")
+
+    try:
+        bse = c.parse_multi_from_gaussian_log_file(data)[0]
+    except:
+        return None
+
+    if element is not None and bse.symbol.lower() != element.lower():
+        print("Log {0} has data for {1}, not {2}".format(logname, bse.symbol, element))
+        return None
+    return bse
+
+def parse_batch_log(c, logname, elements):
+    """Parse the basis set data of a log with several atoms, split by
+    element.
+
+    @return: parsed basis set data, or None, for each of elements
+    @rtype : dict
+    """
+
+    data = extract_one_log(logname)
+    try:
+        entries = c.parse_multi_from_gaussian_log_file(data)
+    except:
+        entries = []
+
+    by_symbol = dict((bse.symbol.lower(), bse) for bse in entries)
+    return dict((element, by_symbol.get(element.lower())) for element in elements)
+
+class JobRunner(object):
+    """Run (basis set, element) calculations in a pool of threads and parse
+    their logs on one background thread as they finish.
+
+    The manifest, a JSON file in the work directory, maps each input deck to
+    the status of its last run: "ok", "failed" (non-zero exit) or "timeout".
+    A job is skipped if its log exists and it did not time out; logs not in
+    the manifest, e.g. from runs before there was one, count as finished.
+    """
+
+    def __init__(self, qc_exe, workers=1, timeout=None, workdir=workdir):
+        self.qc_exe = qc_exe
+        self.workers = workers
+        self.timeout = timeout
+        self.workdir = workdir
+        self.manifest_path = os.path.join(workdir, "manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as infile:
+                self.manifest = json.load(infile)
+
+    def record(self, job_file, status, elapsed):
+        with self.lock:
+            self.manifest[os.path.basename(job_file)] = {"status" : status,
+                                                         "elapsed" : elapsed}
+            temp_path = self.manifest_path + ".tmp"
+            with open(temp_path, "w") as outfile:
+                json.dump(self.manifest, outfile, indent=1, sort_keys=True)
+            os.rename(temp_path, self.manifest_path)
+
+    def finished(self, job_file, logname):
+        entry = self.manifest.get(os.path.basename(job_file), {})
+        return entry.get("status") != "timeout" and os.path.exists(logname)
+
+    def run_job(self, job_file, logname):
+        if self.finished(job_file, logname):
+            return
+
+        start = time.time()
+        status = run_one_job(job_file, self.qc_exe, self.timeout)
+        elapsed = time.time() - start
+        if status is None:
+            print("Timed out after {0:.1f}s: {1}".format(elapsed, job_file))
+            #a partial log must not be mistaken for a finished one
+            if os.path.exists(logname):
+                os.remove(logname)
+            self.record(job_file, "timeout", elapsed)
+        else:
+            self.record(job_file, "ok" if status == 0 else "failed", elapsed)
+
+    def run(self, jobs):
+        """Run single-atom jobs and parse their logs.
+
+        @param jobs: (basis set name, element) pairs
+        @type jobs : list
+        @return: parsed basis set data, or None, by (basis, element)
+        @rtype : dict
+        """
+
+        decks = []
+        for basis, element in jobs:
+            decks.append((write_one_job(basis, element, self.workdir),
+                          [(basis, element)]))
+        return self.run_decks(decks)
+
+    def run_batched(self, jobs, batch_size):
+        """Run jobs with up to batch_size elements of a basis set in each
+        deck, then run the elements missing from a deck's results, e.g.
+        because one element made the whole calculation fail, on their own.
+
+        @param jobs: (basis set name, element) pairs
+        @type jobs : list
+        @param batch_size: most elements in one deck
+        @type batch_size : int
+        @return: parsed basis set data, or None, by (basis, element)
+        @rtype : dict
+        """
+
+        c = conversion.Converter()
+        by_basis = {}
+        order = []
+        for basis, element in jobs:
+            if basis not in by_basis:
+                by_basis[basis] = []
+                order.append(basis)
+            by_basis[basis].append(element)
+
+        decks = []
+        for basis in order:
+            elements = by_basis[basis]
+            for start in range(0, len(elements), batch_size):
+                chunk = elements[start:start + batch_size]
+                job_file = write_batch_job(c, basis, chunk, self.workdir)
+                decks.append((job_file, [(basis, element) for element in chunk]))
 
-    elements = [e[0] for e in c.elements[1:106]]
+        parsed = self.run_decks(decks)
+        retry = [job for job in jobs if parsed.get(job) is None]
+        if retry:
+            print("Retrying {0} elements on their own".format(len(retry)))
+            parsed.update(self.run(retry))
+        return parsed
 
+    def run_decks(self, decks):
+        """Run decks, parsing each log in the background as soon as its job
+        is done.
+
+        @param decks: (deck file name, [(basis, element), ...]) pairs
+        @type decks : list
+        @return: parsed basis set data, or None, by (basis, element)
+        @rtype : dict
+        """
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        c = conversion.Converter()
+        parsed = {}
+
+        def parse(jobs, logname):
+            if len(jobs) == 1:
+                parsed[jobs[0]] = parse_one_log(c, logname, jobs[0][1])
+            else:
+                split = parse_batch_log(c, logname, [job[1] for job in jobs])
+                for job in jobs:
+                    parsed[job] = split[job[1]]
+
+        parse_futures = []
+        parse_pool = ThreadPoolExecutor(1)
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                running = {}
+                for job_file, jobs in decks:
+                    logname = job_file.replace(".com", ".log")
+                    future = pool.submit(self.run_job, job_file, logname)
+                    running[future] = (jobs, logname)
+
+                for future in as_completed(running):
+                    future.result()
+                    parse_futures.append(parse_pool.submit(parse, *running[future]))
+            for future in parse_futures:
+                future.result()
+        finally:
+            parse_pool.shutdown()
+
+        return parsed
+
+def basis_set_names():
     #dunning basis sets plus "calendar" variants
     dunnings = ["cc-pVDZ", "cc-pVTZ", "cc-pVQZ", "cc-pV5Z", "cc-pV6Z"]
     calendars = []
@@ -101,40 +369,56 @@ def main(qc_exe):
     basis_names += calendars
     basis_names += ugbs
 
+    return basis_names
+
+def write_gbs(c, basis, entries, workdir=workdir):
+    destination = "{}/{}.gbs".format(workdir, basis)
+    origin = "{} log files".format(basis)
+    for bse in entries:
+        bse.origin = origin
+    combined = c.wrap_g94_to_gbs(entries)
+    with open(destination, "w") as outfile:
+        outfile.write(combined)
+    return destination
+
+def main(qc_exe, workers=1, timeout=None, basis_names=None, elements=None,
+         workdir=workdir, batch_size=1):
+    failures = []
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    c = conversion.Converter()
+
+    if elements is None:
+        elements = [e[0] for e in c.elements[1:106]]
+    if basis_names is None:
+        basis_names = basis_set_names()
+
+    jobs = [(basis, element) for basis in basis_names for element in elements]
+    runner = JobRunner(qc_exe, workers, timeout, workdir)
+    if batch_size > 1:
+        results = runner.run_batched(jobs, batch_size)
+    else:
+        results = runner.run(jobs)
+
     parsed = {}
     for basis in basis_names:
-        parsed[basis] = []
-        for element in elements:
-            job_file = write_one_job(basis, element)
-            logname = job_file.replace(".com", ".log")
-            if not os.path.exists(logname):
-                run_one_job(job_file, qc_exe)
-            data = extract_one_log(logname)
-
-            if "syntax error" in data:
-                print("Syntax error in log -- misnamed basis set?")
-
-            try:
-                pbs = c.parse_multi_from_gaussian_log_file(data)[0]
-                parsed[basis].append(pbs)
-            except:
-                pass
+        parsed[basis] = [results[(basis, element)] for element in elements
+                         if results.get((basis, element)) is not None]
 
         if parsed[basis]:
-            destination = "{}/{}.gbs".format(workdir, basis)
-            origin = "{} log files".format(basis)
-            for bse in parsed[basis]:
-                bse.origin = origin
-            combined = c.wrap_g94_to_gbs(parsed[basis])
-            with open(destination, "w") as outfile:
-                outfile.write(combined)
+            write_gbs(c, basis, parsed[basis], workdir)
         else:
             failures.append(basis)
 
     os.system("rm -f ?au-*")
     if failures:
         print("FAILURES: {}".format(failures))
+    return parsed
 
 if __name__ == '__main__':
-    qc_exe = sys.argv[1]
-    main(qc_exe)
\ No newline at end of file
+    arguments = docopt(__doc__)
+    timeout = arguments["--timeout"]
+    if timeout:
+        timeout = float(timeout)
+    main(arguments["<qc_exe>"], workers=int(arguments["--workers"]),
+         timeout=timeout, batch_size=int(arguments["--batch"]))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    sample_db
+    ~~~~~~~~~~~~~~
+
+    Small databases of the 6-31G* samples, for the tests that need a
+    database without the bundled ones or the network. They are built by
+    build_fixture of benchmarks/fixtures.py.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import build_fixture
+
+def make_db(db_path, fmt="g94", indexes=True):
+    """Make a database holding the 6-31G* sample of a format.
+
+    @param db_path: database to create
+    @type db_path : str
+    @param fmt: short format name, "g94" or "nwchem"
+    @type fmt : str
+    @param indexes: whether to create the indexes, see build_fixture
+    @type indexes : bool
+    """
+
+    build_fixture(db_path, fmt, indexes, names=["6-31G*"])
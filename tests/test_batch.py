@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_batch
+    ~~~~~~~~~~~~~~
+
+    Test running manifests of get_basis_data jobs against a sample database.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from src.EMSL_local import EMSL_local
+from src.batch import group_jobs, read_manifest, run_batch
+from sample_db import make_db
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "test.db")
+
+        make_db(self.db_path, indexes=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as outfile:
+            outfile.write(text)
+        return path
+
+    def expected(self, elements):
+        el = EMSL_local(self.db_path, fmt="g94", debug=False)
+        return "\n\n".join(el.get_basis("6-31G*", elements)) + "\n\n"
+
+    def test_read_manifest(self):
+        jobs = [{"basis" : "6-31G*", "atoms" : ["C", "H"], "format" : "g94",
+                 "output" : "a.gbs"},
+                {"basis" : "6-31G*", "atoms" : "O", "output" : "b.gbs"}]
+        jsonl = self.write("jobs.jsonl", "\n".join(json.dumps(j) for j in jobs) + "\n\n")
+        csv = self.write("jobs.csv", "basis,atoms,format,output\n"
+                                     "6-31G*,C H,g94,a.gbs\n"
+                                     "6-31G*,O,,b.gbs\n")
+
+        for path in (jsonl, csv):
+            read = read_manifest(path)
+            self.assertEqual(["C", "H"], read[0]["atoms"])
+            self.assertEqual("g94", read[0]["format"])
+            self.assertEqual(["O"], read[1]["atoms"])
+            self.assertEqual("gamess-us", read[1]["format"])
+            self.assertEqual(None, read[1]["db_path"])
+
+        bad = self.write("bad.csv", "basis,atoms\n6-31G*,C\n")
+        self.assertRaises(ValueError, read_manifest, bad)
+
+    def test_group_jobs(self):
+        job = {"basis" : "6-31G*", "atoms" : ["C", "H"], "format" : "g94",
+               "db_path" : self.db_path, "convert_from" : "", "output" : "a"}
+        jobs = [job, dict(job), dict(job, output="b"), dict(job, atoms=["O"]),
+                dict(job, format="nwchem")]
+
+        groups = group_jobs(jobs)
+        self.assertEqual(2, len(groups))
+        g94 = groups[("g94", self.db_path)]
+        self.assertEqual(["a", "b"], g94[("6-31G*", ("C", "H"), "")])
+        self.assertEqual(["a"], g94[("6-31G*", ("O",), "")])
+
+    def test_run_batch(self):
+        lines = []
+        for i in range(20):
+            lines.append("6-31G*,C H,g94,{0},out/ch{1}.gbs".format(self.db_path, i))
+        lines.append("6-31G*,O,g94,{0},out/o.gbs".format(self.db_path))
+        lines.append("6-31G*,U,g94,{0},out/u.gbs".format(self.db_path))
+        lines.append("6-31G*,H,molpro,,out/molpro.gbs")
+        manifest = self.write("jobs.csv", "basis,atoms,format,db_path,output\n" +
+                              "\n".join(lines) + "\n")
+        outdir = os.path.join(self.tmpdir, "results")
+
+        for workers in (0, 3):
+            report = run_batch(read_manifest(manifest), outdir, workers)
+            self.assertEqual(23, report["jobs"])
+            self.assertEqual(4, report["requests"])
+            self.assertEqual(21, report["written"])
+            self.assertEqual(["out/molpro.gbs", "out/u.gbs"],
+                             sorted(output for output, error in report["failed"]))
+
+            with open(os.path.join(outdir, "out", "ch7.gbs")) as infile:
+                self.assertEqual(self.expected(["C", "H"]), infile.read())
+            with open(os.path.join(outdir, "out", "o.gbs")) as infile:
+                self.assertEqual(self.expected(["O"]), infile.read())
+            shutil.rmtree(outdir)
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(BatchTestCase, name = test_name)
+
+    else:
+        result = runSuite(BatchTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_benchmarks
+    ~~~~~~~~~~~~~~
+
+    Test that the read path benchmarks run and compare against a baseline.
+"""
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import read_paths
+import storage
+from fixtures import build_fixture
+
+class BenchmarksTestCase(unittest.TestCase):
+    def test_run_and_compare(self):
+        report = read_paths.run(runs=1)
+
+        names = set(report["results"])
+        for n in read_paths.element_counts:
+            self.assertIn("get_available_basis_sets[{0}]".format(n), names)
+        self.assertIn("get_basis[sqlite,nwchem]", names)
+        self.assertIn("get_basis[g94 files]", names)
+        self.assertIn("convert_from_format[nwchem->gamess-us]", names)
+        self.assertEqual(3, len([n for n in names if n.startswith("parse_multi_g94[UGBS")]))
+        self.assertEqual("samples", report["databases"])
+        self.assertIn("sqlite", report["machine"])
+
+        baseline = copy.deepcopy(report)
+        slow = "get_available_elements"
+        report["results"][slow]["median"] = 2 * baseline["results"][slow]["median"]
+        rows = read_paths.compare(report, baseline, tolerance=0.5)
+        self.assertEqual(len(names), len(rows))
+        self.assertEqual([slow], [row[0] for row in rows if row[4]])
+
+    def test_run_optimize(self):
+        before, after, optimized = read_paths.run_optimize(runs=1)
+
+        self.assertEqual(set(before["results"]), set(after["results"]))
+        for fmt in optimized:
+            self.assertIn("data_tab_elt_basis", optimized[fmt]["added"])
+            self.assertEqual(4096, optimized[fmt]["page_size"])
+
+    def test_storage(self):
+        db_dir = tempfile.mkdtemp()
+        try:
+            build_fixture(os.path.join(db_dir, "Gaussian94.db"), "g94")
+            report = storage.run(runs=1, db_dir=db_dir)
+        finally:
+            shutil.rmtree(db_dir)
+
+        self.assertEqual(["text", "text+dedup", "zlib", "zlib+dedup", "zlib-dict",
+                          "zlib-dict+dedup"], sorted(report))
+        self.assertTrue(report["zlib"]["data_bytes"] < report["text"]["data_bytes"])
+        self.assertEqual(set(report["text"]["results"]), set(report["zlib-dict+dedup"]["results"]))
+        self.assertEqual(report["text"]["dedup"]["blocks"], report["zlib+dedup"]["dedup"]["in_block_tab"])
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(BenchmarksTestCase, name = test_name)
+
+    else:
+        result = runSuite(BenchmarksTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
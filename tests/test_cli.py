@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_cli
+    ~~~~~~~~~~~~~~
+
+    Test the EMSL_api.py command line against a small sample database.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from src.formats import format_dict
+from sample_db import make_db
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(root, "scripts", "EMSL_api.py")
+
+class CLITestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "test.db")
+
+        make_db(self.db_path, indexes=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_api(self, *args):
+        """Run EMSL_api.py, returning (stdout, modules imported)."""
+
+        env = dict(os.environ, PYTHONPATH=root)
+        process = subprocess.Popen([sys.executable, "-X", "importtime",
+                                    script] + list(args),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env)
+        out, err = process.communicate()
+        self.assertEqual(0, process.returncode, err)
+
+        #-X importtime lines end with "| <indentation><module name>"
+        modules = set()
+        for line in err.decode("utf-8").splitlines():
+            if line.startswith("import time:") and "|" in line:
+                modules.add(line.rsplit("|", 1)[1].strip())
+        return out.decode("utf-8"), modules
+
+    def test_list_atoms_startup(self):
+        out, modules = self.run_api("list_atoms", "--basis=6-31G*",
+                                    "--format=g94",
+                                    "--db_path=" + self.db_path)
+        self.assertEqual("H, He, Li", out.split(", Be")[0])
+        self.assertNotIn("requests", modules)
+        self.assertNotIn("hashlib", modules)
+
+    def test_sql_trace(self):
+        env = dict(os.environ, PYTHONPATH=root, EBSEL_SQL_TRACE="1")
+        process = subprocess.Popen([sys.executable, script, "list_atoms",
+                                    "--basis=6-31G*", "--format=g94",
+                                    "--db_path=" + self.db_path],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env)
+        out, err = process.communicate()
+        self.assertEqual(0, process.returncode, err)
+        err = err.decode("utf-8")
+
+        #each query as it runs, with its plan, then the session summary
+        self.assertIn("WHERE norm_name='6-31g*'", err)
+        self.assertIn("SCAN data_tab", err)
+        self.assertIn("Full scans:", err)
+        self.assertIn("1 queries", err)
+        self.assertIn("Slowest queries:", err)
+        self.assertEqual("H, He, Li", out.decode("utf-8").split(", Be")[0])
+
+    def test_search(self):
+        out, modules = self.run_api("search", "6-31", "--atom=Zn",
+                                    "--format=g94",
+                                    "--db_path=" + self.db_path)
+        self.assertEqual("1 - '6-31G*' || Pople", out.strip())
+
+    def test_optimize_compression(self):
+        before, modules = self.run_api("get_basis_data", "--basis=6-31G*",
+                                       "--atom=C", "--format=g94",
+                                       "--db_path=" + self.db_path)
+        out, modules = self.run_api("optimize", "--format=g94",
+                                    "--compression=zlib",
+                                    "--db_path=" + self.db_path)
+        self.assertIn("compressed 30 blocks", out)
+        self.assertIn("30 of 30 blocks are distinct; storing each once would save 0 bytes", out)
+        after, modules = self.run_api("get_basis_data", "--basis=6-31G*",
+                                      "--atom=C", "--format=g94",
+                                      "--db_path=" + self.db_path)
+        self.assertEqual(before, after)
+
+    def test_list_formats(self):
+        out, modules = self.run_api("list_formats")
+        self.assertEqual(sorted(format_dict), sorted(out.split()))
+        self.assertNotIn("requests", modules)
+
+    def test_unknown_format(self):
+        env = dict(os.environ, PYTHONPATH=root)
+        process = subprocess.Popen([sys.executable, script, "list_basis",
+                                    "--format=nope"],
+                                   stdout=subprocess.PIPE, env=env)
+        out, err = process.communicate()
+        self.assertEqual(1, process.returncode)
+        self.assertIn("Format nope doesn't exist", out.decode("utf-8"))
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(CLITestCase, name = test_name)
+
+    else:
+        result = runSuite(CLITestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
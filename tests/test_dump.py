@@ -0,0 +1,767 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_dump
+    ~~~~~~~~~~~~~~
+
+    Test building basis set databases from a local stand-in for the EMSL BSE.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from src.EMSL_dump import EMSL_dump, MultiFormatBuild, dedup_report, fill_archive, new_dbs, optimize_db, rebuild_from_archive
+from src.EMSL_local import EMSL_local
+from src.archive import ResponseArchive
+from src.metrics import BuildMetrics
+
+if sys.version_info.major == 3:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+#(format, basis set name) -> sample response replayed by the server
+samples = {("Gaussian94", "6-31G*") : "tests/samples/gaussian94-6-31Gs.html",
+           ("Gaussian94", "DZVP (DFT Orbital)") : "tests/samples/gaussian94-dzvp.html",
+           ("GAMESS-US", "6-31G*") : "tests/samples/gamess-us-6-31Gs.html",
+           ("NWChem", "6-31G*") : "tests/samples/nwchem-6-31Gs.html",
+           ("NWChem", "B2 basis set for Zn") : "tests/samples/nwchem-B2_basis_set_for_Zn.html",
+           ("NWChem", "LANL2DZ ECP") : "tests/samples/nwchem-lanl2dz-ecp.html"}
+
+pople_elements = "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn".split()
+dzvp_elements = pople_elements + "Ga Ge As Se Br Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe".split()
+
+catalog_line = """basisSets[{0}] = new basisSet("{1}", "{2}", "orbital", "[{3}]", "{4}", "false", "false", "{6}", "N/A", "N/A", "{5}");"""
+
+def make_catalog(entries):
+    """Make a stand-in for the BSE catalog page from
+    (xml path, name, elements, status, description[, last modified])
+    entries.
+    """
+
+    lines = ["<script>"]
+    for i, entry in enumerate(entries):
+        path, name, elements, status, description = entry[:5]
+        modified = "Thu, 15 Jul 2010 19:30:23 GMT"
+        if len(entry) > 5:
+            modified = entry[5]
+        lines.append(catalog_line.format(i, path, name, ", ".join(elements),
+                                         status, description, modified))
+    lines.append("</script>")
+    return "\n".join(lines)
+
+gaussian94_catalog = make_catalog([
+    ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople"),
+    ("/files/dzvp.xml", "DZVP (DFT Orbital)", dzvp_elements, "published", "DZVP"),
+    ("/files/6-31Gss.xml", "6-31G**", pople_elements, "rejected", "Pople"),
+    ("/files/missing.xml", "missing", ["H"], "published", "N/A")])
+
+class SampleHandler(BaseHTTPRequestHandler):
+    """Replay a sample BSE download chosen by the format and bsname query
+    parameters. Keeps connections alive like the real server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlsplit(self.path).path == EMSL_dump.list_path:
+            with self.server.lock:
+                self.server.catalog_requests += 1
+            self.reply(200, self.server.catalog.encode("utf-8"))
+            return
+
+        query = parse_qs(urlsplit(self.path).query)
+        key = (query.get("format", [""])[0], query.get("bsname", [""])[0])
+
+        with self.server.lock:
+            self.server.seen.append((self.client_address, key))
+            failures = self.server.failures.get(key, 0)
+            if failures:
+                self.server.failures[key] = failures - 1
+
+        if failures:
+            self.reply(503, b"busy")
+        elif key in samples:
+            with open(samples[key], "rb") as infile:
+                self.reply(200, infile.read())
+        else:
+            self.reply(404, b"no such basis set")
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class SampleServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), SampleHandler)
+        self.lock = threading.Lock()
+        self.seen = []
+        self.failures = {}
+        self.catalog = gaussian94_catalog
+        self.catalog_requests = 0
+
+    @property
+    def url_root(self):
+        return "http://127.0.0.1:{0}".format(self.server_address[1])
+
+class DumpTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = SampleServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "test.db")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_dump(self, fmt="Gaussian94", **kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        return EMSL_dump(self.db_path, format=fmt, debug=False,
+                         url_root=self.server.url_root, **kwargs)
+
+    def query(self, sql, params=[]):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return rows
+
+    def test_create_sql_concurrent(self):
+        #several workers fill the database from the stand-in server
+        ed = self.make_dump(num_workers=3)
+        basis_list = [["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                      ["DZVP (DFT Orbital)", "/files/dzvp.xml", "DZVP", dzvp_elements]]
+        ed.create_sql(basis_list)
+
+        names = self.query("SELECT name FROM basis_tab ORDER BY name")
+        self.assertEqual([("6-31G*",), ("DZVP (DFT Orbital)",)], names)
+
+        rows = self.query("SELECT elt, max_am, n_shells, n_primitives FROM output_tab WHERE name=? AND elt=?", ["6-31G*", "Cl"])
+        self.assertEqual([("Cl", 2, 5, 17)], rows)
+
+    def test_retry_after_server_errors(self):
+        #transient server errors are retried until the download succeeds
+        self.server.failures[("Gaussian94", "6-31G*")] = 2
+        ed = self.make_dump(num_workers=1)
+        ed.create_sql([["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements]])
+
+        attempts = [s for s in self.server.seen if s[1] == ("Gaussian94", "6-31G*")]
+        self.assertEqual(3, len(attempts))
+        rows = self.query("SELECT COUNT(*) FROM output_tab WHERE name=?", ["6-31G*"])
+        self.assertEqual([(len(pople_elements),)], rows)
+
+    def test_failed_basis_skipped(self):
+        #a basis set that never downloads is skipped after max_attempts
+        ed = self.make_dump(num_workers=2, max_attempts=3)
+        ed.create_sql([["missing", "/files/missing.xml", "N/A", ["H"]],
+                       ["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements]])
+
+        attempts = [s for s in self.server.seen if s[1] == ("Gaussian94", "missing")]
+        self.assertEqual(3, len(attempts))
+        names = self.query("SELECT name FROM basis_tab")
+        self.assertEqual([("6-31G*",)], names)
+
+    def test_new_db_asyncio(self):
+        #the asyncio pipeline builds the database from the catalog page,
+        #skipping rejected and undownloadable basis sets
+        ed = self.make_dump(pipeline="asyncio", num_workers=2, max_pending=1,
+                            max_attempts=2)
+        ed.new_db()
+
+        names = self.query("SELECT name FROM basis_tab ORDER BY name")
+        self.assertEqual([("6-31G*",), ("DZVP (DFT Orbital)",)], names)
+        rows = self.query("SELECT COUNT(*) FROM output_tab WHERE name=?", ["6-31G*"])
+        self.assertEqual([(len(pople_elements),)], rows)
+
+    def test_create_sql_async_batches(self):
+        #the asyncio pipeline retries failed downloads and reports failures
+        from src.pipeline import AsyncBuild
+
+        self.server.failures[("Gaussian94", "6-31G*")] = 1
+        ed = self.make_dump(num_workers=2, max_attempts=2)
+        basis_list = [["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                      ["missing", "/files/missing.xml", "N/A", ["H"]],
+                      ["DZVP (DFT Orbital)", "/files/dzvp.xml", "DZVP", dzvp_elements]]
+        failed = AsyncBuild(ed, max_pending=2, batch_size=2).run(basis_list)
+
+        self.assertEqual(["missing"], failed)
+        names = self.query("SELECT name FROM basis_tab ORDER BY name")
+        self.assertEqual([("6-31G*",), ("DZVP (DFT Orbital)",)], names)
+
+    def test_create_sql_async_write_error(self):
+        #an error in the writer cancels the downloads and is raised
+        from src.pipeline import AsyncBuild
+
+        def store_basis(c, entry, result, error):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        ed = self.make_dump(num_workers=1, max_attempts=1)
+        ed.store_basis = store_basis
+        basis_list = [["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                      ["DZVP (DFT Orbital)", "/files/dzvp.xml", "DZVP", dzvp_elements],
+                      ["missing", "/files/missing.xml", "N/A", ["H"]]]
+        build = AsyncBuild(ed, max_pending=1, batch_size=1)
+        self.assertRaises(sqlite3.OperationalError, build.run, basis_list)
+        #no download starts before the one ahead of it has been written
+        self.assertEqual(1, len([s for s in self.server.seen if s[1][1]]))
+
+    def test_resume(self):
+        #a resumed build skips checkpointed basis sets and retries failures
+        ed = self.make_dump(num_workers=2, max_attempts=2)
+        failed = ed.create_sql([["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                                ["missing", "/files/missing.xml", "N/A", ["H"]]])
+        self.assertEqual(["missing"], failed)
+        self.assertEqual([("6-31G*",)], self.query("SELECT name FROM checkpoint_tab"))
+        self.assertEqual([("missing", "/files/missing.xml", 2)],
+                         self.query("SELECT name, xml_path, attempts FROM failure_tab"))
+
+        #without resume, an existing database is not touched
+        self.assertRaises(sqlite3.OperationalError, ed.create_sql, [])
+
+        del self.server.seen[:]
+        ed = self.make_dump(pipeline="asyncio", num_workers=2, max_attempts=2,
+                            resume=True)
+        ed.new_db()
+
+        requested = set([s[1][1] for s in self.server.seen if s[1][1]])
+        self.assertEqual(set(["DZVP (DFT Orbital)", "missing"]), requested)
+        names = self.query("SELECT name FROM checkpoint_tab ORDER BY name")
+        self.assertEqual([("6-31G*",), ("DZVP (DFT Orbital)",)], names)
+        self.assertEqual([("missing", 4)],
+                         self.query("SELECT name, attempts FROM failure_tab"))
+
+        #finally, skip what is known to fail
+        del self.server.seen[:]
+        ed = self.make_dump(resume=True, skip_failed=True)
+        self.assertEqual([], ed.new_db())
+        requested = [s for s in self.server.seen if s[1][1]]
+        self.assertEqual([], requested)
+
+    def test_bulk_load(self):
+        #bulk loads batch basis sets per transaction, then index, analyze
+        #and leave a single database file behind
+        for pipeline in ["threads", "asyncio"]:
+            ed = self.make_dump(num_workers=2, bulk_load=True, batch_size=2,
+                                max_attempts=1, pipeline=pipeline)
+            ed.new_db()
+
+            expected_rows = self.query("SELECT (SELECT COUNT(*) FROM basis_tab) + (SELECT COUNT(*) FROM data_tab)")[0][0]
+            self.assertEqual(2, ed.build_report["basis_sets"])
+            self.assertEqual(expected_rows, ed.build_report["rows"])
+            self.assertTrue(ed.build_report["rows_per_second"] > 0)
+
+            indexes = self.query("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='data_tab' ORDER BY name")
+            self.assertEqual([("data_tab_basis_elt",), ("data_tab_elt_basis",)], indexes)
+            self.assertTrue(self.query("SELECT COUNT(*) FROM sqlite_stat1")[0][0] > 0)
+            self.assertEqual([("delete",)], self.query("PRAGMA journal_mode"))
+            self.assertFalse(os.path.exists(self.db_path + "-wal"))
+            os.remove(self.db_path)
+
+    def test_archive_record_replay(self):
+        #a build records responses that parsed; an offline build replays
+        #them without any requests reaching the server
+        archive = ResponseArchive(os.path.join(self.tmpdir, "archive"))
+        ed = self.make_dump(archive=archive, max_attempts=1)
+        ed.new_db()
+        recorded = self.query("SELECT name, elt, data FROM output_tab ORDER BY name, elt")
+
+        #catalog page plus two parsed basis sets
+        self.assertEqual(3, archive.stats()["requests"])
+        self.assertEqual(3, archive.stats()["objects"])
+
+        os.remove(self.db_path)
+        nb_seen = len(self.server.seen)
+        ed = self.make_dump(archive=archive.root, offline=True, max_attempts=1)
+        self.assertEqual(["missing"], ed.new_db())
+        self.assertEqual(nb_seen, len(self.server.seen))
+        replayed = self.query("SELECT name, elt, data FROM output_tab ORDER BY name, elt")
+        self.assertEqual(recorded, replayed)
+
+    def test_archive_online_refresh(self):
+        #online, the catalog is always fetched again and only downloads of
+        #unchanged catalog entries are replayed
+        archive = ResponseArchive(os.path.join(self.tmpdir, "archive"))
+        self.make_dump(archive=archive, max_attempts=1).new_db()
+
+        self.server.catalog = make_catalog([
+            ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople",
+             "Fri, 16 Jul 2010 10:00:00 GMT"),
+            ("/files/dzvp.xml", "DZVP (DFT Orbital)", dzvp_elements, "published", "DZVP")])
+        os.remove(self.db_path)
+        del self.server.seen[:]
+        catalog_requests = self.server.catalog_requests
+        self.assertEqual([], self.make_dump(archive=archive, max_attempts=1).new_db())
+
+        self.assertEqual(catalog_requests + 1, self.server.catalog_requests)
+        self.assertEqual(["6-31G*"], [s[1][1] for s in self.server.seen])
+        self.assertEqual([("Fri, 16 Jul 2010 10:00:00 GMT",)],
+                         self.query("SELECT modified FROM basis_tab WHERE name=?", ["6-31G*"]))
+
+    def test_update_db(self):
+        #an update downloads only new and modified basis sets, replaces
+        #modified ones in place and drops those gone from the catalog
+        self.server.catalog = make_catalog([
+            ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople"),
+            ("/files/missing.xml", "missing", ["H"], "published", "N/A")])
+        self.make_dump(max_attempts=1).new_db()
+        basis_id = self.query("SELECT basis_id FROM basis_tab WHERE name=?", ["6-31G*"])
+        self.assertEqual([("/files/6-31Gs.xml", "Thu, 15 Jul 2010 19:30:23 GMT", "N/A")],
+                         self.query("SELECT xml_path, modified, contributor FROM basis_tab"))
+
+        self.server.catalog = make_catalog([
+            ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople v2",
+             "Fri, 16 Jul 2010 10:00:00 GMT"),
+            ("/files/dzvp.xml", "DZVP (DFT Orbital)", dzvp_elements, "published", "DZVP")])
+        del self.server.seen[:]
+        self.assertEqual([], self.make_dump(max_attempts=1).update_db())
+
+        requested = sorted([s[1][1] for s in self.server.seen])
+        self.assertEqual(["6-31G*", "DZVP (DFT Orbital)"], requested)
+        self.assertEqual(basis_id, self.query("SELECT basis_id FROM basis_tab WHERE name=?", ["6-31G*"]))
+        self.assertEqual([("Pople v2", "Fri, 16 Jul 2010 10:00:00 GMT")],
+                         self.query("SELECT description, modified FROM basis_tab WHERE name=?", ["6-31G*"]))
+        rows = self.query("SELECT COUNT(*) FROM output_tab WHERE name=?", ["6-31G*"])
+        self.assertEqual([(len(pople_elements),)], rows)
+        names = self.query("SELECT name, norm_name FROM basis_tab ORDER BY name")
+        self.assertEqual([("6-31G*", "6-31g*"), ("DZVP (DFT Orbital)", "dzvp (dft orbital)")],
+                         names)
+
+        #nothing changed, nothing downloaded
+        del self.server.seen[:]
+        self.make_dump(update=True, pipeline="asyncio").new_db()
+        self.assertEqual([], self.server.seen)
+
+    def test_update_db_archive(self):
+        #an update through an archive sees the current catalog and
+        #downloads modified basis sets again instead of replaying them
+        archive = ResponseArchive(os.path.join(self.tmpdir, "archive"))
+        self.make_dump(archive=archive, max_attempts=1).new_db()
+
+        self.server.catalog = make_catalog([
+            ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople v2",
+             "Fri, 16 Jul 2010 10:00:00 GMT"),
+            ("/files/dzvp.xml", "DZVP (DFT Orbital)", dzvp_elements, "published", "DZVP")])
+        del self.server.seen[:]
+        for pipeline in ["threads", "asyncio"]:
+            self.assertEqual([], self.make_dump(archive=archive, max_attempts=1,
+                                                pipeline=pipeline).update_db())
+            self.assertEqual([("Pople v2", "Fri, 16 Jul 2010 10:00:00 GMT")],
+                             self.query("SELECT description, modified FROM basis_tab WHERE name=?", ["6-31G*"]))
+        self.assertEqual(["6-31G*"], [s[1][1] for s in self.server.seen])
+
+        #offline, the archived catalog is up to date as well
+        del self.server.seen[:]
+        self.make_dump(archive=archive, offline=True, update=True).new_db()
+        self.assertEqual([], self.server.seen)
+        self.assertEqual([("6-31G*",), ("DZVP (DFT Orbital)",)],
+                         self.query("SELECT name FROM basis_tab ORDER BY name"))
+
+    def test_upgrade_norm_name(self):
+        #updating a database built before norm_name existed fills it in and
+        #adds it to output_tab
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""CREATE TABLE basis_tab(basis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name text, description text, xml_path text,
+                        modified text, contributor text, UNIQUE(name))""")
+        conn.execute("""CREATE TABLE data_tab(basis_id INTEGER, elt TEXT, data TEXT,
+                        max_am INTEGER, n_shells INTEGER, n_primitives INTEGER)""")
+        conn.execute("""CREATE VIEW output_tab AS SELECT basis_id, name, description,
+                        elt, data, max_am, n_shells, n_primitives
+                        FROM basis_tab NATURAL JOIN data_tab""")
+        conn.execute("INSERT INTO basis_tab(name, description) VALUES ('DZVP  (DFT Orbital)', 'DZVP')")
+        conn.execute("INSERT INTO data_tab VALUES (1, 'H', 'data', 0, 1, 1)")
+        conn.commit()
+
+        ed = self.make_dump(update=True)
+        ed.create_tables(conn.cursor())
+        conn.commit()
+        rows = conn.execute("SELECT norm_name, elt FROM output_tab").fetchall()
+        conn.close()
+        self.assertEqual([("dzvp (dft orbital)", "H")], rows)
+
+    def test_optimize_db(self):
+        #a database without indexes gets them in place, and keeps its data
+        self.make_dump(max_attempts=1).new_db()
+        conn = sqlite3.connect(self.db_path)
+        for index in ["data_tab_basis_elt", "data_tab_elt_basis", "basis_tab_norm_name"]:
+            conn.execute("DROP INDEX " + index)
+        conn.execute("DROP TABLE search_tab")
+        conn.commit()
+        conn.close()
+        rows = self.query("SELECT name, elt, data FROM output_tab ORDER BY name, elt")
+
+        result = optimize_db(self.db_path, "g94", page_size=8192)
+        self.assertEqual(["basis_tab_norm_name", "data_tab_basis_elt",
+                          "data_tab_elt_basis", "search_tab"], result["added"])
+        self.assertEqual(8192, result["page_size"])
+        self.assertEqual(8192, self.query("PRAGMA page_size")[0][0])
+        self.assertEqual(rows, self.query("SELECT name, elt, data FROM output_tab ORDER BY name, elt"))
+        self.assertTrue(self.query("SELECT COUNT(*) FROM sqlite_stat1")[0][0] > 0)
+        plan = self.query("EXPLAIN QUERY PLAN SELECT basis_id FROM data_tab WHERE elt=?", ["H"])
+        self.assertIn("COVERING INDEX data_tab_elt_basis", plan[0][-1])
+
+        self.assertEqual([], optimize_db(self.db_path, "g94")["added"])
+        self.assertEqual(4096, self.query("PRAGMA page_size")[0][0])
+
+    def test_compression(self):
+        #each mode compresses every block, and lookups read them back
+        self.make_dump(max_attempts=1).new_db()
+        expected = EMSL_local(self.db_path, fmt="g94", debug=False).get_basis("6-31G*")
+
+        for mode in ["zlib", "zlib-dict"]:
+            self.db_path = os.path.join(self.tmpdir, mode + ".db")
+            self.make_dump(max_attempts=1, compression=mode).new_db()
+            self.assertEqual([("blob",)], self.query("SELECT DISTINCT typeof(data) FROM data_tab"))
+            el = EMSL_local(self.db_path, fmt="g94", debug=False)
+            self.assertEqual(expected, el.get_basis("6-31G*"))
+            self.assertEqual(30, len(el.get_shell_stats("6-31G*")))
+
+        #the dictionary is trained once, then used for updates
+        dictionaries = self.query("SELECT dict_id FROM codec_tab")
+        self.assertEqual(1, len(dictionaries))
+        self.server.catalog = make_catalog([
+            ("/files/6-31Gs.xml", "6-31G*", pople_elements, "published", "Pople"),
+            ("/files/dzvp.xml", "DZVP (DFT Orbital)", dzvp_elements, "published", "DZVP")])
+        ed = self.make_dump(max_attempts=1, compression="zlib-dict")
+        self.assertEqual([], ed.update_db())
+        self.assertEqual(dictionaries, self.query("SELECT dict_id FROM codec_tab"))
+        self.assertEqual([("blob",)], self.query("SELECT DISTINCT typeof(data) FROM data_tab"))
+
+        self.assertRaises(ValueError, self.make_dump, compression="lzma")
+
+    def test_dedup(self):
+        #identical blocks are stored once, and dropped with the last basis
+        #set that refers to them
+        ed = self.make_dump(dedup=True, compression="zlib")
+        with open("tests/samples/gaussian94-6-31Gs.html") as infile:
+            name, des, pairs = ed.extract(infile.read(), "6-31G*", "Pople", [])
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        ed.create_tables(c)
+        ed.insert_basis(c, name, des, pairs)
+        ed.insert_basis(c, "6-31G* copy", des, pairs)
+        conn.commit()
+
+        self.assertEqual([(30,)], self.query("SELECT COUNT(*) FROM block_tab"))
+        self.assertEqual([(None, 60)], self.query("SELECT DISTINCT data, COUNT(*) FROM data_tab"))
+        el = EMSL_local(self.db_path, fmt="g94", debug=False)
+        self.assertEqual(el.get_basis("6-31G*"), el.get_basis("6-31G* copy"))
+        report = dedup_report(self.db_path)
+        self.assertEqual((60, 30, 60), (report["blocks"], report["unique_blocks"],
+                                        report["in_block_tab"]))
+        self.assertEqual(0.5, report["saved_fraction"])
+
+        for basis_id, name, count in [(2, "6-31G* copy", 30), (1, "6-31G*", 0)]:
+            ed.delete_basis(c, basis_id, name)
+            conn.commit()
+            ed.finish_build(conn)
+            self.assertEqual([(count,)], self.query("SELECT COUNT(*) FROM block_tab"))
+        conn.close()
+
+    def test_dedup_collision(self):
+        #a block whose hash is taken by a different block is kept inline,
+        #both when inserted and when an existing database is deduplicated
+        module = sys.modules[EMSL_dump.__module__]
+        block_hash = module.block_hash
+        module.block_hash = lambda text: 1
+        try:
+            for dedup in [True, False]:
+                if os.path.exists(self.db_path):
+                    os.remove(self.db_path)
+                ed = self.make_dump(dedup=dedup, compression="zlib")
+                with open("tests/samples/gaussian94-6-31Gs.html") as infile:
+                    name, des, pairs = ed.extract(infile.read(), "6-31G*", "Pople", [])
+                conn = sqlite3.connect(self.db_path)
+                c = conn.cursor()
+                ed.create_tables(c)
+                ed.insert_basis(c, name, des, pairs)
+                ed.insert_basis(c, "6-31G* copy", des, pairs[:1])
+                conn.commit()
+                conn.close()
+                if not dedup:
+                    self.assertEqual(2, optimize_db(self.db_path, "g94", dedup=True)["deduplicated"])
+
+                self.assertEqual([(1,)], self.query("SELECT COUNT(*) FROM block_tab"))
+                self.assertEqual([(2,)], self.query("SELECT COUNT(*) FROM data_tab WHERE block_hash=1"))
+                el = EMSL_local(self.db_path, fmt="g94", debug=False)
+                self.assertEqual(len(pairs), len(el.get_basis(name)))
+                self.assertEqual(el.get_basis(name, [pairs[0][0]]),
+                                 el.get_basis("6-31G* copy"))
+                for elt, text in pairs:
+                    self.assertIn(text, el.get_basis(name, [elt])[0])
+        finally:
+            module.block_hash = block_hash
+
+    def test_archive_content_addressed(self):
+        #identical responses to different requests are stored once
+        archive = ResponseArchive(os.path.join(self.tmpdir, "archive"))
+        archive.put("http://a/", {"x" : "1", "y" : "2"}, u"same text")
+        archive.put("http://b/", None, u"same text")
+
+        self.assertEqual(u"same text", archive.get("http://a/", {"y" : "2", "x" : "1"}))
+        self.assertEqual(None, archive.get("http://a/", {"x" : "1"}))
+        self.assertEqual(2, archive.stats()["requests"])
+        self.assertEqual(1, archive.stats()["objects"])
+
+    def test_new_dbs_write_error(self):
+        #a failing writer does not stop the other formats, and its error is
+        #raised once every download has finished
+        def store_basis(c, entry, result, error):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        db_paths = {"g94" : os.path.join(self.tmpdir, "g94.db"),
+                    "gamess-us" : os.path.join(self.tmpdir, "gamess-us.db")}
+        build = MultiFormatBuild(db_paths, url_root=self.server.url_root,
+                                 debug=False, backoff=0.01, max_attempts=1,
+                                 num_workers=1)
+        build.dumps[0][1].store_basis = store_basis
+        self.assertRaises(sqlite3.OperationalError, build.run)
+
+        conn = sqlite3.connect(db_paths["gamess-us"])
+        names = [r[0] for r in conn.execute("SELECT name FROM basis_tab")]
+        conn.close()
+        self.assertEqual(["6-31G*"], names)
+
+    def test_rebuild_from_archive(self):
+        #one pass fills the archive for several formats, after which their
+        #databases are rebuilt in parallel without the network
+        archive_path = os.path.join(self.tmpdir, "archive")
+        options = {"url_root" : self.server.url_root, "debug" : False,
+                   "backoff" : 0.01, "max_attempts" : 1}
+        failed = fill_archive(archive_path, formats=["g94", "gamess-us"],
+                              **options)
+        self.assertEqual(["missing"], failed["g94"])
+        self.assertEqual(["DZVP (DFT Orbital)", "missing"], sorted(failed["gamess-us"]))
+
+        nb_seen = len(self.server.seen)
+        db_paths = {"g94" : os.path.join(self.tmpdir, "g94.db"),
+                    "gamess-us" : os.path.join(self.tmpdir, "gamess-us.db")}
+        rebuild_from_archive(archive_path, db_paths, **options)
+        self.assertEqual(nb_seen, len(self.server.seen))
+
+        for fmt, expected in [("g94", ["6-31G*", "DZVP (DFT Orbital)"]),
+                              ("gamess-us", ["6-31G*"])]:
+            conn = sqlite3.connect(db_paths[fmt])
+            names = [r[0] for r in conn.execute("SELECT name FROM checkpoint_tab ORDER BY name")]
+            conn.close()
+            self.assertEqual(expected, names)
+
+    def test_new_dbs(self):
+        #several formats are built in one pass from a single catalog
+        #download, through one shared connection pool
+        db_paths = {"g94" : os.path.join(self.tmpdir, "g94.db"),
+                    "gamess-us" : os.path.join(self.tmpdir, "gamess-us.db")}
+        failed = new_dbs(db_paths, url_root=self.server.url_root, debug=False,
+                         backoff=0.01, max_attempts=1, num_workers=2)
+
+        self.assertEqual(1, self.server.catalog_requests)
+        self.assertEqual(["missing"], failed["g94"])
+        self.assertEqual(["DZVP (DFT Orbital)", "missing"], sorted(failed["gamess-us"]))
+        self.assertTrue(len(set([s[0] for s in self.server.seen])) <= 2)
+
+        for fmt, expected in [("g94", ["6-31G*", "DZVP (DFT Orbital)"]),
+                              ("gamess-us", ["6-31G*"])]:
+            conn = sqlite3.connect(db_paths[fmt])
+            names = [r[0] for r in conn.execute("SELECT name FROM basis_tab ORDER BY name")]
+            rows = conn.execute("SELECT max_am, n_shells, n_primitives FROM output_tab WHERE name=? AND elt=?", ["6-31G*", "Cl"]).fetchall()
+            conn.close()
+            self.assertEqual(expected, names)
+            self.assertEqual([(2, 5, 17)], rows)
+
+    def test_parse_catalog(self):
+        #catalog lines are tokenized, not evaluated; duplicate names get a
+        #suffix and unknown elements are dropped
+        catalog = make_catalog([
+            ("/files/a.xml", "A", ["H", "Uuu"], "published", "it\\'s   A"),
+            ("/files/a2.xml", "A", ["He"], "published", "second A"),
+            ("/files/b-ecp.xml", "B", ["Zn"], "published", "ECP")])
+        ed = self.make_dump()
+        date = "Thu, 15 Jul 2010 19:30:23 GMT"
+        expected = [["A", "/files/a.xml", "it's A", ["H"], date, "N/A"],
+                    ["A-number2", "/files/a2.xml", "second A", ["He"], date, "N/A"],
+                    ["B", "/files/b-ecp.xml", "ECP", ["Zn"], date, "N/A"]]
+        self.assertEqual(expected, ed.parse_catalog(catalog))
+        self.assertEqual(expected[:2], ed.bl_raw_to_array(catalog))
+
+        evil = """x = new basisSet(__import__("os").getcwd());"""
+        self.assertRaises(ValueError, ed.parse_catalog, evil)
+
+    def test_parsed_catalog_cached(self):
+        #a parsed catalog is kept in the archive under the page hash
+        archive = ResponseArchive(os.path.join(self.tmpdir, "archive"))
+        catalog = make_catalog([("/files/c.xml", "C", ["H"], "published", "C")])
+        self.make_dump(archive=archive).parse_catalog(catalog)
+        EMSL_dump.catalog_cache.clear()
+
+        digest = hashlib.sha256(catalog.encode("utf-8")).hexdigest() + "-2"
+        archive.save_parsed(digest, [["cached", "/files/c.xml", "C", ["H"], "", ""]])
+        names = [e[0] for e in self.make_dump(archive=archive).parse_catalog(catalog)]
+        self.assertEqual(["cached"], names)
+        EMSL_dump.catalog_cache.clear()
+
+    def test_parse_workers(self):
+        #extraction in worker processes gives the same database as
+        #extraction in the downloading threads
+        basis_list = [["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                      ["missing", "/files/missing.xml", "N/A", ["H"]],
+                      ["DZVP (DFT Orbital)", "/files/dzvp.xml", "DZVP", dzvp_elements]]
+        sql = "SELECT name, elt, data, max_am FROM output_tab ORDER BY name, elt"
+
+        self.make_dump(max_attempts=1).create_sql(basis_list)
+        expected = self.query(sql)
+        os.remove(self.db_path)
+
+        for pipeline in ["threads", "asyncio"]:
+            ed = self.make_dump(max_attempts=1, parse_workers=2)
+            if pipeline == "asyncio":
+                failed = ed.create_sql_async(basis_list)
+            else:
+                failed = ed.create_sql(basis_list)
+            self.assertEqual(["missing"], failed)
+            self.assertEqual(None, ed.parse_pool)
+            self.assertEqual(expected, self.query(sql))
+            os.remove(self.db_path)
+
+    def test_metrics(self):
+        #builds count and time every stage, and report snapshots to a
+        #callback and a JSON-lines log
+        snapshots = []
+        log_path = os.path.join(self.tmpdir, "metrics.jsonl")
+        metrics = BuildMetrics(callback=snapshots.append, log_path=log_path,
+                               interval=0)
+        self.server.failures[("Gaussian94", "6-31G*")] = 1
+        ed = self.make_dump(num_workers=2, max_attempts=2, verbose=False,
+                            metrics=metrics)
+        ed.create_sql([["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                       ["missing", "/files/missing.xml", "N/A", ["H"]]])
+
+        final = ed.build_report["metrics"]
+        self.assertTrue(final["final"])
+        counters = final["counters"]
+        self.assertEqual(1, counters["fetched"])
+        self.assertEqual(1, counters["parsed"])
+        self.assertEqual(1, counters["inserted"])
+        self.assertEqual(1 + len(pople_elements), counters["rows"])
+        self.assertEqual(1, counters["failed"])
+        self.assertEqual(2, counters["retried"])
+        with open(samples[("Gaussian94", "6-31G*")], "rb") as infile:
+            self.assertEqual(len(infile.read()), counters["bytes_fetched"])
+        for stage in ["fetch", "parse", "insert"]:
+            self.assertEqual(1, final["latency"][stage]["count"])
+        self.assertTrue("insert" in final["queues"])
+
+        self.assertEqual(final, snapshots[-1])
+        with open(log_path) as infile:
+            logged = [json.loads(line) for line in infile]
+        self.assertEqual(len(snapshots), len(logged))
+        self.assertEqual(counters, logged[-1]["counters"])
+
+    def test_quiet(self):
+        #a quiet build prints no progress of its own
+        if sys.version_info.major == 3:
+            from io import StringIO
+        else:
+            from StringIO import StringIO
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.make_dump(max_attempts=1, verbose=False).new_db()
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertFalse("Download all" in printed)
+        self.assertFalse("will be downloaded" in printed)
+
+    def test_keep_alive(self):
+        #a single worker reuses one pooled connection for every download
+        ed = self.make_dump(num_workers=1)
+        ed.create_sql([["6-31G*", "/files/6-31Gs.xml", "Pople", pople_elements],
+                       ["DZVP (DFT Orbital)", "/files/dzvp.xml", "DZVP", dzvp_elements]])
+
+        self.assertEqual(2, len(self.server.seen))
+        connections = set([s[0] for s in self.server.seen])
+        self.assertEqual(1, len(connections))
+
+    def test_rate_limit(self):
+        #requests to one host are spaced out by the rate limit
+        ed = self.make_dump(num_workers=4, rate_limit=20.0)
+        url = self.server.url_root + "/anything"
+        start = time.time()
+        for i in range(5):
+            ed.fetch(url, params={"format" : "Gaussian94", "bsname" : "6-31G*"})
+        elapsed = time.time() - start
+        self.assertTrue(elapsed >= 4 / 20.0 * 0.9)
+
+    def test_backoff_delay(self):
+        #retry delays grow exponentially with jitter but stay bounded
+        ed = self.make_dump(backoff=0.5, max_backoff=4.0)
+        for attempt in range(20):
+            delay = ed.backoff_delay(attempt)
+            expected = min(4.0, 0.5 * 2 ** attempt)
+            self.assertTrue(expected / 2.0 <= delay <= expected)
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try: 
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+            
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+    
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+        
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(DumpTestCase, name = test_name)
+
+    else:
+        result = runSuite(DumpTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
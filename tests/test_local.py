@@ -9,16 +9,25 @@
     Test data export functions
 """
 
+import os
+import shutil
+import sqlite3
 import sys
+import tempfile
+import threading
 import unittest
+from src.EMSL_dump import EMSL_dump, dedup_report, optimize_db
 from src.EMSL_local import EMSL_local
+from src.compression import compress_block, decompress_block, train_dictionary
+from src.metrics import LookupMetrics
+from sample_db import make_db
 
 class LocalTestCase(unittest.TestCase):
     def setUp(self):
-        pass
+        self.tmpdir = tempfile.mkdtemp()
 
     def tearDown(self):
-        pass
+        shutil.rmtree(self.tmpdir)
 
     def test_gamess_us_am_pass(self):
         #GAMESS-US angular momentum check passes for max am <= G
@@ -62,6 +71,52 @@ class LocalTestCase(unittest.TestCase):
         self.assertFalse(el.am_too_large)
         self.assertEqual("L", el.max_am)
 
+    def test_get_shell_stats(self):
+        #per-element shell statistics are looked up, not recomputed
+        el = EMSL_local(fmt="g94", debug=False)
+        stats = el.get_shell_stats("6-31G*", ["He", "Cl"])
+        stats = dict([(s[0], s[1:]) for s in stats])
+        self.assertEqual({"He" : (0, 2, 4), "Cl" : (2, 5, 17)}, stats)
+
+    def test_am_from_fetched_data(self):
+        #max_am comes along with the data, so no second query is needed
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+        el = EMSL_local(db_path, fmt="g94", metrics=LookupMetrics())
+        el.get_basis("6-31G*", ["He", "Cl"])
+        self.assertEqual("D", el.max_am)
+        self.assertFalse(el.am_too_large)
+        self.assertEqual(1, el.stats()["counters"]["queries"])
+
+        #databases built before the max_am column are scanned
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP VIEW output_tab")
+        conn.execute("""CREATE VIEW output_tab AS
+                        SELECT basis_id, name, description, elt, data, norm_name
+                        FROM basis_tab NATURAL JOIN data_tab""")
+        conn.commit()
+        conn.close()
+        el = EMSL_local(db_path, fmt="g94")
+        el.get_basis("6-31G*", ["He"])
+        self.assertEqual("S", el.max_am)
+        el.get_basis("6-31G*", ["He", "Cl"])
+        self.assertEqual("D", el.max_am)
+
+    def test_am_check_per_thread(self):
+        #the check's result is returned, so lookups in other threads on a
+        #shared EMSL_local cannot change what one thread sees
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        self.assertEqual(("D", False), el.get_max_am("6-31G*", ["He", "Cl"]))
+        self.assertEqual(("S", False), el.get_max_am("6-31G*", ["He"]))
+        el.get_basis("6-31G*", ["He"])
+
+        thread = threading.Thread(target=el.get_basis, args=("6-31G*", ["Cl"]))
+        thread.start()
+        thread.join()
+        self.assertEqual("S", el.max_am)
+
     def test_cartesian_or_spherical(self):
         #most basis sets treated as using spherical (pure) functions, while
         #a few older ones are treated as using cartesians
@@ -210,6 +265,178 @@ class LocalTestCase(unittest.TestCase):
         result = el.get_basis("g3mp2large", elements=elements)
         self.assertTrue("BASIS SET reformatted" in result[0])
 
+    def test_lookup_metrics(self):
+        #per-stage timings and counters, on a database of the NWChem sample
+        db_path = os.path.join(self.tmpdir, "NWChem.db")
+        make_db(db_path, "nwchem")
+
+        el = EMSL_local(db_path, fmt="nwchem")
+        self.assertEqual(None, el.stats())
+
+        el = EMSL_local(db_path, fmt="nwchem", metrics=LookupMetrics())
+        el.get_basis("6-31G*", ["H", "C"])
+        el.get_available_basis_sets(["H", "C"])
+        el.get_basis("g3mp2large", ["H"])
+
+        stats = el.stats()
+        stages = stats["stages"]
+        self.assertEqual(2, stages["get_basis"]["calls"])
+        self.assertEqual(1, stages["get_available_basis_sets"]["calls"])
+        #a query for the data, one for the element filtered listing and
+        #one missing g3mp2large
+        self.assertEqual(3, stages["sql"]["calls"])
+        self.assertEqual(1, stages["am_check"]["calls"])
+        self.assertEqual(1, stages["wrap"]["calls"])
+        self.assertEqual(1, stages["decode"]["calls"])
+        self.assertEqual(1, stages["convert"]["calls"])
+        self.assertTrue(stages["fs_parse"]["calls"] >= 1)
+        self.assertTrue(stages["get_basis"]["total"] >= stages["convert"]["total"])
+        self.assertEqual(1, stats["counters"]["fs_fallbacks"])
+        self.assertEqual(3, stats["counters"]["queries"])
+
+
+    def test_sql_trace(self):
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+
+        el = EMSL_local(db_path, fmt="g94", debug=False, trace=False)
+        self.assertEqual(None, el.trace)
+
+        el = EMSL_local(db_path, fmt="g94", debug=False, trace=True)
+        el.get_available_elements("6-31g*")
+        el.get_basis("6-31G*", ["H", "C"])
+
+        elements, fetched = el.trace.queries
+        #parameters are bound into the statement as run
+        self.assertIn("norm_name='6-31g*'", elements["sql"])
+        self.assertEqual(["6-31g*"], elements["params"])
+        self.assertEqual(30, elements["rows"])
+        self.assertEqual(2, fetched["rows"])
+        self.assertTrue(fetched["plan"])
+        self.assertTrue(fetched["seconds"] > 0)
+
+        summary = el.trace.summary(n=1)
+        self.assertIn("2 queries", summary)
+        self.assertEqual(1, summary.count("\n--"))
+
+    def test_name_aliases(self):
+        #any case, runs of whitespace and aliases from aliases.dat, from
+        #a file and added by hand all find a basis set with one index search
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+        alias_path = os.path.join(self.tmpdir, "aliases.txt")
+        with open(alias_path, "w") as outfile:
+            outfile.write("#site aliases\npople-d = 6-31G*\n")
+
+        el = EMSL_local(db_path, fmt="g94", debug=False, trace=True,
+                        aliases=alias_path)
+        el.add_alias("my basis", "6-31G*")
+        expected = el.get_basis("6-31G*", ["H", "C"])
+        for name in ["6-31g*", " 6-31G* ", "6-31G(d)", "6-31g(D)",
+                     "Pople-D", "MY  BASIS"]:
+            self.assertEqual(expected, el.get_basis(name, ["H", "C"]))
+            self.assertEqual(30, len(el.get_available_elements(name)))
+        self.assertEqual([], el.get_available_elements("6-31G(3df)"))
+
+        plan = "\n".join(el.trace.queries[0]["plan"])
+        self.assertIn("SEARCH basis_tab USING COVERING INDEX basis_tab_norm_name", plan)
+        self.assertEqual([], [q for q in el.trace.queries if q["full_scans"]])
+
+        #databases without norm_name are searched by name
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP VIEW output_tab")
+        conn.execute("DROP INDEX basis_tab_norm_name")
+        conn.execute("ALTER TABLE basis_tab DROP COLUMN norm_name")
+        conn.execute("""CREATE VIEW output_tab AS
+                        SELECT basis_id, name, description, elt, data, max_am,
+                               n_shells, n_primitives
+                        FROM basis_tab NATURAL JOIN data_tab""")
+        conn.commit()
+        conn.close()
+
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        self.assertEqual(2, len(el.get_basis("6-31G(d)", ["H", "C"])))
+        self.assertEqual(30, len(el.get_available_elements("6-31g(D)")))
+        self.assertFalse(el.normalized)
+
+    def test_compressed_data(self):
+        db_path = os.path.join(self.tmpdir, "NWChem.db")
+        make_db(db_path, "nwchem")
+        el = EMSL_local(db_path, fmt="nwchem", debug=False)
+        expected = el.get_basis("6-31G*", ["H", "C"])
+
+        #compressed in place, with a dictionary of the shared lines
+        self.assertEqual(30, optimize_db(db_path, "nwchem", compression="zlib-dict")["compressed"])
+        el = EMSL_local(db_path, fmt="nwchem", debug=True, metrics=LookupMetrics())
+        self.assertEqual(expected, el.get_basis("6-31G*", ["H", "C"]))
+        self.assertEqual(1, el.stats()["stages"]["decompress"]["calls"])
+
+        blocks = ["C    S\n  0.1  0.2\n", "H    S\n  0.1  0.2\n", "Li"]
+        dictionary = train_dictionary(blocks)
+        self.assertEqual(b"  0.1  0.2\n", dictionary)
+        self.assertRaises(ValueError, decompress_block,
+                          compress_block(blocks[0], dictionary), {})
+        self.assertEqual(blocks[2], decompress_block(blocks[2]))
+
+    def test_dedup_data(self):
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+        ed = EMSL_dump(db_path, format="Gaussian94", debug=False)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT elt, data FROM data_tab").fetchall()
+        ed.insert_basis(conn.cursor(), "6-31G* copy", "Pople", rows)
+        conn.commit()
+        conn.close()
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        expected = el.get_basis("6-31G*", ["H", "C"])
+
+        self.assertEqual(0.5, dedup_report(db_path)["saved_fraction"])
+        result = optimize_db(db_path, "g94", compression="zlib", dedup=True)
+        self.assertEqual((60, 30), (result["deduplicated"], result["compressed"]))
+        report = dedup_report(db_path)
+        self.assertEqual((60, 30, 60), (report["blocks"], report["unique_blocks"],
+                                        report["in_block_tab"]))
+
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        self.assertEqual(expected, el.get_basis("6-31G*", ["H", "C"]))
+        self.assertEqual(expected, el.get_basis("6-31G* copy", ["H", "C"]))
+        self.assertEqual(30, len(el.get_available_elements("6-31G* copy")))
+
+    def test_search(self):
+        db_path = os.path.join(self.tmpdir, "Gaussian94.db")
+        make_db(db_path, "g94")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""INSERT INTO basis_tab(name, norm_name, description)
+                        VALUES ('6-31G', '6-31g', 'VDZ Valence Double Zeta: 2 Funct.''s/Valence AO'),
+                               ('6-311G', '6-311g', 'VTZ Valence Triple Zeta: 3 Funct.''s/Valence AO'),
+                               ('cc-pVTZ', 'cc-pvtz', 'VTZ2P Valence Triple Zeta + Polarization on All Atoms')""")
+        conn.execute("INSERT INTO search_tab(search_tab) VALUES('rebuild')")
+        conn.commit()
+        conn.close()
+
+        el = EMSL_local(db_path, fmt="g94", debug=False, trace=True)
+        #every word must start a word of the name or description
+        self.assertEqual(["6-311G", "cc-pVTZ"],
+                         sorted([r[0] for r in el.search("valence trip")]))
+        self.assertEqual(["cc-pVTZ"], [r[0] for r in el.search("triple zeta polar")])
+        #an exact name, or an alias of one, comes first
+        self.assertEqual("6-31G", el.search("6-31G")[0][0])
+        self.assertEqual(("6-31G*", "Pople"), el.search("6-31g(d)")[0])
+        self.assertEqual(1, len(el.search("6-31G", limit=1)))
+        self.assertEqual([("6-31G*", "Pople")], el.search("31G", elements=["H", "Zn"]))
+        self.assertEqual([], el.search("quadruple"))
+        self.assertEqual([], el.search(" * "))
+        self.assertIn("search_tab VIRTUAL TABLE", "\n".join(el.trace.queries[0]["plan"]))
+
+        #without the full-text index, LIKE finds the same basis sets
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP TABLE search_tab")
+        conn.commit()
+        conn.close()
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        self.assertEqual(["6-311G", "cc-pVTZ"],
+                         [r[0] for r in el.search("valence triple")])
+        self.assertEqual("6-31G", el.search("6-31G")[0][0])
 
 def runSuite(cls, verbosity=2, name=None):
     """Run a unit test suite and return status code.
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_logs
+    ~~~~~~~~~~~~~~
+
+    Test scripts/basis_data_from_logs.py with a stand-in for the quantum
+    chemistry program that writes a canned log.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if sys.version_info.major == 3:
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("basis_data_from_logs",
+                                                  "scripts/basis_data_from_logs.py")
+    logs = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(logs)
+else:
+    import imp
+    logs = imp.load_source("basis_data_from_logs", "scripts/basis_data_from_logs.py")
+
+#writes the canned log next to the deck and notes the run; decks for
+#lithium hang, for testing timeouts
+stand_in = """#!{python}
+import os, shutil, sys, time
+deck = sys.argv[1]
+with open(os.path.join(os.path.dirname(deck), "runs.txt"), "a") as outfile:
+    outfile.write(os.path.basename(deck) + "\\n")
+log = deck.replace(".com", ".log")
+if "Li " in open(deck).read():
+    open(log, "w").write("partial")
+    time.sleep(30)
+shutil.copy({sample!r}, log)
+"""
+
+#starts a program that writes the log later, like the links of Gaussian
+forks_stand_in = """#!{python}
+import subprocess, sys
+script = "import time; time.sleep(2); open(%r, 'w').write('late')" % sys.argv[1]
+subprocess.call([sys.executable, "-c", script])
+"""
+
+class LogsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.qc_exe = os.path.join(self.tmpdir, "fake-g03")
+        with open(self.qc_exe, "w") as outfile:
+            outfile.write(stand_in.format(python=sys.executable,
+                                          sample=os.path.abspath("tests/samples/test01-g03.log")))
+        os.chmod(self.qc_exe, os.stat(self.qc_exe).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def runs(self):
+        path = os.path.join(self.tmpdir, "runs.txt")
+        if not os.path.exists(path):
+            return []
+        with open(path) as infile:
+            return sorted(infile.read().split())
+
+    def test_run_jobs(self):
+        basis_names = ["STO-3G", "3-21G"]
+        elements = ["H", "He", "C", "Li"]
+
+        start = time.time()
+        parsed = logs.main(self.qc_exe, workers=4, timeout=2,
+                           basis_names=basis_names, elements=elements,
+                           workdir=self.tmpdir)
+        self.assertTrue(time.time() - start < 20)
+
+        #every log is the same methane run, whose first element is hydrogen,
+        #so only the hydrogen jobs give data
+        for basis in basis_names:
+            self.assertEqual(["H"], [p.symbol for p in parsed[basis]])
+            self.assertTrue(os.path.exists(os.path.join(self.tmpdir, basis + ".gbs")))
+        self.assertEqual(8, len(self.runs()))
+
+        with open(os.path.join(self.tmpdir, "manifest.json")) as infile:
+            manifest = json.load(infile)
+        self.assertEqual("timeout", manifest["STO-3G__Li.com"]["status"])
+        self.assertEqual("ok", manifest["3-21G__H.com"]["status"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "STO-3G__Li.log")))
+
+        #a restart only repeats the jobs that timed out; logs that are not
+        #in the manifest count as finished
+        os.remove(os.path.join(self.tmpdir, "runs.txt"))
+        del manifest["3-21G__He.com"]
+        with open(os.path.join(self.tmpdir, "manifest.json"), "w") as outfile:
+            json.dump(manifest, outfile)
+
+        parsed = logs.main(self.qc_exe, workers=4, timeout=1,
+                           basis_names=basis_names, elements=elements,
+                           workdir=self.tmpdir)
+        self.assertEqual(["3-21G__Li.com", "STO-3G__Li.com"], self.runs())
+        self.assertEqual(["H"], [p.symbol for p in parsed["3-21G"]])
+
+    def test_timeout_kills_children(self):
+        #programs started by the one that timed out are killed with it
+        forks = os.path.join(self.tmpdir, "forks")
+        with open(forks, "w") as outfile:
+            outfile.write(forks_stand_in.format(python=sys.executable))
+        os.chmod(forks, os.stat(forks).st_mode | stat.S_IEXEC)
+        log = os.path.join(self.tmpdir, "job.log")
+
+        self.assertEqual(None, logs.run_one_job(log, forks, timeout=0.5))
+        time.sleep(3)
+        self.assertFalse(os.path.exists(log))
+
+    def test_batched(self):
+        basis_names = ["STO-3G", "3-21G"]
+        elements = ["H", "C", "He"]
+
+        parsed = logs.main(self.qc_exe, workers=2, basis_names=basis_names,
+                           elements=elements, workdir=self.tmpdir,
+                           batch_size=3)
+
+        #the methane log has H and C, so only He is retried on its own, and
+        #the methane data of the retry is not taken for helium
+        self.assertEqual(["3-21G__H-He.com", "3-21G__He.com",
+                          "STO-3G__H-He.com", "STO-3G__He.com"], self.runs())
+        for basis in basis_names:
+            self.assertEqual(["H", "C"], [p.symbol for p in parsed[basis]])
+
+        with open(os.path.join(self.tmpdir, "STO-3G__H-He.com")) as infile:
+            deck = infile.read()
+        lines = deck.split("\n")
+        self.assertEqual("0 2", lines[4])
+        self.assertEqual(["He", "100.00000", "0.00000", "0.00000"], lines[7].split())
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(LogsTestCase, name = test_name)
+
+    else:
+        result = runSuite(LogsTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
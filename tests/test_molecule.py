@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_molecule
+    ~~~~~~~~~~~~~~
+
+    Test reading the elements of XYZ, SDF and PDB geometries, and fetching
+    basis data for them.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from src.EMSL_local import EMSL_local
+from src.molecule import element_symbol, read_elements
+from sample_db import make_db
+
+water_xyz = """3
+water
+O   0.000000   0.000000   0.117300
+H   0.000000   0.757200  -0.469200
+H   0.000000  -0.757200  -0.469200
+"""
+
+#two frames; the second uses atomic numbers
+methanol_xyz = """6
+methanol, frame 1
+C   -0.046   0.663   0.000
+O   -0.046  -0.755   0.000
+H   -1.086   0.975   0.000
+H    0.439   1.084   0.884
+H    0.439   1.084  -0.884
+H    0.862  -1.060   0.000
+2
+frame 2, chlorine as an atomic number
+17   0.0   0.0   0.0
+1    0.0   0.0   1.3
+"""
+
+methane_sdf = """methane
+  ebsel
+
+  2  1  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    0.6291    0.6291    0.6291 H   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0  0  0  0
+M  END
+$$$$
+sodium chloride
+  ebsel
+
+  2  0  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 Na  0  3  0  0  0  0  0  0  0  0  0  0
+    2.3600    0.0000    0.0000 Cl  0  5  0  0  0  0  0  0  0  0  0  0
+M  CHG  2   1   1   2  -1
+M  END
+$$$$
+"""
+
+#the last two records lack the element columns
+fragment_pdb = """HEADER    FRAGMENT
+ATOM      1  N   GLY A   1      -0.966   0.493   1.500  1.00  0.00           N
+ATOM      2  CA  GLY A   1       0.257   0.418   0.692  1.00  0.00           C
+ATOM      3  SG  CYS A   2       1.200   1.300   0.100  1.00  0.00           S
+HETATM    4 ZN    ZN A   3       2.000   2.000   2.000  1.00  0.00          ZN
+HETATM    5  O   HOH A   4       3.000   3.000   3.000  1.00  0.00
+HETATM    6 CA    CA A   5       4.000   4.000   4.000  1.00  0.00
+END
+"""
+
+class MoleculeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as outfile:
+            outfile.write(text)
+        return path
+
+    def test_element_symbol(self):
+        self.assertEqual("Cl", element_symbol("CL"))
+        self.assertEqual("Cl", element_symbol("Cl2"))
+        self.assertEqual("C", element_symbol("C12"))
+        self.assertEqual("C", element_symbol("6"))
+        self.assertRaises(ValueError, element_symbol, "Xx")
+        self.assertRaises(ValueError, element_symbol, "200")
+
+    def test_xyz(self):
+        self.assertEqual(["O", "H"], read_elements(self.write("water.xyz", water_xyz)))
+        self.assertEqual(["C", "O", "H", "Cl"],
+                         read_elements(self.write("methanol.xyz", methanol_xyz)))
+
+    def test_sdf(self):
+        self.assertEqual(["C", "H", "Na", "Cl"],
+                         read_elements(self.write("methane.sdf", methane_sdf)))
+
+    def test_truncated(self):
+        #a file that ends before its last atom is an error, not a shorter
+        #molecule
+        for name, text in [("water.xyz", water_xyz),
+                           ("methane.sdf", methane_sdf)]:
+            lines = text.split("\n")
+            path = self.write(name, "\n".join(lines[:3]) + "\n")
+            self.assertRaises(ValueError, read_elements, path)
+            path = self.write(name, "\n".join(lines[:4]) + "\n")
+            self.assertRaises(ValueError, read_elements, path)
+
+    def test_pdb(self):
+        self.assertEqual(["N", "C", "S", "Zn", "O", "Ca"],
+                         read_elements(self.write("fragment.pdb", fragment_pdb)))
+
+    def test_coordinates(self):
+        self.assertEqual(["O", "H"], read_elements(water_xyz))
+        self.assertEqual(["H", "C"], read_elements([("H", 0, 0, 0), ("C", 1, 0, 0),
+                                                    ("H", 2, 0, 0)]))
+        self.assertEqual(["Cl", "H"], read_elements(["Cl 0 0 0", "H 1.3 0 0"]))
+        self.assertEqual(["Cl"], read_elements("Cl 0 0 0"))
+        self.assertRaises(ValueError, read_elements, self.write("water.txt", water_xyz))
+
+    def test_get_basis_for_molecule(self):
+        db_path = os.path.join(self.tmpdir, "test.db")
+        make_db(db_path, indexes=False)
+
+        el = EMSL_local(db_path, fmt="g94", debug=False)
+        path = self.write("water.xyz", water_xyz)
+        self.assertEqual(el.get_basis("6-31G*", ["O", "H"]),
+                         el.get_basis_for_molecule("6-31G*", path))
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(MoleculeTestCase, name = test_name)
+
+    else:
+        result = runSuite(MoleculeTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()
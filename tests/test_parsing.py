@@ -13,6 +13,7 @@ import json
 import sys
 import unittest
 from src.EMSL_dump import EMSL_dump
+from src.EMSL_local import shell_stats
 
 class ParserTestCase(unittest.TestCase):
     def setUp(self):
@@ -157,6 +158,20 @@ He    S
         self.assertEqual("He", parsed[1][0])
         self.assertEqual(helium, parsed[1][1])
 
+    def test_gamess_us_misspelled_element(self):
+        #the PHOSPHOROUS fix-up must not shift the $DATA region
+        ed = EMSL_dump(None, format="GAMESS-US", debug=False)
+        elements = "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn".split()
+        with open("tests/samples/gamess-us-6-31Gs.html") as infile:
+            text = infile.read().replace("PHOSPHORUS", "PHOSPHOROUS")
+
+        parser_method = ed.extraction_map[ed.format]
+        name, description, parsed = parser_method(text, "6-31G*", "", elements)
+        self.assertEqual(len(elements), len(parsed))
+        self.assertEqual("P", parsed[14][0])
+        self.assertTrue(parsed[14][1].startswith("PHOSPHORUS"))
+        self.assertTrue(parsed[-1][1].startswith("ZINC"))
+
     def test_gaussian94_basic(self):
         #extract basis set data from a popular Pople basis set
         helium = """He     0 \nS   3   1.00\n     38.4216340              0.0237660        \n      5.7780300              0.1546790        \n      1.2417740              0.4696300        \nS   1   1.00\n      0.2979640              1.0000000        """
@@ -196,6 +211,30 @@ He    S
         self.assertEqual("He", parsed[1][0])
         self.assertEqual(helium, parsed[1][1])
 
+    def test_shell_stats_gaussian94_gamess_us(self):
+        #shell statistics computed at ingest time agree between formats,
+        #counting Gaussian94 SP and GAMESS-US L shells as P
+        elements = "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn".split()
+        name = "6-31G*"
+        description = "6-31G* Split Valence + Polarization Basis"
+        samples = [("Gaussian94", "g94", "tests/samples/gaussian94-6-31Gs.html"),
+                   ("GAMESS-US", "gamess-us", "tests/samples/gamess-us-6-31Gs.html")]
+
+        for dump_format, local_format, sample in samples:
+            ed = EMSL_dump(None, format=dump_format, debug=False)
+            with open(sample) as infile:
+                text = infile.read()
+
+            parser_method = ed.extraction_map[ed.format]
+            parsed = parser_method(text, name, description, elements)[2]
+            stats_fn = ed.get_shell_stats_fn()
+            self.assertEqual(shell_stats[local_format], stats_fn)
+
+            #He: 2 S shells, 3 + 1 primitives
+            self.assertEqual((0, 2, 4), stats_fn(parsed[1][1]))
+            #Cl: S, 3 SP, D shells, 6 + 6 + 3 + 1 + 1 primitives
+            self.assertEqual((2, 5, 17), stats_fn(parsed[16][1]))
+
 def runSuite(cls, verbosity=2, name=None):
     """Run a unit test suite and return status code.
 
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 mode:python; tab-width:4; indent-tabs-mode:nil; py-indent-offset:4 -*-
+##
+
+"""
+    test_server
+    ~~~~~~~~~~~~~~
+
+    Test the basis set server on localhost against a small sample database.
+"""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from src.server import BasisService, make_server
+from sample_db import make_db
+
+if sys.version_info.major == 3:
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+    from urllib.parse import quote
+else:
+    from urllib2 import HTTPError, urlopen
+    from urllib import quote
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "test.db")
+
+        make_db(self.db_path, indexes=False)
+
+        self.service = BasisService({"g94" : self.db_path})
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, **options):
+        server = make_server(self.service, port=0, verbose=False, **options)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+        return server
+
+    def get(self, path):
+        url = "http://127.0.0.1:{0}{1}".format(self.port, path)
+        response = urlopen(url)
+        try:
+            return response.read().decode("utf-8")
+        finally:
+            response.close()
+
+    def test_endpoints(self):
+        self.port = self.start().server_address[1]
+        basis = quote("6-31G*")
+
+        elements = json.loads(self.get("/list_atoms?format=g94&basis=" + basis))
+        self.assertEqual(["H", "He", "Li"], elements[:3])
+        self.assertEqual(", ".join(elements),
+                         self.get("/list_atoms?format=g94&output=text&basis=" + basis))
+
+        names = json.loads(self.get("/list_basis?format=g94&atom=C&atom=H"))
+        self.assertEqual([{"name" : "6-31G*", "description" : "Pople"}], names)
+        self.assertEqual([], json.loads(self.get("/list_basis?format=g94&atom=U")))
+
+        blocks = json.loads(self.get("/get_basis_data?format=g94&atom=O&basis=" + basis))
+        self.assertEqual(1, len(blocks))
+        self.assertIn("O     0", blocks[0])
+        text = self.get("/get_basis_data?format=g94&atom=O&output=text&basis=" + basis)
+        self.assertEqual(blocks[0] + "\n", text)
+
+        self.assertIn("g94", json.loads(self.get("/list_formats")))
+
+    def test_errors(self):
+        self.port = self.start().server_address[1]
+
+        for path, status in [("/nope", 404),
+                             ("/list_atoms?format=g94", 400),
+                             ("/list_atoms?format=molpro&basis=STO-3G", 400),
+                             ("/get_basis_data?format=g94&basis=missing", 400)]:
+            try:
+                self.get(path)
+                self.fail(path)
+            except HTTPError as e:
+                self.assertEqual(status, e.code, path)
+                self.assertIn("error", json.loads(e.read().decode("utf-8")))
+
+    def test_concurrent_cached(self):
+        self.port = self.start(workers=4).server_address[1]
+        path = "/list_atoms?format=g94&basis=" + quote("6-31G*")
+        results = []
+
+        def client():
+            for i in range(5):
+                results.append(self.get(path))
+
+        threads = [threading.Thread(target=client) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(40, len(results))
+        self.assertEqual(1, len(set(results)))
+        stats = json.loads(self.get("/stats"))
+        self.assertEqual(1, stats["cached"])
+        self.assertEqual(["g94"], stats["formats"])
+        self.assertEqual(40, stats["hits"] + stats["misses"])
+        self.assertTrue(stats["hits"] >= 32)
+
+    def test_idle_keep_alive(self):
+        #an idle keep-alive connection gives back the only worker soon
+        #after its reply instead of holding it for the request timeout
+        self.port = self.start(workers=1, idle_timeout=0.2).server_address[1]
+        idle = socket.create_connection(("127.0.0.1", self.port))
+        idle.sendall(b"GET /list_formats HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        reply = idle.recv(4096)
+
+        start = time.time()
+        self.assertIn("g94", json.loads(self.get("/list_formats")))
+        self.assertTrue(time.time() - start < 5)
+
+        #the rest of the reply, then the end of the closed connection
+        idle.settimeout(5)
+        chunk = idle.recv(4096)
+        while chunk:
+            reply += chunk
+            chunk = idle.recv(4096)
+        idle.close()
+        self.assertIn(b" 200 ", reply)
+        self.assertIn(b"g94", reply)
+
+    def test_unix_socket(self):
+        path = os.path.join(self.tmpdir, "ebsel.sock")
+        self.start(socket_path=path)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        client.sendall(b"GET /list_atoms?format=g94&output=text&basis=6-31G%2A HTTP/1.0\r\n\r\n")
+        reply = b""
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+        client.close()
+
+        head, body = reply.decode("utf-8").split("\r\n\r\n", 1)
+        self.assertIn(" 200 ", head.split("\r\n")[0])
+        self.assertTrue(body.startswith("H, He, Li"))
+
+def runSuite(cls, verbosity=2, name=None):
+    """Run a unit test suite and return status code.
+
+    @param cls: class that the suite should be constructed from
+    @type cls : class
+    @param verbosity: verbosity level to pass to test runner
+    @type verbosity : int
+    @param name: name of a specific test in the suite to run
+    @type name : str
+    @return: unit test run status code
+    @rtype : int
+    """
+    try:
+        if name:
+            suite = unittest.makeSuite(cls, name)
+        else:
+            suite = unittest.makeSuite(cls)
+
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+
+    except SystemExit:
+        pass
+
+def runTests():
+    try:
+        test_name = sys.argv[1]
+
+    except IndexError:
+        test_name = None
+
+    if test_name:
+        result = runSuite(ServerTestCase, name = test_name)
+
+    else:
+        result = runSuite(ServerTestCase)
+
+    return result
+
+if __name__ == '__main__':
+    runTests()